@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the RAG pipeline. Run with `python -m app.benchmark --help` from backend/.
+"""
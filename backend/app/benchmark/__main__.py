@@ -0,0 +1,78 @@
+import argparse
+import json
+import logging
+import sys
+
+from app.benchmark.harness import (
+    RESULTS_PATH,
+    BenchmarkConfig,
+    compare,
+    load_results,
+    previous_result,
+    run_benchmark,
+    save_result,
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline ingest/retrieval benchmark with deterministic fake models.")
+    parser.add_argument("--corpus", choices=["synthetic", "pdf"], default="synthetic")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000], help="Synthetic corpus sizes, e.g. 10000 100000 1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Fake embedding latency per request")
+    parser.add_argument("--embed-per-text-latency-ms", type=float, default=0.0, help="Fake embedding latency per text")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Fake LLM latency per answer")
+    parser.add_argument("--answer-queries", type=int, default=20, help="Queries also timed end to end with the fake LLM")
+    parser.add_argument("--embed-batch-size", type=int, default=BenchmarkConfig.embed_batch_size)
+    parser.add_argument("--embed-concurrency", type=int, default=BenchmarkConfig.embed_concurrency)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--vector-backend", choices=["chroma", "quantized"], default="chroma")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON-lines file results are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Do not append results")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if a run regressed against the previous comparable run")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary Chroma/index directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    history = load_results(args.results)
+    sizes = args.chunks if args.corpus == "synthetic" else [0]
+    regressed = False
+    for size in sizes:
+        config = BenchmarkConfig(
+            corpus=args.corpus,
+            num_chunks=size,
+            num_queries=args.queries,
+            k=args.k,
+            dimension=args.dimension,
+            embed_latency_ms=args.embed_latency_ms,
+            embed_per_text_latency_ms=args.embed_per_text_latency_ms,
+            llm_latency_ms=args.llm_latency_ms,
+            answer_queries=args.answer_queries,
+            embed_batch_size=args.embed_batch_size,
+            embed_concurrency=args.embed_concurrency,
+            seed=args.seed,
+            vector_backend=args.vector_backend,
+        )
+        result = run_benchmark(config, keep_dir=args.keep)
+        print(json.dumps(result, indent=2))
+        previous = previous_result(result, history)
+        if previous:
+            regressions = compare(result, previous)
+            result["regressions"] = regressions
+            if regressions:
+                regressed = True
+                print(f"Regressions vs {previous.get('git_commit')} ({previous['timestamp']}):", file=sys.stderr)
+                for line in regressions:
+                    print(f"  - {line}", file=sys.stderr)
+            else:
+                print(f"No regressions vs {previous.get('git_commit')} ({previous['timestamp']})", file=sys.stderr)
+        if not args.no_save:
+            save_result(result, args.results)
+            history.append(result)
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import glob
+import os
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+"""
+Benchmark corpora: the PDFs under data/files and seeded synthetic chunk streams.
+
+Synthetic chunks draw words from a Zipf-distributed pseudo-vocabulary, which gives the keyword
+index and the bag-of-words fake embeddings a realistic mix of common and rare terms. Chunks are
+produced in batches so even the 1M-chunk corpus never exists as one list of Documents.
+"""
+
+PDF_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../data/files"))
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "zi", "pe", "sa", "do", "fu", "gi", "ha", "je", "bu"]
+
+
+def pdf_files(directory: str = PDF_DIR) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "*.pdf")))
+
+
+def _vocabulary(size: int) -> List[str]:
+    words = []
+    for i in range(size):
+        parts, n = [], i
+        while True:
+            parts.append(SYLLABLES[n % len(SYLLABLES)])
+            n //= len(SYLLABLES)
+            if not n:
+                break
+        words.append("".join(parts))
+    return words
+
+
+class SyntheticCorpus:
+    def __init__(
+        self,
+        num_chunks: int,
+        words_per_chunk: int = 60,
+        vocabulary_size: int = 20000,
+        chunks_per_file: int = 1000,
+        seed: int = 42,
+    ):
+        """
+        :param num_chunks: Total chunks generated
+        :param words_per_chunk: Words per chunk
+        :param vocabulary_size: Distinct words; drawn with Zipf (s=1.1) frequencies
+        :param chunks_per_file: Chunks sharing one synthetic file_id
+        :param seed: RNG seed; the same seed always yields the same corpus and queries
+        """
+        self.num_chunks = num_chunks
+        self.words_per_chunk = words_per_chunk
+        self.chunks_per_file = chunks_per_file
+        self.seed = seed
+        self.vocabulary = np.array(_vocabulary(vocabulary_size))
+        weights = 1.0 / np.arange(1, vocabulary_size + 1) ** 1.1
+        self.probabilities = weights / weights.sum()
+
+    def batches(self, batch_size: int = 10000) -> Iterator[List[Document]]:
+        rng = np.random.default_rng(self.seed)
+        for start in range(0, self.num_chunks, batch_size):
+            count = min(batch_size, self.num_chunks - start)
+            word_ids = rng.choice(len(self.vocabulary), size=(count, self.words_per_chunk), p=self.probabilities)
+            batch = []
+            for offset, row in enumerate(word_ids):
+                index = start + offset
+                batch.append(Document(
+                    page_content=" ".join(self.vocabulary[row]),
+                    metadata={"file_id": index // self.chunks_per_file, "filename": f"synthetic-{index // self.chunks_per_file}.txt", "chunk": index},
+                ))
+            yield batch
+
+    def query_indices(self, num_queries: int) -> List[int]:
+        rng = np.random.default_rng(self.seed + 1)
+        return sorted(rng.choice(self.num_chunks, size=min(num_queries, self.num_chunks), replace=False).tolist())
+
+
+def queries_from_chunks(texts: List[str], words_per_query: int = 8, seed: int = 7) -> List[Tuple[str, str]]:
+    """
+    Turn chunk texts into (query, source text) pairs by sampling a few of each chunk's words.
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for text in texts:
+        words = text.split()
+        if not words:
+            continue
+        picked = rng.choice(len(words), size=min(words_per_query, len(words)), replace=False)
+        queries.append((" ".join(words[i] for i in sorted(picked)), text))
+    return queries
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+from app.rag.embedding_providers import EmbeddingProvider
+
+"""
+Deterministic stand-ins for the Gemini embedding and chat models.
+
+FakeEmbeddings hashes word tokens into a fixed-size bag-of-words vector, so texts sharing words
+are close and retrieval quality (recall@k) is meaningful. Both fakes can sleep per call and per
+item to mimic provider latency, without any network access or API key.
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class FakeEmbeddings(EmbeddingProvider):
+    def __init__(self, dimension: int = 256, latency_ms: float = 0.0, per_text_latency_ms: float = 0.0):
+        """
+        :param dimension: Vector size
+        :param latency_ms: Sleep per embedding request (one embed_documents / embed_query call)
+        :param per_text_latency_ms: Additional sleep per embedded text
+        """
+        self._dimension = dimension
+        self.latency_ms = latency_ms
+        self.per_text_latency_ms = per_text_latency_ms
+        self.model_name = f"fake-bow-{dimension}"
+        self.requests = 0
+        self.texts = 0
+
+    def vectors(self, texts: List[str]) -> np.ndarray:
+        """Unit-normalised float32 matrix, one row per text (no latency, no counters)."""
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                matrix[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _delay(self, count: int) -> float:
+        self.requests += 1
+        self.texts += count
+        return (self.latency_ms + self.per_text_latency_ms * count) / 1000.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        delay = self._delay(len(texts))
+        if delay:
+            time.sleep(delay)
+        return self.vectors(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        delay = self._delay(len(texts))
+        if delay:
+            await asyncio.sleep(delay)
+        return self.vectors(texts).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(SimpleChatModel):
+    """Answers with the first line of the last message after a fixed delay."""
+
+    latency_ms: float = 0.0
+    per_token_latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _call(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        prompt = str(messages[-1].content) if messages else ""
+        answer = next((line for line in prompt.splitlines() if line.strip()), "")[:200]
+        delay = self.latency_ms + self.per_token_latency_ms * max(1, len(answer) // 4)
+        if delay:
+            time.sleep(delay / 1000.0)
+        return answer
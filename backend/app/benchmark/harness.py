@@ -0,0 +1,314 @@
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.benchmark.corpus import SyntheticCorpus, pdf_files, queries_from_chunks
+from app.benchmark.fakes import FakeChatModel, FakeEmbeddings
+from app.rag.pipeline import EMBED_BATCH_SIZE, EMBED_CONCURRENCY, RAGPipeline
+from app.rag.retrieval_cache import RetrievalCache
+
+"""
+Offline ingest/retrieval benchmark for RAGPipeline.
+
+Runs the real pipeline (chunk planning, embedding cache, batched concurrent embedding, Chroma,
+keyword index, hybrid retrieval) against the deterministic fakes in a throwaway directory and
+reports ingest throughput, retrieval latency percentiles, memory and recall@k of the dense ANN
+search against exact brute-force search over the same stored vectors. With the quantized vector
+backend it also reports the vector memory saved against float32. Results are appended to a
+JSON-lines file so every run can be compared with the previous run of the same configuration.
+
+The retrieval cache and the in-memory query-embedding LRU are off while latencies are measured, so
+hybrid_ms and answer_ms stay comparable across runs; `retrieval_cached_ms` reports cache hits separately.
+"""
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+RESULTS_PATH = os.getenv("BENCHMARK_RESULTS_PATH", os.path.join(BACKEND_DIR, "benchmark_results.jsonl"))
+# Relative change treated as a regression when comparing with the previous run
+REGRESSION_TOLERANCE = float(os.getenv("BENCHMARK_REGRESSION_TOLERANCE", "0.10"))
+WARMUP_QUERIES = 3
+
+
+@dataclass
+class BenchmarkConfig:
+    corpus: str = "synthetic"  # 'synthetic' or 'pdf'
+    num_chunks: int = 10000
+    num_queries: int = 200
+    k: int = 4
+    dimension: int = 256
+    embed_latency_ms: float = 0.0
+    embed_per_text_latency_ms: float = 0.0
+    llm_latency_ms: float = 0.0
+    answer_queries: int = 20
+    embed_batch_size: int = EMBED_BATCH_SIZE
+    embed_concurrency: int = EMBED_CONCURRENCY
+    seed: int = 42
+    vector_backend: str = "chroma"  # 'chroma' or 'quantized'
+
+    def key(self) -> Dict[str, Any]:
+        """Fields that must match for two runs to be comparable."""
+        key = asdict(self)
+        if self.corpus == "pdf":
+            key.pop("num_chunks")
+        return key
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000.0
+    return {
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "mean": round(float(ms.mean()), 3),
+        "count": len(samples),
+    }
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def _disk_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return round(total / (1024.0 * 1024.0), 1)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _ingest_synthetic(pipeline: RAGPipeline, config: BenchmarkConfig) -> int:
+    corpus = SyntheticCorpus(config.num_chunks, seed=config.seed)
+    chunks = 0
+    for batch in corpus.batches():
+        # One ingest call per synthetic file, as the upload path would do
+        for file_id, docs in groupby(batch, key=lambda d: d.metadata["file_id"]):
+            docs = list(docs)
+            pipeline.ingest_documents(docs, source=f"synthetic-{file_id}")
+            chunks += len(docs)
+    return chunks
+
+
+def _ingest_pdfs(pipeline: RAGPipeline) -> int:
+    chunks = 0
+    for file_id, path in enumerate(pdf_files()):
+        result = pipeline.ingest(path, metadata={"file_id": file_id, "filename": os.path.basename(path)})
+        chunks += len(result.chunks)
+    return chunks
+
+
+def _exact_baseline(pipeline: RAGPipeline, config: BenchmarkConfig, page_size: int = 10000):
+    """
+    Read back every stored vector (the exact-search baseline) and sample query source texts.
+    """
+    total = pipeline.store.count()
+    rng = np.random.default_rng(config.seed + 1)
+    sampled = set(rng.choice(total, size=min(config.num_queries + WARMUP_QUERIES, total), replace=False).tolist())
+    ids: List[str] = []
+    matrix = np.empty((total, config.dimension), dtype=np.float32)
+    texts: List[str] = []
+    for offset in range(0, total, page_size):
+        page = pipeline.store.get_page(limit=page_size, offset=offset, include=("embeddings", "documents"))
+        rows = np.asarray(page["embeddings"], dtype=np.float32)
+        matrix[offset:offset + len(rows)] = rows
+        ids.extend(page["ids"])
+        texts.extend(text for i, text in enumerate(page["documents"]) if offset + i in sampled)
+    return np.asarray(ids), matrix, texts
+
+
+def run_benchmark(config: BenchmarkConfig, keep_dir: bool = False) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    embeddings = FakeEmbeddings(
+        dimension=config.dimension,
+        latency_ms=config.embed_latency_ms,
+        per_text_latency_ms=config.embed_per_text_latency_ms,
+    )
+    llm = FakeChatModel(latency_ms=config.llm_latency_ms)
+    try:
+        rss_start = _rss_mb()
+        pipeline = RAGPipeline(
+            vector_db_path=os.path.join(work_dir, "chroma_db"),
+            embeddings=embeddings,
+            llm=llm,
+            embed_batch_size=config.embed_batch_size,
+            embed_concurrency=config.embed_concurrency,
+            vector_backend=config.vector_backend,
+        )
+        # Every timed retrieve does the full search (repeated queries would otherwise be cache hits)
+        pipeline.retrieval_cache = RetrievalCache(max_entries=0)
+        query_memory_entries = pipeline.embeddings.query_memory_entries
+        pipeline.embeddings.query_memory_entries = 0
+
+        started = time.perf_counter()
+        if config.corpus == "pdf":
+            chunks = _ingest_pdfs(pipeline)
+        else:
+            chunks = _ingest_synthetic(pipeline, config)
+        ingest_seconds = time.perf_counter() - started
+        rss_after_ingest = _rss_mb()
+
+        ids, matrix, texts = _exact_baseline(pipeline, config)
+        queries = queries_from_chunks(texts, seed=config.seed)
+        hybrid, dense, answer, recalls = [], [], [], []
+        for n, (query, _) in enumerate(queries):
+            record = n >= WARMUP_QUERIES
+            t = time.perf_counter()
+            pipeline.retrieve(query, k=config.k)
+            if record:
+                hybrid.append(time.perf_counter() - t)
+
+            vector = embeddings.vectors([query])[0]
+            t = time.perf_counter()
+            found = pipeline.store.similarity_search_by_vector(vector.tolist(), k=config.k)
+            if record:
+                dense.append(time.perf_counter() - t)
+            k = min(config.k, len(ids))
+            exact = set(ids[np.argpartition(-(matrix @ vector), k - 1)[:k]]) if k else set()
+            if record and exact:
+                recalls.append(len(exact & {d.id for d in found}) / len(exact))
+
+            if record and len(answer) < config.answer_queries:
+                t = time.perf_counter()
+                docs = pipeline.retrieve(query, k=config.k)
+                context = "\n\n".join(d.page_content for d in docs)
+                pipeline.llm.invoke(f"{context}\n\nQuestion: {query}")
+                answer.append(time.perf_counter() - t)
+
+        # Cache hits, measured on their own: second retrieve of the same query with the caches on
+        pipeline.retrieval_cache = RetrievalCache()
+        pipeline.embeddings.query_memory_entries = query_memory_entries
+        cached = []
+        for query, _ in queries[WARMUP_QUERIES:WARMUP_QUERIES + config.answer_queries]:
+            pipeline.retrieve(query, k=config.k)
+            t = time.perf_counter()
+            pipeline.retrieve(query, k=config.k)
+            cached.append(time.perf_counter() - t)
+
+        result = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_commit": _git_commit(),
+            "config": asdict(config),
+            "ingest": {
+                "chunks": chunks,
+                "seconds": round(ingest_seconds, 3),
+                "chunks_per_sec": round(chunks / ingest_seconds, 1) if ingest_seconds else None,
+                "embedding_requests": embeddings.requests,
+            },
+            "retrieval": {
+                "hybrid_ms": _latency_summary(hybrid),
+                "dense_ms": _latency_summary(dense),
+                "retrieval_cached_ms": _latency_summary(cached),
+                f"recall_at_{config.k}": round(float(np.mean(recalls)), 4) if recalls else None,
+            },
+            "answer_ms": _latency_summary(answer),
+            "memory": {
+                "rss_start_mb": rss_start,
+                "rss_after_ingest_mb": rss_after_ingest,
+                "peak_rss_mb": _peak_rss_mb(),
+                "disk_mb": _disk_mb(work_dir),
+                "exact_baseline_mb": round(matrix.nbytes / (1024.0 * 1024.0), 1),
+            },
+        }
+        if hasattr(pipeline.store, "memory_stats"):
+            stats = pipeline.store.memory_stats()
+            mb = 1024.0 * 1024.0
+            # Vectors a search keeps hot: int8 codes plus per-row state, against the float32 vectors
+            resident = stats["codes_bytes"] + stats["row_state_bytes"]
+            result["memory"]["quantized"] = {
+                "codes_mb": round(stats["codes_bytes"] / mb, 2),
+                "row_state_mb": round(stats["row_state_bytes"] / mb, 2),
+                "float32_mb": round(stats["float32_bytes"] / mb, 2),
+                "memory_saved_mb": round((stats["float32_bytes"] - resident) / mb, 2),
+                "memory_saved_ratio": round(1 - resident / stats["float32_bytes"], 3) if stats["float32_bytes"] else None,
+                "rescore_factor": pipeline.store.rescore_factor,
+            }
+        pipeline._retrieval_executor.shutdown(wait=False)
+        pipeline.parse_pool.shutdown()
+        return result
+    finally:
+        if keep_dir:
+            print(f"Benchmark data kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def load_results(path: str = RESULTS_PATH) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_result(result: Dict[str, Any], path: str = RESULTS_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+def previous_result(result: Dict[str, Any], history: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    key = BenchmarkConfig(**result["config"]).key()
+    for old in reversed(history):
+        try:
+            if BenchmarkConfig(**old["config"]).key() == key:
+                return old
+        except TypeError:
+            # Written by an older harness with different config fields
+            continue
+    return None
+
+
+def compare(result: Dict[str, Any], previous: Dict[str, Any], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Return human-readable regressions of result against previous (empty list if none).
+    """
+    regressions = []
+    old_rate, new_rate = previous["ingest"].get("chunks_per_sec"), result["ingest"].get("chunks_per_sec")
+    if old_rate and new_rate and new_rate < old_rate * (1 - tolerance):
+        regressions.append(f"ingest chunks/sec {old_rate} -> {new_rate}")
+    for metric in ("hybrid_ms", "dense_ms"):
+        # p99 over a few hundred queries is too noisy to gate on
+        for pct in ("p50", "p95"):
+            old, new = previous["retrieval"].get(metric, {}).get(pct), result["retrieval"].get(metric, {}).get(pct)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{metric} {pct} {old} -> {new}")
+    recall_key = f"recall_at_{result['config']['k']}"
+    old_recall, new_recall = previous["retrieval"].get(recall_key), result["retrieval"].get(recall_key)
+    if old_recall is not None and new_recall is not None and new_recall < old_recall - 0.01:
+        regressions.append(f"{recall_key} {old_recall} -> {new_recall}")
+    old_rss, new_rss = previous["memory"].get("rss_after_ingest_mb"), result["memory"].get("rss_after_ingest_mb")
+    if old_rss and new_rss and new_rss > old_rss * (1 + tolerance):
+        regressions.append(f"rss_after_ingest_mb {old_rss} -> {new_rss}")
+    return regressions
@@ -0,0 +1,84 @@
+# concurrency.py - Bounded executor for blocking calls made from async code
+import asyncio
+import contextvars
+import functools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Chroma and SQLite calls are blocking; async routes offload them here instead of to the default
+# executor, so a burst of chats cannot starve the event loop or open unbounded threads.
+BLOCKING_IO_WORKERS = int(os.getenv("BLOCKING_IO_WORKERS", "16"))
+_blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS, thread_name_prefix="blocking-io")
+# Seconds a SQLite connection waits for another connection's (or worker process's) write lock before failing
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking callable on the shared bounded executor and await its result.
+    """
+    loop = asyncio.get_running_loop()
+    # Run in a copy of the caller's context so request-scoped context variables (e.g. stage timings) carry over
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class ReadWriteLock:
+    """
+    Many concurrent readers or one writer. Writers are preferred: once a writer is waiting, new
+    readers queue behind it, so a reset is never starved by a steady stream of queries.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Connection to one of the app's SQLite files, shareable across threads and worker processes: WAL lets
+    readers run during a write, and a writer waits up to SQLITE_BUSY_TIMEOUT for the lock.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -20,6 +20,14 @@ class File(Base):
     upload_time = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     file_metadata = Column(Text)
+    # sha256 of the file bytes; identical uploads are recognised and skipped
+    content_hash = Column(String, nullable=True, index=True)
+    # A new version uploaded under the same name, waiting for its ingest job; filepath/content_hash
+    # keep pointing at the current version until that job completes
+    pending_filepath = Column(String, nullable=True)
+    pending_content_hash = Column(String, nullable=True)
+    # Tenant the file belongs to (chunk metadata `tenant`; routes chunks with VECTOR_SHARD_BY=tenant)
+    tenant = Column(String, nullable=True, index=True)
     user = relationship("User", back_populates="files")
     chats = relationship("ChatHistory", back_populates="file")
 
@@ -33,3 +41,56 @@ class ChatHistory(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="chats")
     file = relationship("File", back_populates="chats")
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=True)
+    # queued -> running -> completed | failed | cancelled
+    status = Column(String, nullable=False, default="queued")
+    chunks_done = Column(Integer, nullable=False, default=0)
+    chunks_total = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    # Worker process running the job ("host:pid"), so other workers leave it alone
+    worker = Column(String, nullable=True)
+    # Set by a cancel handled in another worker; the running worker checks it between batches
+    cancel_requested = Column(Boolean, nullable=True)
+    # Version this job ingests when it replaces an existing file's version (None: the file's current version)
+    filepath = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Chunk(Base):
+    __tablename__ = "chunks"
+    # Deterministic chunk id shared with the vector store and keyword index
+    id = Column(String, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=False, index=True)
+    chunk_hash = Column(String, nullable=False)
+    ordinal = Column(Integer, nullable=False)
+    # Vector store shard holding the chunk (see rag/sharding.py)
+    shard = Column(String, nullable=True, index=True)
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    # Resumable chunked upload; bytes are appended to temp_path until offset == size
+    id = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    offset = Column(Integer, nullable=False, default=0)
+    # Expected sha256 of the whole file, if the client sent one
+    sha256 = Column(String, nullable=True)
+    tenant = Column(String, nullable=True)
+    temp_path = Column(String, nullable=False)
+    # open -> completed
+    status = Column(String, nullable=False, default="open")
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CorpusState(Base):
+    __tablename__ = "corpus_state"
+    # Single row; every worker bumps version after changing files or vectors and polls it to reload
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session
+from app.concurrency import SQLITE_BUSY_TIMEOUT
 from .models import Base
 import os
 
@@ -8,12 +9,59 @@ DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/ch
 CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/chroma_db"))
 os.makedirs(CHROMA_PATH, exist_ok=True)
 
-engine = create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False})
+# Any SQLAlchemy URL (e.g. postgresql+psycopg://...); defaults to the bundled SQLite file
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
+# Connections kept open per worker process, and extra ones allowed under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+def _create_engine(url: str):
+    """
+    SQLite runs in WAL mode so readers in every worker proceed during a write, and writers wait for the
+    lock (SQLITE_BUSY_TIMEOUT) instead of failing with "database is locked".
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return sqlite_engine
+
+engine = _create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _add_missing_columns():
+    """
+    create_all never alters existing tables; add nullable columns introduced since a table was created.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
 def init_db():
     try:
         Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
         try:
             from app.log_utils import safe_log_gotcha
             safe_log_gotcha("[init_db] Database initialized successfully.")
@@ -1,35 +1,29 @@
+import time
+# Start of the cold-start clock: every startup phase below is measured from here
+_MODULE_STARTED = time.perf_counter()
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.db.session import get_db, init_db
-from app.db.models import File as DBFile, ChatHistory
+from app.db.session import get_db, init_db, SessionLocal
+from app.db.models import File as DBFile
 from app.rag.pipeline import RAGPipeline, SUPPORTED_EXTENSIONS
 from datetime import datetime
 import shutil
 import uuid
 from app.log_utils import safe_log_gotcha
-from app.schemas import FileUploadResponse, FileListItem, ChatResponse, AdminClearAllResponse
-from langchain_google_genai import ChatGoogleGenerativeAI
-import google.generativeai as genai
-from tenacity import retry, stop_after_attempt, wait_exponential
-import time
+from app.schemas import FileUploadResponse, FileListItem, ChatResponse, AdminClearAllResponse, IngestJobResponse
+from app.rag.clients import LLM_MODEL, get_chat_model, ping_chat_model
+from app.rag.rate_limiter import rate_limit_metrics
+from app.concurrency import run_blocking
+from app.metrics import PROMETHEUS_MULTIPROC_DIR, mark_worker_exited, observe_startup, startup_report
 
 # Get Google API key from environment
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY environment variable is required")
-
-# Configure Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
-gemini_llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash",
-    convert_system_message_to_human=True,
-    temperature=0.7,
-    max_output_tokens=2048,
-)
+# The Gemini chat client is created on first use (see app/rag/clients.py) and shared with the pipeline
 
 UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/files"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -43,6 +37,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+from app.metrics import HTTP_SECONDS, SERVER_TIMING_ENABLED, latest_metrics, server_timing_header, start_request_timings
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Observe request latency per route and, if SERVER_TIMING_ENABLED, report the timed stages in a Server-Timing header.
+    Streaming responses only include stages finished before the headers were sent.
+    """
+    started = time.perf_counter()
+    timings = start_request_timings()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    HTTP_SECONDS.labels(request.method, getattr(route, "path", "unmatched"), str(response.status_code)).observe(elapsed)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
 # Register centralized error handlers
 from app.error_handlers import http_exception_handler, sqlalchemy_exception_handler, generic_exception_handler
 from sqlalchemy.exc import SQLAlchemyError
@@ -53,16 +65,95 @@ app.add_exception_handler(Exception, generic_exception_handler)
 CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "./data/chroma_db"))
 os.makedirs(CHROMA_PATH, exist_ok=True)
 
-# Initialize DB and RAG pipeline
+observe_startup("imports", time.perf_counter() - _MODULE_STARTED)
+
+# Initialize DB and RAG pipeline; Chroma is opened by warm_up at startup, off the import path
+_phase_started = time.perf_counter()
 init_db()
+observe_startup("init_db", time.perf_counter() - _phase_started)
+_phase_started = time.perf_counter()
 rag_pipeline = RAGPipeline(vector_db_path=CHROMA_PATH, api_key=GOOGLE_API_KEY)
+observe_startup("pipeline_init", time.perf_counter() - _phase_started)
+
+from app.services.answer_cache import AnswerCache
+answer_cache = AnswerCache()
+
+from app.services.worker_sync import WorkerSync
+
+def _reload_shared_state():
+    """
+    Another worker changed files or vectors: reload the live file ids and drop everything derived from the old corpus.
+    """
+    with SessionLocal() as session:
+        file_registry.load(session)
+    answer_cache.clear()
+    rag_pipeline.refresh()
+
+# Cross-worker invalidation (active with more than one uvicorn worker); writes to an embedded vector store
+# are also serialized across workers. A Chroma server (CHROMA_HOST) is shared, so it only needs the invalidation.
+worker_sync = WorkerSync(
+    on_change=_reload_shared_state,
+    lock_path=os.path.join(os.path.dirname(CHROMA_PATH), "vector_write.lock"),
+    exclusive_writes=not rag_pipeline.store.remote,
+)
+rag_pipeline.store.write_guard = worker_sync.writing
+
+from app.services.file_registry import LiveFileRegistry
+# Live file ids for the chat path; kept in sync by upload, delete and clear_all (and by other workers' changes)
+file_registry = LiveFileRegistry(on_change=worker_sync.publish)
+with SessionLocal() as _session:
+    file_registry.load(_session)
+
+from app.services.ingest_service import IngestJobQueue, job_to_dict
+# A re-uploaded file (same filename) invalidates answers that cited the previous version
+ingest_queue = IngestJobQueue(
+    rag_pipeline,
+    on_file_ingested=lambda db_file: answer_cache.invalidate_files(filenames=[db_file.filename]),
+    on_file_removed=lambda file_id: file_registry.discard([file_id]),
+    write_batch=worker_sync.deferred,
+)
+
+@app.on_event("startup")
+def start_worker_sync():
+    worker_sync.start()
+    if worker_sync.enabled and not PROMETHEUS_MULTIPROC_DIR:
+        safe_log_gotcha("[Startup] Multiple workers without PROMETHEUS_MULTIPROC_DIR: /metrics only reports the worker that serves the scrape")
+
+@app.on_event("startup")
+def resume_ingest_jobs():
+    ingest_queue.resume_pending()
+
+import threading
+
+def _warm_up_pipeline():
+    started = time.perf_counter()
+    try:
+        rag_pipeline.warm_up()
+    except Exception as e:
+        safe_log_gotcha(f"[Startup] Pipeline warm-up failed: {str(e)} at {datetime.now().isoformat()}")
+        return
+    observe_startup("warm_up", time.perf_counter() - started)
+    # Publish readiness now instead of at the next scheduled health refresh
+    health_monitor.refresh(skip_model_ping=True)
+
+@app.on_event("startup")
+def warm_up_pipeline():
+    # Readiness stays false until the vector store is open and the keyword index backfilled
+    threading.Thread(target=_warm_up_pipeline, name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_ingest_jobs():
+    worker_sync.stop()
+    mark_worker_exited()
+    ingest_queue.shutdown()
+    rag_pipeline.parse_pool.shutdown()
 
 from fastapi import Header
 
 from app.services.admin_service import clear_all_service
 
 @app.post("/api/admin/clear_all", response_model=AdminClearAllResponse)
-def clear_all(admin_token: str = Header(..., alias="admin-token", min_length=8, max_length=128), db: Session = Depends(get_db)) -> AdminClearAllResponse:
+async def clear_all(admin_token: str = Header(..., alias="admin-token", min_length=8, max_length=128), db: Session = Depends(get_db)) -> AdminClearAllResponse:
     """
     Danger: Delete ALL files and chat history from DB and vectorstore. Delegates business logic to admin_service.
     Validates admin token length (8-128 chars).
@@ -70,87 +161,275 @@ def clear_all(admin_token: str = Header(..., alias="admin-token", min_length=8,
     ADMIN_TOKEN = os.environ.get("CHAT_RAG_ADMIN_TOKEN", "supersecret")
     if not (admin_token.isalnum() or '-' in admin_token or '_' in admin_token):
         raise HTTPException(status_code=422, detail="Invalid admin token format.")
-    return AdminClearAllResponse(**clear_all_service(
+    result = await run_blocking(
+        clear_all_service,
         admin_token=admin_token,
         db=db,
         rag_pipeline=rag_pipeline,
         admin_env_token=ADMIN_TOKEN
-    ))
+    )
+    file_registry.clear()
+    answer_cache.clear()
+    return AdminClearAllResponse(**result)
+
+
+from app.services.admin_service import drop_shard_service
+
+@app.delete("/api/admin/shards/{shard}")
+async def drop_shard(shard: str, admin_token: str = Header(..., alias="admin-token", min_length=8, max_length=128), db: Session = Depends(get_db)) -> dict:
+    """
+    Danger: delete a vector store shard (VECTOR_SHARD_BY=tenant: a tenant; file_group: g0, g1, ...; or `default`)
+    together with every file routed to it. The shard's collection is dropped whole instead of deleting chunk by chunk.
+    """
+    result = await run_blocking(
+        drop_shard_service,
+        shard,
+        admin_token=admin_token,
+        db=db,
+        rag_pipeline=rag_pipeline,
+        admin_env_token=os.environ.get("CHAT_RAG_ADMIN_TOKEN", "supersecret"),
+    )
+    file_registry.discard(result["file_ids"])
+    answer_cache.invalidate_files(file_ids=result["file_ids"])
+    return result
+
+
+from app.schemas import ImportDirectoryRequest, ImportDirectoryResponse
+from app.services.file_service import import_directory as import_directory_service
+
+@app.post("/api/admin/import", response_model=ImportDirectoryResponse)
+async def import_directory(req: ImportDirectoryRequest, admin_token: str = Header(..., alias="admin-token", min_length=8, max_length=128), db: Session = Depends(get_db)) -> ImportDirectoryResponse:
+    """
+    Bulk-import every supported file in a directory under IMPORT_ROOT (admin-token required; refused while the
+    default token is in use). `directory` is resolved relative to IMPORT_ROOT. Files are recorded like
+    uploads (duplicates skipped, same-name files updated) and queued on the import pool, which ingests many files
+    at once so PDF parsing keeps every core busy. Poll /api/jobs for progress.
+    """
+    expected_token = os.environ.get("CHAT_RAG_ADMIN_TOKEN", "supersecret")
+    if expected_token == "supersecret":
+        # The default token is public; reading server files needs a real one
+        raise HTTPException(status_code=403, detail="Directory import requires CHAT_RAG_ADMIN_TOKEN to be set")
+    if admin_token != expected_token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    stored, skipped = await run_blocking(import_directory_service, req.directory, db, recursive=req.recursive, tenant=req.tenant)
+    files = []
+    for db_file, upload_status in stored:
+        if upload_status == "duplicate":
+            files.append(FileUploadResponse(id=db_file.id, filename=db_file.filename, status="duplicate"))
+            continue
+        file_registry.add(db_file.id)
+        answer_cache.invalidate_files(filenames=[db_file.filename])
+        job = await run_blocking(ingest_queue.submit, db_file, db, bulk=True)
+        files.append(FileUploadResponse(id=db_file.id, filename=db_file.filename, job_id=job.id, status=job.status))
+    return ImportDirectoryResponse(status="queued", files=files, skipped=skipped)
+
+
+from app.services.health_service import HealthMonitor
+
+# Metadata lookup of the chat model: verifies key and reachability without spending generation quota
+health_monitor = HealthMonitor(rag_pipeline, model_name=LLM_MODEL, model_ping=ping_chat_model)
+
+@app.on_event("startup")
+def start_health_monitor():
+    health_monitor.start()
+
+@app.on_event("shutdown")
+def stop_health_monitor():
+    health_monitor.stop()
+
+@app.get("/api/health/live")
+async def liveness():
+    """
+    Liveness probe: the process is up and serving requests. Checks no dependencies.
+    """
+    return {"status": "alive"}
 
+@app.get("/api/health/ready")
+async def readiness():
+    """
+    Readiness probe: the cached health snapshot; 503 until the first check completes, when the DB or
+    vectorstore check fails, or when the snapshot is stale.
+    """
+    snapshot = health_monitor.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
 
 @app.get("/api/health")
-def health_check():
+async def health_check():
     """
-    Health check endpoint: verifies DB, vectorstore, and LLM health.
+    Health check endpoint: DB, vectorstore, and LLM health from the background-refreshed snapshot, with its age,
+    plus the duration of each startup phase in seconds and this worker's cross-worker sync state.
     """
-    # DB health
-    try:
-        db_ok = True
-        db_msg = "OK"
-        session_gen = get_db()
-        session = next(session_gen)
-        session.execute(text("SELECT 1"))
-        session.close()
-    except Exception as e:
-        db_ok = False
-        db_msg = str(e)
-    # Vectorstore health
-    try:
-        vec_ok = True
-        vec_msg = "OK"
-        _ = rag_pipeline.vectorstore.get()
-    except Exception as e:
-        vec_ok = False
-        vec_msg = str(e)
-    # LLM health
-    try:
-        llm_ok = True
-        llm_msg = "OK"
-        _ = gemini_llm.invoke("Health check?")
-        llm_model = "gemini-2.0-flash"
-    except Exception as e:
-        llm_ok = False
-        llm_msg = str(e)
-        llm_model = "gemini-2.0-flash"
-    status = "ok" if all([db_ok, vec_ok, llm_ok]) else "degraded"
-    return {
-        "status": status,
-        "db": {"ok": db_ok, "msg": db_msg},
-        "vectorstore": {"ok": vec_ok, "msg": vec_msg},
-        "llm": {"ok": llm_ok, "msg": llm_msg, "model": llm_model}
-    }
+    return {**health_monitor.snapshot(), "startup": startup_report(), "worker": worker_sync.stats()}
 
 from app.services.file_service import upload_file as upload_file_service
 
 @app.post("/api/upload", response_model=FileUploadResponse)
-def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)) -> FileUploadResponse:
+async def upload_file(
+    file: UploadFile = File(...),
+    tenant: str = Form(None, min_length=1, max_length=64),
+    db: Session = Depends(get_db),
+) -> FileUploadResponse:
     """
-    Upload a file and ingest into the RAG pipeline. Delegates business logic to file_service.
-    Validates file extension against SUPPORTED_EXTENSIONS.
+    Upload a file and queue it for background ingestion into the RAG pipeline. Delegates business logic to file_service.
+    Validates file extension against SUPPORTED_EXTENSIONS. Returns immediately with a job id; poll /api/jobs/{job_id} for progress.
+    Byte-identical re-uploads are recognised by content hash and return status "duplicate" without a job.
+    The optional `tenant` form field is stored with the file and on its chunks (filter with {"tenant": ...}).
     """
     ext = os.path.splitext(file.filename)[-1].lower()
     if ext not in SUPPORTED_EXTENSIONS:
         raise HTTPException(status_code=422, detail=f"Unsupported file type: {ext}")
-    db_file = upload_file_service(file=file, db=db)
-    # Ingest into RAG pipeline (kept here to avoid circular dependency)
-    try:
-        rag_pipeline.ingest(db_file.filepath, metadata={"file_id": db_file.id, "filename": db_file.filename})
-    except Exception as e:
-        db.delete(db_file)
-        db.commit()
-        os.remove(db_file.filepath)
-        raise HTTPException(status_code=500, detail=f"RAG ingestion failed: {str(e)}")
-    return FileUploadResponse(id=db_file.id, filename=db_file.filename)
+    db_file, upload_status = await run_blocking(upload_file_service, file=file, db=db, tenant=tenant)
+    if upload_status == "duplicate":
+        return FileUploadResponse(id=db_file.id, filename=db_file.filename, status="duplicate")
+    file_registry.add(db_file.id)
+    answer_cache.invalidate_files(filenames=[db_file.filename])
+    job = await run_blocking(ingest_queue.submit, db_file, db)
+    return FileUploadResponse(id=db_file.id, filename=db_file.filename, job_id=job.id, status=job.status)
+
+
+async def _queue_batch(stored, db: Session) -> list[FileUploadResponse]:
+    """
+    Queue stored files for ingestion as one batch (embedding calls are shared across the files); duplicates get no job.
+    """
+    responses = {}
+    new_files = []
+    for db_file, upload_status in stored:
+        if upload_status == "duplicate" or db_file.id in responses:
+            responses.setdefault(db_file.id, FileUploadResponse(id=db_file.id, filename=db_file.filename, status="duplicate"))
+            continue
+        # Placeholder until the job exists; also skips a second same-name file in the batch
+        responses[db_file.id] = None
+        file_registry.add(db_file.id)
+        answer_cache.invalidate_files(filenames=[db_file.filename])
+        new_files.append(db_file)
+    jobs = await run_blocking(ingest_queue.submit_batch, new_files, db)
+    for db_file, job in zip(new_files, jobs):
+        responses[db_file.id] = FileUploadResponse(id=db_file.id, filename=db_file.filename, job_id=job.id, status=job.status)
+    return [responses[db_file.id] for db_file, _ in stored]
+
+
+@app.post("/api/upload/batch", response_model=list[FileUploadResponse])
+async def upload_files(
+    files: list[UploadFile] = File(...),
+    tenant: str = Form(None, min_length=1, max_length=64),
+    db: Session = Depends(get_db),
+) -> list[FileUploadResponse]:
+    """
+    Upload several files in one request. The whole batch is rejected (422) if any extension is unsupported.
+    Files are ingested together, so chunks of small files share embedding requests; each still gets its own job.
+    `tenant` (optional) applies to every file of the batch.
+    """
+    for file in files:
+        ext = os.path.splitext(file.filename)[-1].lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(status_code=422, detail=f"Unsupported file type: {ext} ({file.filename})")
+    stored = []
+    for file in files:
+        stored.append(await run_blocking(upload_file_service, file=file, db=db, tenant=tenant))
+    return await _queue_batch(stored, db)
+
+
+from app.schemas import UploadSessionCreate, UploadSessionResponse, UploadCompleteRequest
+from app.services import upload_service
+
+@app.on_event("startup")
+def expire_upload_sessions():
+    with SessionLocal() as session:
+        upload_service.expire_sessions(session)
+
+@app.post("/api/uploads", response_model=UploadSessionResponse)
+async def create_upload_session(req: UploadSessionCreate, db: Session = Depends(get_db)) -> UploadSessionResponse:
+    """
+    Start a resumable upload of `size` bytes. Send the content with PUT /api/uploads/{id}?offset=N, then
+    POST /api/uploads/complete. `sha256` (optional) is checked against the whole file on completion.
+    `tenant` (optional) is stored with the file, as for /api/upload.
+    """
+    session = await run_blocking(upload_service.create_session, req.filename, req.size, req.sha256, db, req.tenant)
+    return UploadSessionResponse(**upload_service.session_to_dict(session))
+
+@app.get("/api/uploads/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(session_id: str, db: Session = Depends(get_db)) -> UploadSessionResponse:
+    """
+    Report an upload session; `offset` is where a resumed upload continues.
+    """
+    session = await run_blocking(upload_service.get_session, session_id, db)
+    return UploadSessionResponse(**upload_service.session_to_dict(session))
+
+@app.put("/api/uploads/{session_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    session_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    chunk_sha256: str = Header(None, alias="X-Chunk-SHA256"),
+    db: Session = Depends(get_db),
+) -> UploadSessionResponse:
+    """
+    Append the raw request body at `offset`. 409 (with the current offset) if `offset` is not where the upload
+    stands; 400 if the body does not match the X-Chunk-SHA256 header or runs past the declared size;
+    413 if it is larger than UPLOAD_MAX_CHUNK_BYTES.
+    """
+    too_large = HTTPException(status_code=413, detail=f"Chunk larger than {upload_service.UPLOAD_MAX_CHUNK_BYTES} bytes")
+    if int(request.headers.get("content-length") or 0) > upload_service.UPLOAD_MAX_CHUNK_BYTES:
+        raise too_large
+    data = bytearray()
+    async for block in request.stream():
+        data.extend(block)
+        if len(data) > upload_service.UPLOAD_MAX_CHUNK_BYTES:
+            raise too_large
+    data = bytes(data)
+    session = await run_blocking(upload_service.write_chunk, session_id, offset, data, chunk_sha256, db)
+    return UploadSessionResponse(**upload_service.session_to_dict(session))
+
+@app.post("/api/uploads/complete", response_model=list[FileUploadResponse])
+async def complete_uploads(req: UploadCompleteRequest, db: Session = Depends(get_db)) -> list[FileUploadResponse]:
+    """
+    Finish one or more fully received uploads and queue them for ingestion as one batch (like /api/upload/batch).
+    """
+    stored = await run_blocking(upload_service.complete_sessions, req.session_ids, db)
+    return await _queue_batch(stored, db)
+
+@app.delete("/api/uploads/{session_id}")
+async def abort_upload(session_id: str, db: Session = Depends(get_db)):
+    """
+    Abandon an upload session and delete its partial data.
+    """
+    await run_blocking(upload_service.abort_session, session_id, db)
+    return {"status": "deleted", "id": session_id}
+
+
+@app.get("/api/jobs", response_model=list[IngestJobResponse])
+async def list_jobs(status: str = Query(None), db: Session = Depends(get_db)) -> list[IngestJobResponse]:
+    """
+    List ingestion jobs, newest first, optionally filtered by status.
+    """
+    jobs = await run_blocking(ingest_queue.list_jobs, db, status=status)
+    return [IngestJobResponse(**job_to_dict(job)) for job in jobs]
+
+
+@app.get("/api/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_job(job_id: int, db: Session = Depends(get_db)) -> IngestJobResponse:
+    """
+    Report an ingestion job's state, chunks done out of the total, and error (if any).
+    """
+    return IngestJobResponse(**job_to_dict(await run_blocking(ingest_queue.get, job_id, db)))
+
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=IngestJobResponse)
+async def cancel_job(job_id: int, db: Session = Depends(get_db)) -> IngestJobResponse:
+    """
+    Cancel a queued or running ingestion job. The file and any partially written vectors are removed.
+    """
+    return IngestJobResponse(**job_to_dict(await run_blocking(ingest_queue.cancel, job_id, db)))
 
 
 from app.services.file_service import list_files as list_files_service
 
 @app.get("/api/files", response_model=list[FileListItem])
-def list_files(db: Session = Depends(get_db)) -> list[FileListItem]:
+async def list_files(db: Session = Depends(get_db)) -> list[FileListItem]:
     """
     List all files in the database. Delegates business logic to file_service.
     """
-    files = list_files_service(db=db)
+    files = await run_blocking(list_files_service, db=db)
     return [
         FileListItem(
             id=f.id,
@@ -163,18 +442,22 @@ def list_files(db: Session = Depends(get_db)) -> list[FileListItem]:
 from app.services.file_service import delete_file as delete_file_service
 
 @app.delete("/api/files/{file_id}")
-def delete_file(file_id: int, db: Session = Depends(get_db)) -> dict:
+async def delete_file(file_id: int, db: Session = Depends(get_db)) -> dict:
     """
     Delete a file: removes from DB and disk, attempts vectorstore cleanup. Delegates business logic to file_service for DB/disk, keeps vectorstore logic here to avoid circular dependency.
     """
+    return await run_blocking(_delete_file, file_id, db)
+
+
+def _delete_file(file_id: int, db: Session) -> dict:
     # Remove from DB and disk
     result = delete_file_service(file_id=file_id, db=db)
+    file_registry.discard([file_id])
+    answer_cache.invalidate_files(file_ids=[file_id])
     # Remove from vectorstore
     errors = result.get("warnings", [])
     try:
-        rag_pipeline.vectorstore.delete(where={"file_id": file_id})
-        from app.rag.pipeline import RAGPipeline
-        rag_pipeline.vectorstore = RAGPipeline(vector_db_path=rag_pipeline.vector_db_path).vectorstore
+        rag_pipeline.delete_files([file_id])
     except Exception as e:
         errors.append(f"Vectorstore delete by file_id (where) error: {e}")
         safe_log_gotcha(f"[DeleteFile] Chroma delete API mismatch or failure: {e}")
@@ -182,50 +465,162 @@ def delete_file(file_id: int, db: Session = Depends(get_db)) -> dict:
         # Try by filename (if file still exists)
         db_file = db.query(DBFile).filter(DBFile.id == file_id).first()
         if db_file:
-            rag_pipeline.vectorstore.delete(where={"filename": db_file.filename})
-            from app.rag.pipeline import RAGPipeline
-            rag_pipeline.vectorstore = RAGPipeline(vector_db_path=rag_pipeline.vector_db_path).vectorstore
+            rag_pipeline.delete_where({"filename": db_file.filename})
     except Exception as e:
         errors.append(f"Vectorstore delete by filename (where) error: {e}")
         safe_log_gotcha(f"[DeleteFile] Chroma delete API mismatch or failure: {e}")
     return {"status": "deleted", "warnings": errors}
 
 
+from app.schemas import FileBulkDeleteRequest
+
+@app.post("/api/files/delete")
+async def delete_files(req: FileBulkDeleteRequest, db: Session = Depends(get_db)) -> dict:
+    """
+    Delete several files at once: DB rows and disk files one by one, then a single vectorstore delete for all of them.
+    Unknown ids are reported in warnings instead of failing the whole request.
+    """
+    return await run_blocking(_delete_files, req.file_ids, db)
+
+
+def _delete_files(file_ids: list, db: Session) -> dict:
+    deleted, errors = [], []
+    for file_id in dict.fromkeys(file_ids):
+        try:
+            result = delete_file_service(file_id=file_id, db=db)
+        except HTTPException as e:
+            errors.append(f"File {file_id}: {e.detail}")
+            continue
+        deleted.append(file_id)
+        errors.extend(result.get("warnings", []))
+    file_registry.discard(deleted)
+    answer_cache.invalidate_files(file_ids=deleted)
+    try:
+        rag_pipeline.delete_files(deleted)
+    except Exception as e:
+        errors.append(f"Vectorstore bulk delete error: {e}")
+        safe_log_gotcha(f"[DeleteFiles] Chroma bulk delete failed: {e}")
+    return {"status": "deleted", "deleted": deleted, "warnings": errors}
 
-from app.services.chat_service import chat_service
+
+from app.services.chat_service import achat_service, achat_stream_service
 
 from app.schemas import ChatRequest
 
 @app.post("/api/chat", response_model=ChatResponse)
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def chat(
+async def chat(
+    response: Response,
     chat_req: ChatRequest = None,
     question: str = Query(None, min_length=3, max_length=500),
     file_id: int = Query(None),
+    cache_control: str = Header(None, alias="cache-control"),
     db: Session = Depends(get_db)
 ) -> ChatResponse:
     """
     Chat endpoint: supports hybrid retrieval (keywords, metadata, MMR, k). Accepts ChatRequest body or legacy query params.
-    Handles rate limits with retries.
+    Rate limits are handled by the shared limiter inside the service; the pipeline itself is never re-run.
+    Answers are cached: `Cache-Control: no-cache` skips the lookup, `no-store` also skips storing.
+    The response carries `X-Cache` (HIT, SEMANTIC-HIT, MISS, BYPASS) and `Age` on hits.
     """
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
     # Prefer body if provided, else fallback to query params for legacy clients
     if chat_req is not None:
         req = chat_req
     else:
         req = ChatRequest(question=question, file_id=file_id)
     try:
-        return ChatResponse(**chat_service(
+        result = await achat_service(
             question=req.question,
             file_id=req.file_id,
             db=db,
             rag_pipeline=rag_pipeline,
-            llm=gemini_llm,
+            llm=get_chat_model(),
+            file_registry=file_registry,
             keywords=req.keywords,
             metadata_filter=req.metadata_filter,
-            k=req.k
-        ))
+            k=req.k,
+            answer_cache=answer_cache,
+            cache_lookup=not directives & {"no-cache", "no-store"},
+            cache_store="no-store" not in directives
+        )
+        cache = result.pop("cache", {})
+        response.headers["X-Cache"] = cache.get("status", "BYPASS")
+        if "age" in cache:
+            response.headers["Age"] = str(int(cache["age"]))
+        return ChatResponse(**result)
+    except HTTPException:
+        raise
     except Exception as e:
-        if "quota" in str(e).lower() or "rate" in str(e).lower():
-            safe_log_gotcha(f"[Chat] Rate limit hit, retrying: {e}")
-            raise  # Retry
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(
+    chat_req: ChatRequest,
+    cache_control: str = Header(None, alias="cache-control")
+) -> StreamingResponse:
+    """
+    Streaming chat endpoint (NDJSON). Emits a `sources` event once retrieval finishes, then `token` events
+    as the model generates, then `done`; failures after the stream has started arrive as an `error` event.
+    """
+    directives = {d.strip().lower() for d in (cache_control or "").split(",")}
+    return StreamingResponse(
+        achat_stream_service(
+            question=chat_req.question,
+            file_id=chat_req.file_id,
+            session_factory=SessionLocal,
+            rag_pipeline=rag_pipeline,
+            llm=get_chat_model(),
+            file_registry=file_registry,
+            keywords=chat_req.keywords,
+            metadata_filter=chat_req.metadata_filter,
+            k=chat_req.k,
+            answer_cache=answer_cache,
+            cache_lookup=not directives & {"no-cache", "no-store"},
+            cache_store="no-store" not in directives
+        ),
+        media_type="application/x-ndjson",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/rate_limits")
+async def rate_limits() -> dict:
+    """
+    Metrics for the shared embedding/generation rate limiters: effective budget, queue depth, and wait times.
+    """
+    return rate_limit_metrics()
+
+
+@app.get("/api/cache/stats")
+async def cache_stats() -> dict:
+    """
+    Answer cache, embedding cache, retrieval cache and reranker score cache statistics.
+    """
+    stats = {
+        "answers": answer_cache.stats(),
+        "embeddings": await run_blocking(rag_pipeline.embeddings.stats),
+        "retrieval": {**rag_pipeline.retrieval_cache.stats(), "corpus_version": rag_pipeline.store.corpus_version},
+    }
+    if rag_pipeline.reranker is not None:
+        stats["reranker"] = rag_pipeline.reranker.stats()
+    return stats
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Prometheus metrics: per-stage latency histograms for chat, retrieval and ingestion, token and chunk counters,
+    HTTP request latency and startup phase durations.
+    """
+    body, content_type = latest_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+observe_startup("module", time.perf_counter() - _MODULE_STARTED)
+
+@app.on_event("startup")
+def record_startup_time():
+    # Registered last, so this runs after the other startup handlers
+    observe_startup("until_serving", time.perf_counter() - _MODULE_STARTED)
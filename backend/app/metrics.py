@@ -0,0 +1,120 @@
+# metrics.py - Per-stage latency histograms, token/chunk counters, startup phases and Server-Timing support
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Directory where every worker process writes its metric values (prometheus_client multiprocess mode), so /metrics
+# aggregates all workers. Must be set before the app starts and emptied before each server start.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Add a Server-Timing header with the stages of each request (visible in browser dev tools)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in one stage of chat, retrieval or ingestion",
+    ["operation", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+TOKENS = Counter("rag_tokens", "Estimated tokens sent to or received from models", ["operation", "kind"])
+CHUNKS = Counter("rag_chunks", "Chunks processed, by operation and kind", ["operation", "kind"])
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response headers are sent",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+STARTUP_SECONDS = Gauge(
+    "app_startup_seconds",
+    "Seconds spent in each startup phase (imports, init, lazy client creation)",
+    ["phase"],
+    multiprocess_mode="max",
+)
+
+# Stages timed during the current request; None outside requests (e.g. background ingestion)
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage_timer(operation: str, stage: str) -> Iterator[None]:
+    """
+    Time a block as `stage` of `operation`: observed in the histogram, and recorded for the
+    Server-Timing header when running inside a request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(operation, stage, time.perf_counter() - start)
+
+
+def observe_stage(operation: str, stage: str, elapsed: float):
+    """Record a stage measured by the caller (e.g. one spanning several yields of a stream)."""
+    STAGE_SECONDS.labels(operation, stage).observe(elapsed)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((f"{operation}.{stage}", elapsed))
+
+
+def count_tokens(operation: str, kind: str, tokens: int):
+    if tokens > 0:
+        TOKENS.labels(operation, kind).inc(tokens)
+
+
+def count_chunks(operation: str, kind: str, chunks: int):
+    if chunks > 0:
+        CHUNKS.labels(operation, kind).inc(chunks)
+
+
+_startup_phases: Dict[str, float] = {}
+_startup_lock = threading.Lock()
+
+
+def observe_startup(phase: str, elapsed: float):
+    """Record the duration of a startup phase (lazy phases such as client creation are recorded when they happen)."""
+    with _startup_lock:
+        _startup_phases[phase] = elapsed
+    STARTUP_SECONDS.labels(phase).set(elapsed)
+
+
+def startup_report() -> Dict[str, float]:
+    with _startup_lock:
+        return {phase: round(elapsed, 3) for phase, elapsed in _startup_phases.items()}
+
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    """Start collecting stage timings for the current request and return the (shared, mutable) list."""
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """Format timings as a Server-Timing value; repeated stages are summed."""
+    durations = {}
+    for name, elapsed in timings:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def latest_metrics() -> Tuple[bytes, str]:
+    """Exposition of this process's metrics, or of every worker's in multiprocess mode."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_worker_exited():
+    """Drop this worker's live gauge files in multiprocess mode (its counters and histograms keep counting)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), PROMETHEUS_MULTIPROC_DIR)
@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.metrics import observe_startup
+
+"""
+Process-wide registry of model clients, created on first use.
+
+The Gemini SDKs are slow to import (langchain_google_genai alone pulls in most of the Google API
+client), so nothing here imports them at module load. `get_chat_model()` returns one shared chat
+client per model for the whole process (the API routes and RAGPipeline use the same one);
+embedding providers are shared the same way by `embedding_providers.get_embedding_provider()`.
+Creating a client records its cost as a startup phase (`client:<name>`).
+"""
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "2048"))
+
+_chat_models: Dict[str, Any] = {}
+_lock = threading.Lock()
+_configured_key: Optional[str] = None
+
+
+def configure_gemini(api_key: Optional[str] = None):
+    """
+    Configure google.generativeai once per key (imports it on first call).
+    """
+    global _configured_key
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("Google API key is required. Set GOOGLE_API_KEY environment variable or pass api_key parameter.")
+    with _lock:
+        if _configured_key == api_key:
+            return
+        started = time.perf_counter()
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        _configured_key = api_key
+    observe_startup("client:genai", time.perf_counter() - started)
+
+
+def get_chat_model(model: str = LLM_MODEL):
+    """
+    The shared chat client for `model`, created on first use.
+    """
+    chat_model = _chat_models.get(model)
+    if chat_model is not None:
+        return chat_model
+    configure_gemini()
+    with _lock:
+        chat_model = _chat_models.get(model)
+        if chat_model is None:
+            started = time.perf_counter()
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            chat_model = ChatGoogleGenerativeAI(
+                model=model,
+                convert_system_message_to_human=True,
+                temperature=LLM_TEMPERATURE,
+                max_output_tokens=LLM_MAX_OUTPUT_TOKENS,
+            )
+            _chat_models[model] = chat_model
+            elapsed = time.perf_counter() - started
+            observe_startup(f"client:{model}", elapsed)
+            logging.info(f"Created chat client {model} in {elapsed:.2f}s")
+    return chat_model
+
+
+def ping_chat_model(model: str = LLM_MODEL, timeout: float = 10):
+    """
+    Metadata lookup of the model: verifies key and reachability without spending generation quota.
+    """
+    configure_gemini()
+    import google.generativeai as genai
+
+    return genai.get_model(f"models/{model}", request_options={"timeout": timeout})
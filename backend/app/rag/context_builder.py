@@ -0,0 +1,184 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from app.rag.rate_limiter import estimate_tokens
+
+"""
+Token-budgeted context assembly.
+
+Retrieved chunks go through three steps before they reach the prompt, always in relevance order:
+1. Near-duplicates are dropped: a chunk whose word shingles are mostly contained in an already kept
+   chunk (repeated boilerplate, the same text in two files) adds nothing.
+2. Adjacent chunks of the same file and page are merged. The splitter repeats up to chunk_overlap
+   characters at the start of the next chunk; that shared text is detected and sent once.
+3. The merged passages fill CONTEXT_TOKEN_BUDGET; the passage that crosses the budget is cut at a
+   word boundary (if enough room is left) and everything after it is dropped.
+"""
+
+# Estimated tokens of retrieved text per prompt; 0 disables the limit
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# A chunk is a near-duplicate when this share of its shingles already appears in a kept passage
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Words per shingle
+CONTEXT_SHINGLE_SIZE = 5
+# Shortest prefix/suffix overlap (characters) treated as splitter overlap between adjacent chunks
+CONTEXT_MIN_OVERLAP_CHARS = 20
+# The passage crossing the budget is cut only if at least this many tokens fit; otherwise it is dropped
+CONTEXT_MIN_TRUNCATED_TOKENS = 64
+SEPARATOR = "\n\n"
+
+
+@dataclass
+class ContextReport:
+    """What happened to the retrieved chunks; returned to the client with the answer."""
+    chunks_retrieved: int = 0
+    chunks_used: int = 0
+    duplicates_removed: int = 0
+    chunks_merged: int = 0
+    overlap_chars_removed: int = 0
+    chunks_dropped: int = 0
+    truncated: bool = False
+    context_tokens: int = 0
+    prompt_tokens: int = 0
+    budget_tokens: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+@dataclass
+class _Passage:
+    key: Tuple[Any, Any]
+    text: str
+    docs: List[Document]
+    shingles: Set[int] = field(default_factory=set)
+
+
+def _shingles(text: str, size: int = CONTEXT_SHINGLE_SIZE) -> Set[int]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def _overlap(left: str, right: str, min_chars: int = CONTEXT_MIN_OVERLAP_CHARS) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right` (0 if shorter than min_chars).
+    """
+    if len(left) < min_chars or len(right) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    # Candidate starts of the overlap in left, longest overlap first
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        length = len(left) - start
+        if right.startswith(left[start:]):
+            return length
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _passage_key(doc: Document) -> Tuple[Any, Any]:
+    metadata = doc.metadata or {}
+    return metadata.get("file_id", metadata.get("source")), metadata.get("page")
+
+
+def _try_merge(passage: _Passage, text: str) -> Optional[Tuple[str, int]]:
+    """The merged text and the overlap removed, if `text` directly precedes or follows the passage."""
+    overlap = _overlap(passage.text, text)
+    if overlap:
+        return passage.text + text[overlap:], overlap
+    overlap = _overlap(text, passage.text)
+    if overlap:
+        return text + passage.text[overlap:], overlap
+    return None
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    # estimate_tokens is ~4 characters per token; cut at the last whitespace within the allowance
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip()
+
+
+def build_context(
+    docs: List[Document],
+    budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+) -> Tuple[str, List[Document], ContextReport]:
+    """
+    Assemble the context from docs in relevance order (best first).
+    :param budget_tokens: estimated token limit for the context; 0 means unlimited
+    :return: (context text, docs that contributed to it, report)
+    """
+    report = ContextReport(chunks_retrieved=len(docs), budget_tokens=budget_tokens)
+    passages: List[_Passage] = []
+    for doc in docs:
+        text = doc.page_content.strip()
+        if not text:
+            report.duplicates_removed += 1
+            continue
+        shingles = _shingles(text)
+        if shingles and any(len(shingles & p.shingles) >= dedup_threshold * len(shingles) for p in passages):
+            report.duplicates_removed += 1
+            continue
+        key = _passage_key(doc)
+        target = None
+        for passage in passages:
+            if passage.key != key:
+                continue
+            merged = _try_merge(passage, text)
+            if merged:
+                passage.text, overlap = merged
+                passage.docs.append(doc)
+                passage.shingles |= shingles
+                report.chunks_merged += 1
+                report.overlap_chars_removed += overlap
+                target = passage
+                break
+        if target is None:
+            passages.append(_Passage(key, text, [doc], shingles))
+            continue
+        # The new chunk may bridge two passages (it followed one and precedes another)
+        for other in passages:
+            if other is target or other.key != key:
+                continue
+            merged = _try_merge(target, other.text)
+            if merged:
+                target.text, overlap = merged
+                target.docs.extend(other.docs)
+                target.shingles |= other.shingles
+                report.chunks_merged += len(other.docs)
+                report.overlap_chars_removed += overlap
+                passages.remove(other)
+                break
+
+    parts: List[str] = []
+    used: List[Document] = []
+    tokens = 0
+    for i, passage in enumerate(passages):
+        cost = estimate_tokens(passage.text) + (estimate_tokens(SEPARATOR) if parts else 0)
+        if budget_tokens <= 0 or tokens + cost <= budget_tokens:
+            parts.append(passage.text)
+            used.extend(passage.docs)
+            tokens += cost
+            continue
+        report.truncated = True
+        remaining = budget_tokens - tokens - (estimate_tokens(SEPARATOR) if parts else 0)
+        if remaining >= CONTEXT_MIN_TRUNCATED_TOKENS:
+            parts.append(_truncate(passage.text, remaining))
+            used.extend(passage.docs)
+        else:
+            report.chunks_dropped += len(passage.docs)
+        report.chunks_dropped += sum(len(p.docs) for p in passages[i + 1:])
+        break
+    context = SEPARATOR.join(parts)
+    report.chunks_used = len(used)
+    report.context_tokens = estimate_tokens(context) if context else 0
+    return context, used, report
@@ -0,0 +1,224 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.concurrency import connect_sqlite, run_blocking
+
+"""
+Persistent, content-addressed embedding cache.
+
+Vectors are keyed by sha256(model name + task + chunk text) and stored in a small SQLite
+file next to the Chroma directory, so re-ingesting an unchanged corpus makes zero calls
+to the embedding provider. The cache is bounded and evicts least-recently-used entries.
+Query vectors are also kept in a small in-process LRU, so a repeated question costs neither an
+API call nor a SQLite round trip.
+"""
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+QUERY_MEMORY_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "2048"))
+# Stores between exact row counts; in between the count is tracked in memory (other workers write too)
+RECOUNT_EVERY = 1000
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        cache_path: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        query_memory_entries: int = QUERY_MEMORY_MAX_ENTRIES,
+    ):
+        """
+        :param underlying: Embeddings implementation that is called on cache misses
+        :param model_name: Embedding model name, part of every cache key
+        :param cache_path: Path of the SQLite cache file
+        :param max_entries: Upper bound on cached vectors; LRU entries are evicted beyond it
+        :param query_memory_entries: Query vectors kept in memory in front of SQLite (0 disables)
+        """
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.query_memory_entries = query_memory_entries
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Query vectors do not depend on the corpus, only on model and text, so they never go stale
+        self._query_memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._conn = connect_sqlite(cache_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_access ON embedding_cache (last_access)")
+        self._conn.commit()
+        self._count = self._exact_count()
+        self._stores_since_count = 0
+
+    def _exact_count(self) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()
+        return count
+
+    def _key(self, text: str, task: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{task}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            changes = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embedding_cache (key, vector, last_access) VALUES (?, ?, ?)", rows)
+            # Only rows that were not there yet count towards the size
+            added = self._conn.total_changes - changes
+            if added < len(rows):
+                # Keys stored meanwhile (by another writer or a concurrent miss): refresh them in place
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET vector = ?, last_access = ? WHERE key = ?",
+                    [(vector, last_access, key) for key, vector, last_access in rows],
+                )
+            self._stores_since_count += 1
+            if self._stores_since_count >= RECOUNT_EVERY:
+                self._count = self._exact_count()
+                self._stores_since_count = 0
+            else:
+                self._count += added
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                evicted = self._conn.execute(
+                    "DELETE FROM embedding_cache WHERE key IN "
+                    "(SELECT key FROM embedding_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,),
+                ).rowcount
+                self._count -= evicted
+                logging.info(f"Embedding cache evicted {evicted} LRU entries (max_entries={self.max_entries})")
+            self._conn.commit()
+
+    def _memory_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._query_memory.get(key)
+            if vector is not None:
+                self._query_memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+            return vector
+
+    def _memory_put(self, key: str, vector: List[float]):
+        if self.query_memory_entries <= 0:
+            return
+        with self._lock:
+            self._query_memory[key] = vector
+            self._query_memory.move_to_end(key)
+            while len(self._query_memory) > self.query_memory_entries:
+                self._query_memory.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t, "document") for t in texts]
+        found = self._lookup(keys)
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        with self._lock:
+            self.hits += len(texts) - sum(1 for k in keys if k in missing)
+            self.misses += sum(1 for k in keys if k in missing)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text, "query")
+        vector = self._memory_get(key)
+        if vector is not None:
+            return vector
+        found = self._lookup([key])
+        if key in found:
+            with self._lock:
+                self.hits += 1
+            self._memory_put(key, found[key])
+            return found[key]
+        with self._lock:
+            self.misses += 1
+        vector = self.underlying.embed_query(text)
+        self._store({key: vector})
+        self._memory_put(key, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t, "document") for t in texts]
+        found = await run_blocking(self._lookup, keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        with self._lock:
+            self.hits += len(texts) - sum(1 for k in keys if k in missing)
+            self.misses += sum(1 for k in keys if k in missing)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await run_blocking(self._store, computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text, "query")
+        vector = self._memory_get(key)
+        if vector is not None:
+            return vector
+        found = await run_blocking(self._lookup, [key])
+        if key in found:
+            with self._lock:
+                self.hits += 1
+            self._memory_put(key, found[key])
+            return found[key]
+        with self._lock:
+            self.misses += 1
+        vector = await self.underlying.aembed_query(text)
+        await run_blocking(self._store, {key: vector})
+        self._memory_put(key, vector)
+        return vector
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            # The tracked row count (resynced every RECOUNT_EVERY stores), not a full-table COUNT(*)
+            size = self._count
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "size": size,
+                "max_entries": self.max_entries,
+                "query_memory_size": len(self._query_memory),
+            }
@@ -0,0 +1,233 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.concurrency import run_blocking
+from app.metrics import observe_startup
+from app.rag.rate_limiter import RateLimitedEmbeddings
+
+"""
+Embedding providers for the RAG pipeline.
+
+Every provider is a LangChain `Embeddings` that also declares the embedding space it produces
+(`model_name`, `dimension`) and how it prefers to be called (`batch_size`, `max_concurrency`).
+The pipeline keys the embedding cache and the Chroma collection on that space, so switching
+providers never mixes vectors from different models in one collection.
+
+- `gemini` (default): Google `models/embedding-001` through the shared embedding rate limiter.
+- `local`: CPU-only ONNX sentence encoder (sentence-transformers style: tokenizer.json + model.onnx,
+  mean pooling, L2 normalisation). Texts are tokenized in parallel, length-sorted and encoded in
+  large NumPy batches on a multi-threaded onnxruntime session; no network on the query path.
+"""
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini").lower()
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+GEMINI_DIMENSIONS = {"models/embedding-001": 768, "models/text-embedding-004": 768}
+# Gemini's batchEmbedContents accepts at most 100 texts per request
+GEMINI_BATCH_SIZE = min(100, int(os.getenv("EMBED_BATCH_SIZE", "100")))
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Directory holding model.onnx and tokenizer.json; if unset they are fetched from the Hugging Face hub once
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "256"))
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", "256"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", str(os.cpu_count() or 1)))
+
+
+class EmbeddingProvider(Embeddings):
+    """Base class for providers; subclasses set model_name and implement embed_documents/embed_query."""
+
+    model_name: str = "unknown"
+    # Preferred texts per embed_documents call and number of calls the pipeline may run at once
+    batch_size: int = 100
+    max_concurrency: int = 4
+
+    @property
+    def dimension(self) -> int:
+        dimension = getattr(self, "_dimension", None)
+        if dimension is None:
+            dimension = len(self.embed_query("dimension probe"))
+            self._dimension = dimension
+        return dimension
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    batch_size = GEMINI_BATCH_SIZE
+
+    def __init__(self, model: str = GEMINI_EMBEDDING_MODEL):
+        self.model_name = model
+        self._dimension = GEMINI_DIMENSIONS.get(model)
+        self._client: Optional[RateLimitedEmbeddings] = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self) -> RateLimitedEmbeddings:
+        # langchain_google_genai takes seconds to import; defer it to the first embedding call
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+                    self._client = RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings(model=self.model_name))
+                    observe_startup(f"client:{self.model_name}", time.perf_counter() - started)
+        return self._client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.client.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.client.aembed_query(text)
+
+
+class LocalOnnxEmbeddings(EmbeddingProvider):
+    batch_size = LOCAL_EMBEDDING_BATCH_SIZE
+    # One session already uses every core; parallel calls would only oversubscribe them
+    max_concurrency = 1
+
+    def __init__(
+        self,
+        model: str = LOCAL_EMBEDDING_MODEL,
+        model_dir: Optional[str] = LOCAL_EMBEDDING_MODEL_DIR,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        max_length: int = LOCAL_EMBEDDING_MAX_LENGTH,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+    ):
+        """
+        :param model: Hugging Face repo id of a sentence-transformers model with an ONNX export
+        :param model_dir: Local directory with model.onnx and tokenizer.json (skips the download)
+        :param batch_size: Texts per onnxruntime call
+        :param max_length: Token limit per text; longer texts are truncated
+        :param threads: onnxruntime intra-op threads
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path, tokenizer_path = self._resolve_files(model, model_dir)
+        self.model_name = f"local/{model}"
+        self.batch_size = max(1, batch_size)
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, threads)
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._dimension = None
+        output_dim = self.session.get_outputs()[0].shape[-1]
+        if isinstance(output_dim, int):
+            self._dimension = output_dim
+        logging.info(f"Loaded local embedding model {model} ({model_path}, threads={threads}, batch_size={self.batch_size})")
+
+    @staticmethod
+    def _resolve_files(model: str, model_dir: Optional[str]) -> Tuple[str, str]:
+        if model_dir:
+            candidates = [os.path.join(model_dir, "model.onnx"), os.path.join(model_dir, "onnx", "model.onnx")]
+            model_path = next((p for p in candidates if os.path.exists(p)), candidates[0])
+            return model_path, os.path.join(model_dir, "tokenizer.json")
+        from huggingface_hub import hf_hub_download
+
+        return hf_hub_download(model, "onnx/model.onnx"), hf_hub_download(model, "tokenizer.json")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.zeros((len(texts), width), dtype=np.int64)
+        attention_mask = np.zeros((len(texts), width), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.attention_mask)] = encoding.attention_mask
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+        # Mean pooling over real tokens, then L2 normalisation
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts into a float32 matrix. Texts are sorted by length so each batch pads to a similar width.
+        """
+        if not texts:
+            return np.zeros((0, self._dimension or 0), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        result: Optional[np.ndarray] = None
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            vectors = self._encode_batch([texts[i] for i in idx])
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[idx] = vectors
+        if self._dimension is None:
+            self._dimension = result.shape[1]
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await run_blocking(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await run_blocking(self.embed_query, text)
+
+
+_providers: Dict[str, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    """
+    Return the process-wide provider for `name` ('gemini' or 'local'), created on first use.
+    """
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            if name == "gemini":
+                provider = GeminiEmbeddingProvider()
+            elif name == "local":
+                provider = LocalOnnxEmbeddings()
+            else:
+                raise ValueError(f"Unknown EMBEDDING_PROVIDER: {name} (expected 'gemini' or 'local')")
+            _providers[name] = provider
+        return provider
+
+
+def embedding_space(embeddings: Embeddings) -> Tuple[str, int]:
+    """
+    (model name, dimension) of any Embeddings; providers declare them, anything else is probed once.
+    """
+    model_name = getattr(embeddings, "model_name", None) or embeddings.__class__.__name__
+    dimension = getattr(embeddings, "dimension", None)
+    if not isinstance(dimension, int):
+        dimension = len(embeddings.embed_query("dimension probe"))
+    return model_name, dimension
+
+
+def collection_name_for(model_name: str, dimension: int) -> str:
+    """
+    Chroma collection for an embedding space. The original Gemini space keeps the legacy
+    'langchain' collection so existing data stays readable.
+    """
+    if model_name == GEMINI_EMBEDDING_MODEL:
+        return "langchain"
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", model_name).strip("_").lower()
+    return f"chunks_{slug}"[:54].rstrip("_") + f"_{dimension}"
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from app.concurrency import connect_sqlite
+
+"""
+Sparse keyword index (SQLite FTS5 with BM25 ranking) kept next to the Chroma collection.
+
+Every chunk written to Chroma is also written here under the same id, so dense and sparse
+hits can be fused by id. Metadata is stored as JSON so the simple Chroma-style filters used
+by the app (equality, $eq, $in, $and) can be applied to keyword queries too. Each row also records
+its vector store shard, so dropping a shard is one DELETE here.
+"""
+
+
+class UnsupportedFilter(ValueError):
+    """Raised when a metadata filter cannot be translated to SQL for the keyword index."""
+
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _match_expression(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 OR-query of quoted terms (quoting neutralises FTS syntax)."""
+    terms = list(dict.fromkeys(t.lower() for t in _TOKEN_RE.findall(text)))
+    if not terms:
+        return None
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def _filter_sql(metadata_filter: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    for key, value in metadata_filter.items():
+        if key == "$and":
+            for sub in value:
+                sql, sub_params = _filter_sql(sub)
+                clauses.append(sql)
+                params.extend(sub_params)
+            continue
+        if key.startswith("$") or not re.fullmatch(r"[A-Za-z0-9_]+", key):
+            raise UnsupportedFilter(f"Unsupported filter key: {key}")
+        column = f"json_extract(metadata, '$.{key}')"
+        if isinstance(value, dict):
+            if len(value) != 1:
+                raise UnsupportedFilter(f"Unsupported filter for {key}: {value}")
+            op, operand = next(iter(value.items()))
+            if op == "$eq":
+                clauses.append(f"{column} = ?")
+                params.append(operand)
+            elif op == "$in":
+                if not operand:
+                    clauses.append("0")
+                else:
+                    clauses.append(f"{column} IN ({','.join('?' * len(operand))})")
+                    params.extend(operand)
+            else:
+                raise UnsupportedFilter(f"Unsupported filter operator: {op}")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return (" AND ".join(f"({c})" for c in clauses) or "1"), params
+
+
+_CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+    "chunk_id UNINDEXED, file_id UNINDEXED, content, metadata UNINDEXED, shard UNINDEXED, "
+    "tokenize = 'porter unicode61')"
+)
+
+
+class KeywordIndex:
+    def __init__(self, path: str, shard_for: Optional[Callable[[Dict[str, Any]], str]] = None):
+        """
+        :param path: SQLite file holding the FTS5 table
+        :param shard_for: maps chunk metadata to its vector store shard (see sharding.ShardRouter.shard_for)
+        """
+        self.path = path
+        self.shard_for = shard_for or (lambda metadata: "default")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks_fts)")]
+        if columns and "shard" not in columns:
+            self._add_shard_column()
+        self._conn.execute(_CREATE_TABLE.format(name="chunks_fts"))
+        self._conn.commit()
+
+    def _add_shard_column(self, page_size: int = 5000):
+        """
+        FTS5 tables cannot be altered: copy an index from before shards were recorded into a new table.
+        """
+        self._conn.execute("ALTER TABLE chunks_fts RENAME TO chunks_fts_old")
+        self._conn.execute(_CREATE_TABLE.format(name="chunks_fts"))
+        cursor = self._conn.execute("SELECT chunk_id, file_id, content, metadata FROM chunks_fts_old")
+        while True:
+            rows = cursor.fetchmany(page_size)
+            if not rows:
+                break
+            self._conn.executemany(
+                "INSERT INTO chunks_fts (chunk_id, file_id, content, metadata, shard) VALUES (?, ?, ?, ?, ?)",
+                [(*row, self.shard_for(json.loads(row[3] or "{}"))) for row in rows],
+            )
+        self._conn.execute("DROP TABLE chunks_fts_old")
+        self._conn.commit()
+        logging.info(f"Added shard column to keyword index {self.path}")
+
+    def count(self) -> int:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM chunks_fts").fetchone()
+        return n
+
+    def add(self, ids: Sequence[str], docs: Sequence[Document]):
+        """Insert or replace chunks by id."""
+        if not ids:
+            return
+        rows = [
+            (chunk_id, doc.metadata.get("file_id"), doc.page_content, json.dumps(doc.metadata, default=str), self.shard_for(doc.metadata))
+            for chunk_id, doc in zip(ids, docs)
+        ]
+        with self._lock:
+            self._delete_ids_locked(ids)
+            self._conn.executemany(
+                "INSERT INTO chunks_fts (chunk_id, file_id, content, metadata, shard) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def _delete_ids_locked(self, ids: Sequence[str]):
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            self._conn.execute(f"DELETE FROM chunks_fts WHERE chunk_id IN ({','.join('?' * len(part))})", part)
+
+    def delete_ids(self, ids: Sequence[str]):
+        with self._lock:
+            self._delete_ids_locked(ids)
+            self._conn.commit()
+
+    def delete_where(self, where: Dict[str, Any]):
+        sql, params = _filter_sql(where)
+        with self._lock:
+            self._conn.execute(f"DELETE FROM chunks_fts WHERE {sql}", params)
+            self._conn.commit()
+
+    def delete_shard(self, shard: str) -> int:
+        """Delete every chunk of a vector store shard; returns the number deleted."""
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM chunks_fts WHERE shard = ?", (shard,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks_fts")
+            self._conn.commit()
+
+    def search(self, query: str, k: int, metadata_filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        """
+        BM25-ranked keyword search. Returns (Document, score) pairs, best first; higher score is better.
+        Raises UnsupportedFilter if metadata_filter uses operators the index cannot evaluate.
+        """
+        match = _match_expression(query)
+        if not match or k <= 0:
+            return []
+        where_sql, params = _filter_sql(metadata_filter or {})
+        sql = (
+            "SELECT chunk_id, content, metadata, bm25(chunks_fts) AS rank FROM chunks_fts "
+            f"WHERE chunks_fts MATCH ? AND {where_sql} ORDER BY rank LIMIT ?"
+        )
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, [match, *params, k]).fetchall()
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Keyword index query failed for {match!r}: {e}")
+                return []
+        # FTS5's bm25() is negative, lower is better
+        return [
+            (Document(id=chunk_id, page_content=content, metadata=json.loads(metadata)), -rank)
+            for chunk_id, content, metadata, rank in rows
+        ]
@@ -0,0 +1,273 @@
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
+
+"""
+Document parsing and splitting, optionally on a process pool.
+
+Parsing (pypdf text extraction, unstructured) and splitting are CPU-bound and hold the GIL, so
+`ParsePool` runs them in worker processes. Large PDFs are cut into page ranges that are parsed
+by different workers at once; results are yielded in document order as soon as each range is
+done, so the embedding stage starts on the first pages while later ones are still being parsed.
+Only a bounded number of tasks is in flight per file, which keeps memory flat for huge PDFs.
+
+Loaders are imported when their extension is first used (LOADERS), so importing this module
+does not pull in pypdf, unstructured and friends.
+
+CSV, XLSX and TXT files are streamed in the calling thread instead: rows (or text blocks) are read
+lazily and split a batch at a time, so only one batch of a multi-gigabyte file is ever in memory.
+"""
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+# Worker processes for parsing; 0 parses in the calling thread
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Pages per PDF parse task
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# CSV/XLSX rows (or TXT blocks) split per streamed batch
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "500"))
+# TXT files larger than this are read in blocks of about this many characters, cut at paragraph breaks
+TEXT_BLOCK_CHARS = int(os.getenv("TEXT_BLOCK_CHARS", str(4 * 1024 * 1024)))
+STREAMED_EXTENSIONS = {'.csv', '.xlsx', '.txt'}
+
+
+# Extension -> (module, loader class), imported on first use
+LOADERS = {
+    '.pdf': ("langchain_community.document_loaders.pdf", "PyPDFLoader"),
+    '.docx': ("langchain_community.document_loaders.word_document", "UnstructuredWordDocumentLoader"),
+    '.txt': ("langchain_community.document_loaders.text", "TextLoader"),
+    '.csv': ("langchain_community.document_loaders.csv_loader", "CSVLoader"),
+    '.xlsx': ("langchain_community.document_loaders.excel", "UnstructuredExcelLoader"),
+}
+
+
+def loader_class(ext: str):
+    """
+    The loader class for a file extension, imported the first time it is needed.
+    """
+    if ext not in LOADERS:
+        raise ValueError(f"Unsupported file extension: {ext}")
+    module_name, class_name = LOADERS[ext]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def load_document(file_path: str) -> List[Document]:
+    ext = os.path.splitext(file_path)[-1].lower()
+    return loader_class(ext)(file_path).load()
+
+
+def get_text_splitter(file_path: str, chunking_strategy: str = "auto"):
+    """
+    Use MarkdownHeaderTextSplitter if markdown, else fallback to RecursiveCharacterTextSplitter.
+    """
+    ext = os.path.splitext(file_path)[-1].lower()
+    if chunking_strategy == "header" or (chunking_strategy == "auto" and ext in ['.md', '.markdown']):
+        try:
+            return MarkdownHeaderTextSplitter(headers_to_split_on=["#", "##", "###"], chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        except Exception as e:
+            logging.warning(f"Header splitter failed: {e}, falling back to character splitter.")
+    # Fallback
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def parse_file(file_path: str, chunking_strategy: str = "auto") -> List[Document]:
+    """
+    Load and split a whole file (worker task for everything except PDFs).
+    """
+    return get_text_splitter(file_path, chunking_strategy).split_documents(load_document(file_path))
+
+
+def _text_blocks(file_path: str, block_chars: int = TEXT_BLOCK_CHARS) -> Iterator[Document]:
+    """
+    TextLoader equivalent that reads large files block by block. A file that fits in one block gives exactly
+    TextLoader's document; larger ones are cut at the last paragraph (or line) break of each block.
+    """
+    metadata = {"source": str(file_path)}
+    with open(file_path) as f:
+        carry = ""
+        while True:
+            block = f.read(block_chars)
+            text = carry + block
+            if len(block) < block_chars:
+                # End of file
+                if text:
+                    yield Document(page_content=text, metadata=dict(metadata))
+                return
+            cut = text.rfind("\n\n")
+            if cut <= 0:
+                cut = text.rfind("\n")
+            if cut <= 0:
+                carry = text
+                continue
+            carry = text[cut:]
+            yield Document(page_content=text[:cut], metadata=dict(metadata))
+
+
+def _xlsx_rows(file_path: str) -> Iterator[Document]:
+    """
+    One document per worksheet row ("header: value" lines, like CSVLoader), read with openpyxl in read-only mode.
+    Without openpyxl, falls back to UnstructuredExcelLoader, which loads the whole workbook.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        logging.info("openpyxl is not installed; loading the whole workbook with UnstructuredExcelLoader")
+        yield from loader_class('.xlsx')(file_path).lazy_load()
+        return
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            names = [str(h) if h is not None else f"column_{i + 1}" for i, h in enumerate(header)]
+            for row_number, row in enumerate(rows, start=2):
+                if all(value is None for value in row):
+                    continue
+                content = "\n".join(f"{name}: {'' if value is None else value}" for name, value in zip(names, row))
+                yield Document(page_content=content, metadata={"source": file_path, "sheet": sheet.title, "row": row_number})
+    finally:
+        workbook.close()
+
+
+def lazy_documents(file_path: str) -> Iterator[Document]:
+    """
+    The file's documents, read lazily where the format allows it (CSV rows, XLSX rows, TXT blocks).
+    """
+    ext = os.path.splitext(file_path)[-1].lower()
+    if ext == '.csv':
+        return loader_class('.csv')(file_path).lazy_load()
+    if ext == '.xlsx':
+        return _xlsx_rows(file_path)
+    if ext == '.txt':
+        return _text_blocks(file_path)
+    return iter(load_document(file_path))
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_streamed_splits(file_path: str, chunking_strategy: str = "auto", batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[List[Document]]:
+    """
+    Split the file a batch of documents at a time; the next batch is read only when the caller asks for it.
+    """
+    splitter = get_text_splitter(file_path, chunking_strategy)
+    for docs in _batched(lazy_documents(file_path), max(1, batch_rows)):
+        yield splitter.split_documents(docs)
+
+
+def pdf_page_count(file_path: str) -> int:
+    import pypdf
+
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def parse_pdf_pages(file_path: str, start: int, stop: int, chunking_strategy: str = "auto") -> List[Document]:
+    """
+    Extract and split pages [start, stop) of a PDF (worker task). Page text and metadata match PyPDFLoader's,
+    so chunk hashes do not depend on how a file was cut into ranges.
+    """
+    import pypdf
+    from langchain_community.document_loaders.parsers.pdf import _purge_metadata, _validate_metadata
+
+    reader = pypdf.PdfReader(file_path)
+    total_pages = len(reader.pages)
+    # Same document-level metadata as PyPDFParser: PDF info dict (normalized keys and dates) plus source
+    doc_metadata = _purge_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": file_path, "total_pages": total_pages}
+    )
+    docs = []
+    for page_number in range(start, min(stop, total_pages)):
+        text = reader.pages[page_number].extract_text(extraction_mode="plain").strip()
+        docs.append(Document(
+            page_content=text,
+            metadata=_validate_metadata(doc_metadata | {"page": page_number, "page_label": reader.page_labels[page_number]}),
+        ))
+    # The splitter works per document, so splitting a range gives the same chunks as splitting the whole file
+    return get_text_splitter(file_path, chunking_strategy).split_documents(docs)
+
+
+class ParsePool:
+    """
+    Process pool for parse tasks, started on first use. Uses the spawn start method: forking a
+    process that runs Chroma and executor threads is not safe.
+    """
+
+    def __init__(self, workers: int = PARSE_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+        """
+        :param workers: worker processes; 0 parses in the calling thread
+        :param pages_per_task: PDF pages per task
+        """
+        self.workers = max(0, workers)
+        self.pages_per_task = max(1, pages_per_task)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+                logging.info(f"Started parse pool with {self.workers} worker processes")
+            return self._executor
+
+    def _tasks(self, file_path: str, chunking_strategy: str) -> List[Tuple]:
+        if os.path.splitext(file_path)[-1].lower() != ".pdf":
+            return [(parse_file, file_path, chunking_strategy)]
+        pages = pdf_page_count(file_path)
+        return [
+            (parse_pdf_pages, file_path, start, start + self.pages_per_task, chunking_strategy)
+            for start in range(0, max(pages, 1), self.pages_per_task)
+        ]
+
+    def iter_splits(self, file_path: str, chunking_strategy: str = "auto", prefetch: Optional[int] = None) -> Iterator[List[Document]]:
+        """
+        Yield the file's splits batch by batch, in document order.
+        :param prefetch: tasks of this file in flight at once (defaults to the number of workers)
+        """
+        if os.path.splitext(file_path)[-1].lower() in STREAMED_EXTENSIONS:
+            # Row/block streaming is bounded by reading, not CPU: read lazily in the caller
+            yield from iter_streamed_splits(file_path, chunking_strategy)
+            return
+        tasks = self._tasks(file_path, chunking_strategy)
+        if self.workers == 0:
+            for fn, *args in tasks:
+                yield fn(*args)
+            return
+        executor = self._get_executor()
+        limit = max(1, prefetch or self.workers)
+        pending: Deque[Future] = deque()
+        next_task = 0
+        try:
+            while next_task < len(tasks) or pending:
+                while next_task < len(tasks) and len(pending) < limit:
+                    fn, *args = tasks[next_task]
+                    pending.append(executor.submit(fn, *args))
+                    next_task += 1
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -1,133 +1,687 @@
 import os
-from typing import List, Dict, Any, Optional
-from langchain_community.document_loaders import PyPDFLoader, UnstructuredWordDocumentLoader, TextLoader, CSVLoader, UnstructuredExcelLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter, MarkdownHeaderTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+import hashlib
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, Collection, Iterable, Iterator, Set, Tuple, Union
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 import logging
 import asyncio
-import google.generativeai as genai
-import time
-from tenacity import retry, stop_after_attempt, wait_exponential
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from app.rag.clients import LLM_MODEL, get_chat_model
+from app.rag.embedding_cache import CachedEmbeddings
+from app.rag.embedding_providers import (
+    EMBEDDING_PROVIDER,
+    GEMINI_EMBEDDING_MODEL,
+    collection_name_for,
+    embedding_space,
+    get_embedding_provider,
+)
+from app.rag.keyword_index import KeywordIndex, UnsupportedFilter
+from app.rag.sharding import ShardRouter
+from app.rag.parsing import PARSE_WORKERS, ParsePool, load_document
+from app.rag.quantized_store import QuantizedVectorStore
+from app.rag.reranker import RERANK_CANDIDATES, CachedReranker, Reranker, get_reranker, rerank
+from app.rag.retrieval_cache import RetrievalCache
+from app.rag.vectorstore_manager import VectorStoreManager
+from app.concurrency import run_blocking
+from app.metrics import count_chunks, count_tokens, stage_timer
+from app.rag.rate_limiter import estimate_tokens
 
 """
 RAG pipeline using Google's Gemini models (free version) for both embeddings and chat
 """
 
 SUPPORTED_EXTENSIONS = {'.pdf', '.docx', '.txt', '.csv', '.xlsx'}
+EMBEDDING_MODEL = GEMINI_EMBEDDING_MODEL
+# Defaults for embeddings that do not declare batch_size / max_concurrency (providers do)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Reciprocal-rank fusion constant and per-retriever candidate over-fetch for hybrid search
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "2"))
+# 'chroma' (HNSW) or 'quantized' (memory-mapped int8 vectors with exact re-scoring, see quantized_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
+class IngestCancelled(Exception):
+    """Raised by RAGPipeline.ingest when its should_cancel callback returns True."""
+
+@dataclass
+class IngestResult:
+    """Outcome of an ingest: the file's current chunks as (chunk_id, chunk_hash, ordinal) plus diff counts."""
+    chunks: List[Tuple[str, str, int]] = field(default_factory=list)
+    added: int = 0
+    unchanged: int = 0
+    removed: int = 0
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _chunk_id(owner: str, text_hash: str, occurrence: int) -> str:
+    """
+    Deterministic chunk ids: the same text in the same file always gets the same id, so a
+    re-upload only has to embed chunks whose content changed. Repeated text gets an occurrence suffix.
+    """
+    return hashlib.sha256(f"{owner}:{text_hash}:{occurrence}".encode("utf-8")).hexdigest()
+
+@dataclass
+class IngestSource:
+    """One source of a batch ingest: its split batches in document order, plus per-source callbacks."""
+    split_batches: Iterable[List[Document]]
+    source: str
+    previous_chunk_ids: Optional[Collection[str]] = None
+    progress_callback: Optional[Callable[[int, int], None]] = None
+    should_cancel: Optional[Callable[[], bool]] = None
+
+@dataclass
+class _SourceState:
+    planner: Optional["_ChunkPlanner"] = None
+    done: int = 0
+    total: int = 0
+    # New chunks buffered or being embedded and written
+    outstanding: int = 0
+    parsed: bool = False
+    error: Optional[Exception] = None
+
+class _ChunkPlanner:
+    """
+    Incremental diff of a file's chunks against the chunk ids of its previous version. Fed batch by batch
+    in document order, so ids (which count earlier occurrences of the same text) match a one-shot diff.
+    """
+
+    def __init__(self, source: str, previous_chunk_ids: Optional[Collection[str]]):
+        self.source = source
+        self.owner: Optional[str] = None
+        self.previous = set(previous_chunk_ids or ())
+        self.kept: Set[str] = set()
+        self.result = IngestResult()
+        self._occurrences: Dict[str, int] = {}
+
+    def add(self, splits: List[Document]) -> Tuple[List[Document], List[str], List[Document], List[str]]:
+        if splits and self.owner is None:
+            self.owner = str(splits[0].metadata.get("file_id", self.source))
+        new_docs, new_ids, kept_docs, kept_ids = [], [], [], []
+        for doc in splits:
+            h = chunk_hash(doc.page_content)
+            occurrence = self._occurrences.get(h, 0)
+            self._occurrences[h] = occurrence + 1
+            chunk_id = _chunk_id(self.owner, h, occurrence)
+            self.result.chunks.append((chunk_id, h, len(self.result.chunks)))
+            if chunk_id in self.previous:
+                self.kept.add(chunk_id)
+                kept_docs.append(doc)
+                kept_ids.append(chunk_id)
+            else:
+                new_docs.append(doc)
+                new_ids.append(chunk_id)
+        self.result.added += len(new_ids)
+        self.result.unchanged += len(kept_ids)
+        return new_docs, new_ids, kept_docs, kept_ids
+
+    def removed_ids(self) -> List[str]:
+        removed = [chunk_id for chunk_id in self.previous if chunk_id not in self.kept]
+        self.result.removed = len(removed)
+        return removed
 
 class RAGPipeline:
-    def __init__(self, vector_db_path: str = "./chroma_db", chunking_strategy: str = "auto", api_key: str = None):
+    def __init__(
+        self,
+        vector_db_path: str = "./chroma_db",
+        chunking_strategy: str = "auto",
+        api_key: str = None,
+        embedding_cache_path: str = None,
+        keyword_index_path: str = None,
+        embed_batch_size: Optional[int] = None,
+        embed_concurrency: Optional[int] = None,
+        embeddings: Optional[Embeddings] = None,
+        llm: Optional[BaseChatModel] = None,
+        parse_workers: Optional[int] = None,
+        reranker: Optional[Reranker] = None,
+        rerank_candidates: int = RERANK_CANDIDATES,
+        vector_backend: str = VECTOR_BACKEND,
+    ):
         """
         :param vector_db_path: Path for ChromaDB persistence
         :param chunking_strategy: 'auto', 'header', or 'character'. If 'auto', use header-based for markdown, otherwise fallback.
         :param api_key: Google API key for Gemini models
+        :param embedding_cache_path: SQLite file for the embedding cache (defaults to a sibling of vector_db_path)
+        :param keyword_index_path: SQLite file for the BM25 keyword index (defaults to a sibling of vector_db_path)
+        :param embed_batch_size: Chunks per embedding request during ingest (defaults to the provider's batch_size)
+        :param embed_concurrency: Embedding requests in flight at once during ingest (1 = sequential; defaults to
+            EMBED_CONCURRENCY capped at the provider's max_concurrency)
+        :param embeddings: Embedding provider; defaults to get_embedding_provider() (EMBEDDING_PROVIDER=gemini|local)
+        :param llm: Chat model to use instead of the shared Gemini client (clients.get_chat_model)
+        :param parse_workers: Parse worker processes (defaults to PARSE_WORKERS; 0 parses in the ingesting thread)
+        :param reranker: Scorer for retrieval candidates; defaults to get_reranker() (RERANKER=none|local, none disables)
+        :param rerank_candidates: Fused candidates passed to the reranker (at least k)
+        :param vector_backend: 'chroma' or 'quantized' (int8 vectors memory-mapped next to vector_db_path)
         """
-        if not api_key:
-            api_key = os.getenv("GOOGLE_API_KEY")
+        if llm is None or (embeddings is None and EMBEDDING_PROVIDER == "gemini"):
             if not api_key:
-                raise ValueError("Google API key is required. Set GOOGLE_API_KEY environment variable or pass api_key parameter.")
-        
-        # Configure Gemini
-        genai.configure(api_key=api_key)
-        
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise ValueError("Google API key is required. Set GOOGLE_API_KEY environment variable or pass api_key parameter.")
+            # The Gemini clients read the key from the environment when they are first created
+            os.environ.setdefault("GOOGLE_API_KEY", api_key)
+
         self.vector_db_path = vector_db_path
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-        self.vectorstore = Chroma(persist_directory=self.vector_db_path, embedding_function=self.embeddings)
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
-            convert_system_message_to_human=True,
-            temperature=0.7,
-            max_output_tokens=2048,
-        )
+        if not embedding_cache_path:
+            embedding_cache_path = os.path.join(os.path.dirname(os.path.abspath(vector_db_path)), "embedding_cache.db")
+        self.embedding_provider = embeddings if embeddings is not None else get_embedding_provider()
+        embedding_model, self.embedding_dimension = embedding_space(self.embedding_provider)
+        self.embedding_model = embedding_model
+        # Both ingest and query embedding go through the cache (keyed on the model name);
+        # only cache misses reach the provider
+        self.embeddings = CachedEmbeddings(self.embedding_provider, model_name=embedding_model, cache_path=embedding_cache_path)
+        # Each embedding space gets its own collection (and keyword index mirroring it)
+        collection_name = collection_name_for(embedding_model, self.embedding_dimension)
+        if not keyword_index_path:
+            index_file = "keyword_index.db" if collection_name == "langchain" else f"keyword_index_{collection_name}.db"
+            keyword_index_path = os.path.join(os.path.dirname(os.path.abspath(vector_db_path)), index_file)
+        # Only the Chroma backend is sharded; the keyword index records each chunk's shard
+        self.router = ShardRouter() if vector_backend == "chroma" else ShardRouter("none")
+        self.keyword_index = KeywordIndex(keyword_index_path, shard_for=self.router.shard_for)
+        if vector_backend == "quantized":
+            # Same interface as VectorStoreManager; one directory per embedding space
+            self.store = QuantizedVectorStore(
+                os.path.join(os.path.dirname(os.path.abspath(vector_db_path)), "quantized", collection_name),
+                self.embeddings,
+                self.keyword_index,
+                collection_name=collection_name,
+                embedding_model=embedding_model,
+                embedding_dimension=self.embedding_dimension,
+            )
+        elif vector_backend == "chroma":
+            # One Chroma client and collection for the life of the process; deletes and resets never reopen it
+            self.store = VectorStoreManager(
+                self.vector_db_path,
+                self.embeddings,
+                self.keyword_index,
+                collection_name=collection_name,
+                embedding_model=embedding_model,
+                embedding_dimension=self.embedding_dimension,
+                router=self.router,
+            )
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND: {vector_backend} (expected 'chroma' or 'quantized')")
+        # Dense and sparse queries run side by side
+        self._retrieval_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieve")
+        # None: the shared client from the registry, created on first use
+        self._llm = llm
         self.chunking_strategy = chunking_strategy
-        logging.info(f"Initialized RAGPipeline with Gemini free tier models (chunking_strategy={chunking_strategy})")
+        self.parse_pool = ParsePool(PARSE_WORKERS if parse_workers is None else parse_workers)
+        if reranker is None:
+            reranker = get_reranker()
+        elif not isinstance(reranker, CachedReranker):
+            reranker = CachedReranker(reranker)
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        # Results tagged with the store's corpus version; any write makes them unservable
+        self.retrieval_cache = RetrievalCache()
+        self.embed_batch_size = max(1, embed_batch_size or getattr(self.embedding_provider, "batch_size", EMBED_BATCH_SIZE))
+        if embed_concurrency is None:
+            embed_concurrency = min(EMBED_CONCURRENCY, getattr(self.embedding_provider, "max_concurrency", EMBED_CONCURRENCY))
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.warmed_up = False
+        logging.info(f"Initialized RAGPipeline with {embedding_model} embeddings and {self._llm.__class__.__name__ if self._llm is not None else LLM_MODEL} (chunking_strategy={chunking_strategy})")
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
-        """Retry embedding with exponential backoff for rate limits"""
-        try:
-            return self.embeddings.embed_documents(texts)
-        except Exception as e:
-            if "quota" in str(e).lower() or "rate" in str(e).lower():
-                logging.warning(f"Rate limit hit, retrying: {e}")
-                raise  # Retry
-            raise  # Don't retry other errors
+    @property
+    def llm(self):
+        return self._llm if self._llm is not None else get_chat_model()
 
-    def _get_text_splitter(self, docs, file_path: str):
+    def warm_up(self):
         """
-        Use MarkdownHeaderTextSplitter if markdown, else fallback to RecursiveCharacterTextSplitter.
+        Open the vector store and backfill the keyword index if it is empty. Deferred from __init__ so importing
+        the app stays cheap; run at startup in the background (every store call also opens it on demand).
         """
-        ext = os.path.splitext(file_path)[-1].lower()
-        if self.chunking_strategy == "header" or (self.chunking_strategy == "auto" and ext in ['.md', '.markdown']):
-            try:
-                return MarkdownHeaderTextSplitter(headers_to_split_on=["#", "##", "###"], chunk_size=1000, chunk_overlap=100)
-            except Exception as e:
-                logging.warning(f"Header splitter failed: {e}, falling back to character splitter.")
-        # Fallback
-        return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        self.store.open()
+        if self.keyword_index.count() == 0:
+            self.rebuild_keyword_index()
+        self.warmed_up = True
+
+    @property
+    def vectorstore(self):
+        """The current Chroma collection wrapper (replaced by clear(); do not hold on to it)."""
+        return self.store.vectorstore
 
     def load_document(self, file_path: str) -> List[Document]:
-        ext = os.path.splitext(file_path)[-1].lower()
-        if ext == '.pdf':
-            loader = PyPDFLoader(file_path)
-        elif ext == '.docx':
-            loader = UnstructuredWordDocumentLoader(file_path)
-        elif ext == '.txt':
-            loader = TextLoader(file_path)
-        elif ext == '.csv':
-            loader = CSVLoader(file_path)
-        elif ext == '.xlsx':
-            loader = UnstructuredExcelLoader(file_path)
-        else:
-            raise ValueError(f"Unsupported file extension: {ext}")
-        docs = loader.load()
-        return docs
+        return load_document(file_path)
 
-    def ingest(self, file_path: str, metadata: dict = None):
+    def ingest(
+        self,
+        file_path: str,
+        metadata: dict = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        previous_chunk_ids: Optional[Collection[str]] = None,
+    ) -> IngestResult:
         """
         Ingests a file using adaptive chunking (header-based for markdown, otherwise character-based).
+        Parsing runs on the parse pool (large PDFs split into page ranges across worker processes) and chunks are
+        embedded as soon as their part of the file is parsed.
+        :param progress_callback: called with (chunks_done, chunks_seen) after every batch; chunks_seen grows
+            until the whole file is parsed
+        :param should_cancel: polled before every batch; raises IngestCancelled when it returns True
+        :param previous_chunk_ids: chunk ids stored for an earlier version of this file; only new or changed
+            chunks are embedded and written, chunks no longer present are deleted
         """
-        docs = self.load_document(file_path)
-        splitter = self._get_text_splitter(docs, file_path)
-        splits = splitter.split_documents(docs)
-        # Attach file-level metadata
-        for doc in splits:
-            doc.metadata = doc.metadata or {}
-            if metadata:
-                doc.metadata.update(metadata)
-            doc.metadata['source_file'] = file_path
-        # Process in smaller batches to avoid rate limits
-        batch_size = 10
-        for i in range(0, len(splits), batch_size):
-            batch = splits[i:i + batch_size]
+        return self.ingest_stream(self._iter_splits(file_path, metadata), file_path, progress_callback, should_cancel, previous_chunk_ids)
+
+    def ingest_documents(
+        self,
+        splits: List[Document],
+        source: str,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        previous_chunk_ids: Optional[Collection[str]] = None,
+    ) -> IngestResult:
+        """
+        Embed and write already-split chunks (the second half of ingest).
+        :param source: file path or other label the chunks came from; owns the chunk ids when metadata has no file_id
+        """
+        return self.ingest_stream([splits], source, progress_callback, should_cancel, previous_chunk_ids)
+
+    def ingest_stream(
+        self,
+        split_batches: Iterable[List[Document]],
+        source: str,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        previous_chunk_ids: Optional[Collection[str]] = None,
+    ) -> IngestResult:
+        """
+        Embed and write chunks as they arrive, batch by batch in document order (e.g. from a parser still working
+        on later pages). At most embed_concurrency embedding requests are in flight; while they are, no further
+        batches are pulled, so a slow provider holds back parsing instead of letting chunks pile up in memory.
+        """
+        result = self.ingest_many([IngestSource(split_batches, source, previous_chunk_ids, progress_callback, should_cancel)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def ingest_files(
+        self,
+        files: List[Tuple[str, Optional[dict], Optional[Collection[str]]]],
+        progress_callbacks: Optional[List[Optional[Callable[[int, int], None]]]] = None,
+        should_cancel: Optional[List[Optional[Callable[[], bool]]]] = None,
+        on_done: Optional[Callable[[int, Union[IngestResult, Exception]], None]] = None,
+    ) -> List[Union[IngestResult, Exception]]:
+        """
+        Ingest several files as one batch (see ingest_many).
+        :param files: (file_path, metadata, previous_chunk_ids) per file
+        """
+        sources = [
+            IngestSource(
+                self._iter_splits(file_path, metadata),
+                file_path,
+                previous_chunk_ids,
+                progress_callbacks[i] if progress_callbacks else None,
+                should_cancel[i] if should_cancel else None,
+            )
+            for i, (file_path, metadata, previous_chunk_ids) in enumerate(files)
+        ]
+        return self.ingest_many(sources, on_done=on_done)
+
+    def ingest_many(
+        self,
+        sources: List["IngestSource"],
+        on_done: Optional[Callable[[int, Union[IngestResult, Exception]], None]] = None,
+    ) -> List[Union[IngestResult, Exception]]:
+        """
+        Ingest several sources through one embedding stage. New chunks of consecutive sources share embedding
+        batches, so a batch of small files costs about as many embedding requests as one file of the same total size.
+        A failure or cancellation only affects the sources whose chunks were involved; each source's result (or
+        exception) is returned in order and passed to on_done(index, result) as soon as that source is complete.
+        """
+        states = [_SourceState() for _ in sources]
+        results: List[Union[IngestResult, Exception, None]] = [None] * len(sources)
+        buffer: List[Tuple[int, Document, str]] = []
+
+        def progress(i: int):
+            if sources[i].progress_callback:
+                sources[i].progress_callback(states[i].done, states[i].total)
+
+        def settle(i: int):
+            state = states[i]
+            if not state.parsed or state.outstanding or results[i] is not None:
+                return
+            if state.error is None:
+                try:
+                    results[i] = self._finish_ingest(state.planner, sources[i].source, state.total)
+                except Exception as e:
+                    results[i] = e
+            else:
+                results[i] = state.error
+            if on_done:
+                on_done(i, results[i])
+
+        # Embed provider-sized batches with several requests in flight, then bulk-upsert the
+        # precomputed vectors so Chroma never calls the embedding function itself
+        with ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="embed") as executor:
+            pending = {}
+
+            def collect():
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    items = pending.pop(future)
+                    try:
+                        vectors = future.result()
+                        self._upsert_embedded([doc for _, doc, _ in items], vectors, [chunk_id for _, _, chunk_id in items])
+                        error = None
+                    except Exception as e:
+                        logging.error(f"Failed to ingest batch of {len(items)} chunks: {e}")
+                        error = e
+                    touched = {}
+                    for i, _, _ in items:
+                        touched[i] = touched.get(i, 0) + 1
+                    for i, count in touched.items():
+                        states[i].outstanding -= count
+                        if error is not None:
+                            states[i].error = states[i].error or error
+                        else:
+                            states[i].done += count
+                            progress(i)
+                        settle(i)
+
+            def submit(items: List[Tuple[int, Document, str]]):
+                while len(pending) >= self.embed_concurrency:
+                    collect()
+                pending[executor.submit(self._embed_batch, [doc.page_content for _, doc, _ in items])] = items
+
+            def flush(final: bool = False, src: Optional[IngestSource] = None):
+                while buffer and (final or len(buffer) >= self.embed_batch_size):
+                    # One large split batch can fill many embedding batches; stay responsive to cancellation
+                    if src and src.should_cancel and src.should_cancel():
+                        raise IngestCancelled(f"Ingestion of {src.source} cancelled")
+                    submit(buffer[:self.embed_batch_size])
+                    del buffer[:self.embed_batch_size]
+
             try:
-                self.vectorstore.add_documents(batch)
-                time.sleep(1)  # Rate limit protection
-            except Exception as e:
-                logging.error(f"Failed to ingest batch {i}-{i+len(batch)}: {e}")
-                raise
-        logging.info(f"Ingested {len(splits)} chunks from {file_path} using {splitter.__class__.__name__}")
+                for i, src in enumerate(sources):
+                    state = states[i]
+                    try:
+                        previous_chunk_ids = src.previous_chunk_ids
+                        if previous_chunk_ids:
+                            # Only chunks actually present in this collection can be reused (e.g. not after a provider switch)
+                            previous_chunk_ids = self.store.existing_ids(previous_chunk_ids)
+                        state.planner = _ChunkPlanner(src.source, previous_chunk_ids)
+                        for splits in src.split_batches:
+                            if state.error is not None:
+                                raise state.error
+                            if src.should_cancel and src.should_cancel():
+                                raise IngestCancelled(f"Ingestion of {src.source} cancelled after {state.done}/{state.total} chunks")
+                            state.total += len(splits)
+                            new_docs, new_ids, kept = self._plan_batch(state.planner, splits)
+                            state.done += kept
+                            state.outstanding += len(new_docs)
+                            buffer.extend((i, doc, chunk_id) for doc, chunk_id in zip(new_docs, new_ids))
+                            flush(src=src)
+                            progress(i)
+                    except Exception as e:
+                        if not isinstance(e, IngestCancelled):
+                            logging.error(f"Failed to ingest {src.source}: {e}")
+                        state.error = state.error or e
+                        # Chunks of this source that were not sent yet are dropped
+                        kept_items = [item for item in buffer if item[0] != i]
+                        state.outstanding -= len(buffer) - len(kept_items)
+                        buffer[:] = kept_items
+                    finally:
+                        if hasattr(src.split_batches, "close"):
+                            src.split_batches.close()
+                    state.parsed = True
+                    settle(i)
+                flush(final=True)
+                while pending:
+                    collect()
+            finally:
+                for future in pending:
+                    future.cancel()
+        return results
+
+    def _iter_splits(self, file_path: str, metadata: Optional[dict]) -> Iterator[List[Document]]:
+        """
+        Split batches of the file from the parse pool, in document order, with file-level metadata attached.
+        """
+        batches = self.parse_pool.iter_splits(file_path, self.chunking_strategy)
+        try:
+            while True:
+                # Time spent waiting for the parser (zero once parsing runs ahead of embedding)
+                with stage_timer("ingest", "parse"):
+                    splits = next(batches, None)
+                if splits is None:
+                    return
+                count_chunks("ingest", "split", len(splits))
+                for doc in splits:
+                    doc.metadata = doc.metadata or {}
+                    if metadata:
+                        doc.metadata.update(metadata)
+                    doc.metadata['source_file'] = file_path
+                yield splits
+        finally:
+            batches.close()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        with stage_timer("ingest", "embed"):
+            vectors = self.embeddings.embed_documents(texts)
+        count_tokens("ingest", "embedding", sum(estimate_tokens(t) for t in texts))
+        return vectors
+
+    def _plan_batch(self, planner: "_ChunkPlanner", splits: List[Document]) -> Tuple[List[Document], List[str], int]:
+        """
+        Diff a batch of splits against the previous version: returns the new chunks to embed and the number of
+        unchanged ones, whose metadata (page, source path) is refreshed without re-embedding them.
+        """
+        with stage_timer("ingest", "plan"):
+            new_docs, new_ids, kept_docs, kept_ids = planner.add(splits)
+        if kept_ids:
+            with stage_timer("ingest", "write"):
+                self.store.update_metadata(kept_ids, kept_docs)
+        return new_docs, new_ids, len(kept_ids)
+
+    def _finish_ingest(self, planner: "_ChunkPlanner", source: str, total: int) -> IngestResult:
+        """
+        Runs after every new chunk is written: drop chunks that are no longer in the file.
+        """
+        with stage_timer("ingest", "finalize"):
+            self.store.delete_ids(planner.removed_ids())
+        result = planner.result
+        count_chunks("ingest", "unchanged", result.unchanged)
+        count_chunks("ingest", "removed", result.removed)
+        logging.info(
+            f"Ingested {total} chunks from {source} (added={result.added}, "
+            f"unchanged={result.unchanged}, removed={result.removed}, embedding cache: {self.embeddings.stats()})"
+        )
+        return result
+
+    def _upsert_embedded(self, docs: List[Document], vectors: List[List[float]], ids: Optional[List[str]] = None):
+        """
+        Bulk-upsert documents with precomputed embeddings straight into the Chroma collection.
+        """
+        if not docs:
+            return
+        ids = ids or [str(uuid.uuid4()) for _ in docs]
+        with stage_timer("ingest", "write"):
+            self.store.upsert(ids, docs, vectors)
+        count_chunks("ingest", "embedded", len(docs))
+
+    def rebuild_keyword_index(self, page_size: int = 1000) -> int:
+        """
+        Backfill the keyword index from Chroma (e.g. for vectors ingested before it existed).
+        """
+        total = self.store.count()
+        if not total:
+            return 0
+        self.keyword_index.clear()
+        for offset in range(0, total, page_size):
+            page = self.store.get_page(limit=page_size, offset=offset)
+            docs = [Document(page_content=text or "", metadata=meta or {}) for text, meta in zip(page["documents"], page["metadatas"])]
+            self.keyword_index.add(page["ids"], docs)
+        logging.info(f"Rebuilt keyword index from {total} Chroma chunks")
+        return total
+
+    def delete_where(self, where: dict):
+        """
+        Delete chunks matching a metadata filter from both the vector store and the keyword index.
+        """
+        self.store.delete_where(where)
+
+    def delete_files(self, file_ids: List[int]):
+        """
+        Bulk-delete the chunks of several files from both the vector store and the keyword index.
+        """
+        self.store.delete_file_ids(file_ids)
+
+    def revert_file(self, file_id: int, chunk_ids: Collection[str]) -> int:
+        """
+        Undo an unfinished re-ingest of a file: delete its chunks that are not among chunk_ids (the chunks of the
+        version being kept). Chunks of that version are only deleted once a new version finishes, so they are intact.
+        :return: number of chunks deleted
+        """
+        keep = set(chunk_ids)
+        stale = [chunk_id for chunk_id in self.store.ids_for_file(file_id) if chunk_id not in keep]
+        self.store.delete_ids(stale)
+        return len(stale)
+
+    def clear(self):
+        """
+        Delete every chunk: atomically resets the collection and the keyword index.
+        """
+        self.store.reset()
+
+    def refresh(self):
+        """
+        Pick up vector store writes made by other worker processes and drop results cached before them.
+        """
+        self.store.refresh()
+        self.retrieval_cache.clear()
+
+    def shard_for(self, metadata: Optional[dict]) -> str:
+        """The vector store shard that chunks with this (file-level) metadata are stored in."""
+        return self.router.shard_for(metadata)
+
+    def drop_shard(self, shard: str) -> bool:
+        """
+        Delete every chunk of one vector store shard (a tenant or file group, see sharding.py) at once.
+        """
+        return self.store.drop_shard(shard)
 
     def retrieve(self, query: str, k: int = 4, keywords: Optional[list] = None, metadata_filter: Optional[dict] = None) -> List[Document]:
         """
-        Hybrid retrieval: combines vector search, keyword, and metadata filtering. Always uses strict top-k retrieval (no MMR).
+        Hybrid retrieval: dense vector search and BM25 keyword search run in parallel and are merged with
+        reciprocal-rank fusion. Metadata filters apply to both. Always returns strict top-k (no MMR).
+        With a reranker, the top rerank_candidates fused results are re-scored and the best k kept.
+        Results are cached until the next write to the store.
         :param query: user query
         :param k: number of results
-        :param keywords: list of keywords to boost/filter
+        :param keywords: list of keywords to boost/filter (searched as an extra sparse ranking)
         :param metadata_filter: dict of metadata filters (e.g. {"source_file": ...})
         """
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": k})
-        if metadata_filter:
-            results = retriever.invoke(query, filter=metadata_filter)
-        else:
-            results = retriever.invoke(query)
-        # Keyword filter/boost
+        cache_key, version = self._cache_key(query, k, keywords, metadata_filter)
+        cached = self._cached_results(cache_key, version)
+        if cached is not None:
+            return cached
+        fused_k = self._fused_k(k)
+        candidates = fused_k * HYBRID_CANDIDATE_MULTIPLIER
+        dense_future = self._submit_retrieval(self._dense_search, query, candidates, metadata_filter)
+        sparse_futures = [self._submit_retrieval(self._keyword_search, query, candidates, metadata_filter)]
         if keywords:
-            keyword_results = [doc for doc in results if any(kw.lower() in doc.page_content.lower() for kw in keywords)]
-            # Merge, deduplicate, and sort (keyword hits first)
-            unique = {id(doc): doc for doc in keyword_results + results}
-            results = list(unique.values())[:k]
-        logging.info(f"Hybrid retrieval for query '{query}': {len(results)} docs (strict top-k, keywords={keywords}, metadata={metadata_filter})")
+            sparse_futures.append(self._submit_retrieval(self._keyword_search, " ".join(keywords), candidates, metadata_filter))
+        rankings = [dense_future.result()] + [f.result() for f in sparse_futures]
+        with stage_timer("retrieve", "fusion"):
+            results = _reciprocal_rank_fusion(rankings)[:fused_k]
+        if self.reranker is not None:
+            results = rerank(self.reranker, query, results, k)
+        self.retrieval_cache.put(cache_key, version, results)
+        count_chunks("retrieve", "returned", len(results))
+        logging.info(
+            f"Hybrid retrieval for query '{query}': {len(results)} docs (dense={len(rankings[0])}, "
+            f"sparse={[len(r) for r in rankings[1:]]}, keywords={keywords}, metadata={metadata_filter})"
+        )
         return results
+
+    async def aretrieve(self, query: str, k: int = 4, keywords: Optional[list] = None, metadata_filter: Optional[dict] = None) -> List[Document]:
+        """
+        Async counterpart of retrieve: the query is embedded via aembed_query while the BM25 searches run on the
+        blocking-IO executor; the Chroma vector search is offloaded there as well.
+        """
+        cache_key, version = self._cache_key(query, k, keywords, metadata_filter)
+        cached = self._cached_results(cache_key, version)
+        if cached is not None:
+            return cached
+        fused_k = self._fused_k(k)
+        candidates = fused_k * HYBRID_CANDIDATE_MULTIPLIER
+
+        async def dense() -> List[Document]:
+            with stage_timer("retrieve", "embed_query"):
+                vector = await self.embeddings.aembed_query(query)
+            with stage_timer("retrieve", "vector_search"):
+                return await run_blocking(
+                    self.store.similarity_search_by_vector, vector, k=candidates, filter=metadata_filter or None
+                )
+
+        searches = [dense(), run_blocking(self._keyword_search, query, candidates, metadata_filter)]
+        if keywords:
+            searches.append(run_blocking(self._keyword_search, " ".join(keywords), candidates, metadata_filter))
+        rankings = await asyncio.gather(*searches)
+        with stage_timer("retrieve", "fusion"):
+            results = _reciprocal_rank_fusion(list(rankings))[:fused_k]
+        if self.reranker is not None:
+            # CPU-bound scoring stays off the event loop
+            results = await run_blocking(rerank, self.reranker, query, results, k)
+        self.retrieval_cache.put(cache_key, version, results)
+        count_chunks("retrieve", "returned", len(results))
+        logging.info(
+            f"Hybrid retrieval (async) for query '{query}': {len(results)} docs (dense={len(rankings[0])}, "
+            f"sparse={[len(r) for r in rankings[1:]]}, keywords={keywords}, metadata={metadata_filter})"
+        )
+        return results
+
+    def _cache_key(self, query: str, k: int, keywords: Optional[list], metadata_filter: Optional[dict]) -> Tuple[str, int]:
+        # The version is read before searching, so a write that lands mid-search makes the result stale
+        return RetrievalCache.key(query, k, keywords, metadata_filter), self.store.corpus_version
+
+    def _cached_results(self, cache_key: str, version: int) -> Optional[List[Document]]:
+        with stage_timer("retrieve", "cache_lookup"):
+            cached = self.retrieval_cache.get(cache_key, version)
+        if cached is not None:
+            count_chunks("retrieve", "cached", len(cached))
+        return cached
+
+    def _fused_k(self, k: int) -> int:
+        # Over-fetch for the reranker; without one, fusion returns exactly k
+        return max(k, self.rerank_candidates) if self.reranker is not None else k
+
+    def _submit_retrieval(self, fn: Callable, *args):
+        # Copy the caller's context so stage timings of a request are attributed to it
+        return self._retrieval_executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def _dense_search(self, query: str, k: int, metadata_filter: Optional[dict]) -> List[Document]:
+        with stage_timer("retrieve", "embed_query"):
+            vector = self.embeddings.embed_query(query)
+        with stage_timer("retrieve", "vector_search"):
+            return self.store.similarity_search_by_vector(vector, k=k, filter=metadata_filter or None)
+
+    def _keyword_search(self, query: str, k: int, metadata_filter: Optional[dict]) -> List[Document]:
+        try:
+            with stage_timer("retrieve", "keyword_search"):
+                return [doc for doc, _ in self.keyword_index.search(query, k, metadata_filter)]
+        except UnsupportedFilter as e:
+            # Dense search still honours the filter; skip the sparse side rather than return unfiltered hits
+            logging.info(f"Keyword search skipped: {e}")
+            return []
+
+
+def _reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int = RRF_K) -> List[Document]:
+    """
+    Merge ranked lists by summing 1 / (rrf_k + rank) per document id.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
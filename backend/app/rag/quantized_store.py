@@ -0,0 +1,576 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.concurrency import ReadWriteLock, connect_sqlite
+from app.rag.keyword_index import KeywordIndex, UnsupportedFilter, _filter_sql
+from app.rag.sharding import DEFAULT_SHARD
+from app.rag.vectorstore_manager import _chroma_metadata, file_ids_filter
+
+"""
+Compact vector store: int8 vectors in a memory-mapped file, exact re-scoring of the best candidates.
+
+A drop-in alternative to VectorStoreManager (VECTOR_BACKEND=quantized) for nodes where Chroma's
+float32 HNSW index does not fit comfortably in memory. Layout of the store directory:
+- `codes.i8`: one int8 row per chunk (each vector scaled by its own max |value| / 127), a quarter
+  of the float32 size. The first pass of every search scans these rows.
+- `vectors.f32`: the full-precision vectors. Only the rows of the best QUANTIZED_RESCORE_FACTOR * k
+  candidates are read, to re-rank them by exact L2 distance, so the OS pages in a few rows per query.
+- `chunks.db`: SQLite table with id, text, metadata, scale and norm per row; metadata filters are
+  evaluated here (file_id filters in memory, operators SQL cannot express such as $or/$ne in Python).
+
+After a reset the vector files are named `codes.<generation>.i8` / `vectors.<generation>.f32`, with
+the generation recorded in chunks.db. A mapped file is never shrunk (another process touching a page
+past the new end would get SIGBUS): reset starts a new generation and unlinks the old files, which
+stay readable by processes that still map them until they refresh.
+
+Both files are memory-mapped, so resident memory is the pages actually touched: the int8 codes
+plus a few float32 rows, instead of every float32 vector and the graph links. Search is a flat
+scan, which is exact up to quantization error and needs no index build; it suits corpora up to
+a few million chunks per node. Rows freed by deletes are reused by later writes.
+
+Like an embedded Chroma client, the per-row state is per process: other worker processes' writes
+are picked up by `refresh()`, and writes go through `write_guard` (see worker_sync.py).
+"""
+
+# Candidates re-scored with full-precision vectors, as a multiple of k
+QUANTIZED_RESCORE_FACTOR = int(os.getenv("QUANTIZED_RESCORE_FACTOR", "10"))
+# Rows scanned per NumPy block in the first pass (bounds the float32 copy made per block)
+QUANTIZED_BLOCK_ROWS = 4096
+_INITIAL_CAPACITY = 1024
+_NO_FILE_ID = -1
+_COMPARISONS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def quantize(vectors: np.ndarray):
+    """
+    Symmetric per-vector int8 quantization: returns (codes, scales) with vectors ~= codes * scales[:, None].
+    """
+    peak = np.abs(vectors).max(axis=1)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def _file_id_values(where: Dict[str, Any]) -> Optional[List[int]]:
+    """The file ids of a filter on file_id alone (the common chat filter), else None."""
+    if set(where) != {"file_id"}:
+        return None
+    value = where["file_id"]
+    if isinstance(value, dict):
+        if set(value) == {"$eq"}:
+            values = [value["$eq"]]
+        elif set(value) == {"$in"}:
+            values = list(value["$in"])
+        else:
+            return None
+    else:
+        values = [value]
+    return values if all(isinstance(v, int) and not isinstance(v, bool) for v in values) else None
+
+
+def metadata_matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """
+    Evaluate a Chroma `where` filter ($and, $or, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin) on one
+    chunk's metadata. As in Chroma, a condition on a key the metadata lacks does not match.
+    """
+    for key, value in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, part) for part in value):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, part) for part in value):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported filter key: {key}")
+        else:
+            if key not in metadata:
+                return False
+            conditions = value if isinstance(value, dict) else {"$eq": value}
+            for op, operand in conditions.items():
+                if op not in _COMPARISONS:
+                    raise ValueError(f"Unsupported filter operator: {op}")
+                try:
+                    if not _COMPARISONS[op](metadata[key], operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+def _file_id(metadata: Dict[str, Any]) -> int:
+    value = metadata.get("file_id")
+    return value if isinstance(value, int) and not isinstance(value, bool) else _NO_FILE_ID
+
+
+class QuantizedVectorStore:
+    def __init__(
+        self,
+        directory: str,
+        embedding_function: Embeddings,
+        keyword_index: KeywordIndex,
+        collection_name: str,
+        embedding_model: Optional[str] = None,
+        embedding_dimension: Optional[int] = None,
+        rescore_factor: int = QUANTIZED_RESCORE_FACTOR,
+    ):
+        """
+        :param directory: Directory holding the vector files and chunks.db
+        :param embedding_function: Embeddings used for text queries
+        :param keyword_index: BM25 index kept in sync with the store
+        :param collection_name: Name reported in health checks (the embedding space, as for Chroma)
+        :param embedding_model: Embedding model of the vectors; recorded on first open and checked afterwards
+        :param embedding_dimension: Vector dimension; taken from the first upsert if unknown
+        :param rescore_factor: Candidates re-scored exactly, as a multiple of k
+        """
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.keyword_index = keyword_index
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.embedding_dimension = embedding_dimension
+        self.rescore_factor = max(1, rescore_factor)
+        # Entered around every write, outside the store lock (replaced by the app in multi-worker mode)
+        self.write_guard: Callable[[], ContextManager] = nullcontext
+        self._lock = ReadWriteLock()
+        self._db_lock = threading.Lock()
+        self._version = 0
+        self._version_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._codes: Optional[np.memmap] = None
+        self._vectors: Optional[np.memmap] = None
+        # Per-row state kept in memory (17 bytes per row)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._file_ids = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._capacity = 0
+        # One past the highest row ever used
+        self._size = 0
+        # Suffix of the vector files in use, bumped by reset (0: codes.i8 / vectors.f32)
+        self._generation = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _vector_files(self, generation: int) -> List[Tuple[str, type]]:
+        """(path, dtype) of the codes and vectors files of a generation."""
+        suffix = "" if generation == 0 else f".{generation}"
+        return [(self._path(f"codes{suffix}.i8"), np.int8), (self._path(f"vectors{suffix}.f32"), np.float32)]
+
+    def open(self) -> "QuantizedVectorStore":
+        """
+        Open the SQLite table, load per-row state and map the vector files, once.
+        """
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    conn = connect_sqlite(self._path("chunks.db"))
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, "
+                        "file_id INTEGER, content TEXT, metadata TEXT, scale REAL, norm REAL)"
+                    )
+                    conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+                    self._check_space(conn)
+                    conn.commit()
+                    # Generation and rows in one read transaction, so a concurrent reset is seen whole or not at all
+                    conn.execute("BEGIN")
+                    generation = conn.execute("SELECT value FROM settings WHERE key = 'generation'").fetchone()
+                    rows = conn.execute("SELECT row, scale, norm, file_id FROM chunks").fetchall()
+                    conn.commit()
+                    self._generation = int(generation[0]) if generation else 0
+                    if rows:
+                        self._resize(max(r[0] for r in rows) + 1)
+                        index = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+                        self._scales[index] = [r[1] for r in rows]
+                        self._norms[index] = [r[2] for r in rows]
+                        self._file_ids[index] = [_NO_FILE_ID if r[3] is None else r[3] for r in rows]
+                        self._alive[index] = True
+                        self._size = int(index.max()) + 1
+                    self._conn = conn
+                    logging.info(f"Opened quantized vector store {self.collection_name} at {self.directory} ({len(rows)} chunks)")
+        return self
+
+    def _check_space(self, conn: sqlite3.Connection):
+        settings = dict(conn.execute("SELECT key, value FROM settings").fetchall())
+        stored_dimension = int(settings["embedding_dimension"]) if "embedding_dimension" in settings else None
+        if (self.embedding_model and settings.get("embedding_model") not in (None, self.embedding_model)) or (
+            self.embedding_dimension and stored_dimension not in (None, self.embedding_dimension)
+        ):
+            raise ValueError(
+                f"Quantized store {self.directory} holds {settings.get('embedding_model')}/{stored_dimension} vectors, "
+                f"not {self.embedding_model}/{self.embedding_dimension}"
+            )
+        self.embedding_dimension = self.embedding_dimension or stored_dimension
+        for key, value in (("embedding_model", self.embedding_model), ("embedding_dimension", self.embedding_dimension)):
+            if value is not None:
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _resize(self, rows: int):
+        """
+        Grow the mapped files and per-row arrays to hold at least `rows` rows (capacity doubles). Write lock held.
+        Files only ever grow: other processes may map them at their current length.
+        """
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, _INITIAL_CAPACITY, self._capacity * 2)
+        dimension = self.embedding_dimension
+        maps = []
+        for path, dtype in self._vector_files(self._generation):
+            with open(path, "ab"):
+                pass
+            if os.path.getsize(path) < capacity * dimension * np.dtype(dtype).itemsize:
+                os.truncate(path, capacity * dimension * np.dtype(dtype).itemsize)
+            maps.append(np.memmap(path, dtype=dtype, mode="r+", shape=(capacity, dimension)))
+        self._codes, self._vectors = maps
+        grown = capacity - self._capacity
+        self._scales = np.concatenate([self._scales, np.ones(grown, dtype=np.float32)])
+        self._norms = np.concatenate([self._norms, np.zeros(grown, dtype=np.float32)])
+        self._file_ids = np.concatenate([self._file_ids, np.full(grown, _NO_FILE_ID, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.zeros(grown, dtype=bool)])
+        self._capacity = capacity
+
+    @property
+    def vectorstore(self) -> "QuantizedVectorStore":
+        return self.open()
+
+    @property
+    def remote(self) -> bool:
+        return False
+
+    def _clear_state(self):
+        self._codes = self._vectors = None
+        self._scales = np.empty(0, dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._file_ids = np.empty(0, dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._capacity = self._size = 0
+
+    def refresh(self):
+        """
+        Reload per-row state and remap the files, to see writes made by other processes.
+        """
+        if self._conn is not None:
+            with self._lock.write():
+                self._conn.close()
+                self._conn = None
+                self._clear_state()
+                self.open()
+        self._bump_version()
+
+    @property
+    def shards(self) -> List[str]:
+        return [DEFAULT_SHARD]
+
+    @property
+    def corpus_version(self) -> int:
+        return self._version
+
+    def _bump_version(self):
+        with self._version_lock:
+            self._version += 1
+
+    def memory_stats(self) -> Dict[str, int]:
+        """
+        Bytes of the int8 codes scanned by every search, of the float32 vectors they stand in for, and of
+        the per-row arrays kept in memory.
+        """
+        self.open()
+        rows = int(self._alive.sum())
+        dimension = self.embedding_dimension or 0
+        return {
+            "rows": rows,
+            "codes_bytes": rows * dimension,
+            "float32_bytes": rows * dimension * 4,
+            "row_state_bytes": self._capacity * 17,
+        }
+
+    def _rows_for_ids(self, ids: Sequence[str]) -> Dict[str, int]:
+        found = {}
+        with self._db_lock:
+            for i in range(0, len(ids), 500):
+                part = list(ids[i:i + 500])
+                found.update(
+                    (chunk_id, row)
+                    for row, chunk_id in self._conn.execute(
+                        f"SELECT row, chunk_id FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})", part
+                    )
+                )
+        return found
+
+    def _rows_for_filter(self, where: Dict[str, Any]) -> np.ndarray:
+        file_ids = _file_id_values(where)
+        if file_ids is not None:
+            size = self._size
+            return np.flatnonzero(self._alive[:size] & np.isin(self._file_ids[:size], file_ids))
+        try:
+            sql, params = _filter_sql(where)
+        except UnsupportedFilter:
+            with self._db_lock:
+                rows = [
+                    r
+                    for r, metadata in self._conn.execute("SELECT row, metadata FROM chunks ORDER BY row")
+                    if metadata_matches(json.loads(metadata), where)
+                ]
+        else:
+            with self._db_lock:
+                rows = [r for (r,) in self._conn.execute(f"SELECT row FROM chunks WHERE {sql} ORDER BY row", params)]
+        return np.asarray(rows, dtype=np.int64)
+
+    def count(self) -> int:
+        self.open()
+        with self._db_lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return n
+
+    def get_page(self, limit: int, offset: int, include: Iterable[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        include = list(include)
+        self.open()
+        with self._lock.read():
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT row, chunk_id, content, metadata FROM chunks ORDER BY row LIMIT ? OFFSET ?", (limit, offset)
+                ).fetchall()
+            page: Dict[str, Any] = {"ids": [r[1] for r in rows]}
+            if "documents" in include:
+                page["documents"] = [r[2] for r in rows]
+            if "metadatas" in include:
+                page["metadatas"] = [json.loads(r[3]) for r in rows]
+            if "embeddings" in include:
+                page["embeddings"] = np.array(self._vectors[[r[0] for r in rows]]) if rows else np.empty((0, self.embedding_dimension or 0))
+        return page
+
+    def similarity_search(self, query: str, k: int, filter: Optional[dict] = None) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def _first_pass(self, query: np.ndarray, rows: Optional[np.ndarray], n: int) -> np.ndarray:
+        """
+        Rows of the n nearest candidates by approximate L2 distance over the int8 codes.
+        """
+        best_rows = np.empty(0, dtype=np.int64)
+        best = np.empty(0, dtype=np.float32)
+        total = self._size if rows is None else len(rows)
+        for start in range(0, total, QUANTIZED_BLOCK_ROWS):
+            if rows is None:
+                end = min(total, start + QUANTIZED_BLOCK_ROWS)
+                alive = self._alive[start:end]
+                block_rows = np.arange(start, end)[alive]
+                codes = self._codes[start:end][alive]
+            else:
+                block_rows = rows[start:start + QUANTIZED_BLOCK_ROWS]
+                codes = self._codes[block_rows]
+            # |v|^2 - 2 q.v; |q|^2 is the same for every row
+            distances = self._norms[block_rows] - 2 * self._scales[block_rows] * (codes.astype(np.float32) @ query)
+            best_rows = np.concatenate([best_rows, block_rows])
+            best = np.concatenate([best, distances])
+            if len(best) > n:
+                keep = np.argpartition(best, n - 1)[:n]
+                best_rows, best = best_rows[keep], best[keep]
+        return best_rows
+
+    def similarity_search_by_vector(self, vector: List[float], k: int, filter: Optional[dict] = None) -> List[Document]:
+        """
+        Nearest chunks by exact L2 distance among the best rescore_factor * k int8 candidates.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        self.open()
+        with self._lock.read():
+            if not self._size or k <= 0:
+                return []
+            rows = self._rows_for_filter(filter) if filter else None
+            if rows is not None and not len(rows):
+                return []
+            candidates = np.sort(self._first_pass(query, rows, k * self.rescore_factor))
+            exact = self._vectors[candidates]
+            distances = ((exact - query) ** 2).sum(axis=1)
+            top = [int(r) for r in candidates[np.argsort(distances, kind="stable")[:k]]]
+            with self._db_lock:
+                found = {
+                    row: (chunk_id, content, metadata)
+                    for row, chunk_id, content, metadata in self._conn.execute(
+                        f"SELECT row, chunk_id, content, metadata FROM chunks WHERE row IN ({','.join('?' * len(top))})", top
+                    )
+                }
+        return [
+            Document(id=found[row][0], page_content=found[row][1] or "", metadata=json.loads(found[row][2]))
+            for row in top
+            if row in found
+        ]
+
+    def upsert(self, ids: List[str], docs: List[Document], vectors: List[List[float]]):
+        """
+        Bulk-upsert documents with precomputed embeddings into the store and the keyword index.
+        """
+        if not ids:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.embedding_dimension and matrix.shape[1] != self.embedding_dimension:
+            raise ValueError(
+                f"Got {matrix.shape[1]}-dimensional vectors for collection {self.collection_name} "
+                f"({self.embedding_model}, {self.embedding_dimension} dimensions)"
+            )
+        self.open()
+        codes, scales = quantize(matrix)
+        norms = (matrix ** 2).sum(axis=1)
+        metadatas = [_chroma_metadata(d.metadata) for d in docs]
+        with self.write_guard(), self._lock.write():
+            if not self.embedding_dimension:
+                self.embedding_dimension = matrix.shape[1]
+                with self._db_lock:
+                    self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('embedding_dimension', ?)", (str(self.embedding_dimension),))
+            existing = self._rows_for_ids(ids)
+            missing = sum(1 for chunk_id in dict.fromkeys(ids) if chunk_id not in existing)
+            free = np.flatnonzero(~self._alive[:self._size])[:missing].tolist()
+            appended = missing - len(free)
+            free.extend(range(self._size, self._size + appended))
+            self._resize(self._size + appended)
+            self._size += appended
+            free_rows = iter(free)
+            rows = []
+            for chunk_id in ids:
+                if chunk_id not in existing:
+                    existing[chunk_id] = next(free_rows)
+                rows.append(existing[chunk_id])
+            index = np.asarray(rows, dtype=np.int64)
+            self._codes[index] = codes
+            self._vectors[index] = matrix
+            # Vectors reach the disk before the rows that point at them
+            self._codes.flush()
+            self._vectors.flush()
+            self._scales[index] = scales
+            self._norms[index] = norms
+            self._file_ids[index] = [_file_id(m) for m in metadatas]
+            self._alive[index] = True
+            with self._db_lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, chunk_id, file_id, content, metadata, scale, norm) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (row, chunk_id, m.get("file_id"), doc.page_content, json.dumps(m), float(scale), float(norm))
+                        for row, chunk_id, doc, m, scale, norm in zip(rows, ids, docs, metadatas, scales, norms)
+                    ],
+                )
+                self._conn.commit()
+            self.keyword_index.add(ids, docs)
+        self._bump_version()
+
+    def update_metadata(self, ids: List[str], docs: List[Document]):
+        self.open()
+        metadatas = [_chroma_metadata(d.metadata) for d in docs]
+        with self.write_guard(), self._lock.write():
+            rows = self._rows_for_ids(ids)
+            for chunk_id, m in zip(ids, metadatas):
+                if chunk_id in rows:
+                    self._file_ids[rows[chunk_id]] = _file_id(m)
+            with self._db_lock:
+                self._conn.executemany(
+                    "UPDATE chunks SET metadata = ?, file_id = ? WHERE chunk_id = ?",
+                    [(json.dumps(m), m.get("file_id"), chunk_id) for chunk_id, m in zip(ids, metadatas)],
+                )
+                self._conn.commit()
+            self.keyword_index.add(ids, docs)
+        self._bump_version()
+
+    def existing_ids(self, ids: Iterable[str]) -> List[str]:
+        """The subset of ids present in the store."""
+        self.open()
+        return list(self._rows_for_ids(list(ids)))
+
+    def ids_for_file(self, file_id: Any) -> List[str]:
+        """Ids of every chunk stored for a file."""
+        self.open()
+        with self._lock.read():
+            rows = self._rows_for_filter({"file_id": file_id}).tolist()
+            found: List[str] = []
+            with self._db_lock:
+                for i in range(0, len(rows), 500):
+                    part = rows[i:i + 500]
+                    found.extend(
+                        chunk_id for (chunk_id,) in self._conn.execute(f"SELECT chunk_id FROM chunks WHERE row IN ({','.join('?' * len(part))})", part)
+                    )
+        return found
+
+    def _delete_rows(self, rows: List[int]):
+        if not rows:
+            return
+        self._alive[rows] = False
+        with self._db_lock:
+            for i in range(0, len(rows), 500):
+                part = rows[i:i + 500]
+                self._conn.execute(f"DELETE FROM chunks WHERE row IN ({','.join('?' * len(part))})", part)
+            self._conn.commit()
+
+    def delete_ids(self, ids: List[str]):
+        if not ids:
+            return
+        self.open()
+        with self.write_guard(), self._lock.write():
+            self._delete_rows(list(self._rows_for_ids(ids).values()))
+            self.keyword_index.delete_ids(ids)
+        self._bump_version()
+
+    def delete_where(self, where: dict):
+        self.open()
+        with self.write_guard(), self._lock.write():
+            self._delete_rows(self._rows_for_filter(where).tolist())
+            self.keyword_index.delete_where(where)
+        self._bump_version()
+
+    def delete_file_ids(self, file_ids: Iterable[Any]):
+        """
+        Remove every chunk of the given files.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        if file_ids:
+            self.delete_where(file_ids_filter(file_ids))
+
+    def drop_shard(self, shard: str) -> bool:
+        """
+        The quantized store is not sharded; dropping the default shard empties it.
+        """
+        if shard != DEFAULT_SHARD:
+            return False
+        self.reset()
+        return True
+
+    def reset(self):
+        """
+        Remove every chunk and empty the keyword index, in one exclusive step. The vector files are not
+        truncated, since other processes may have them mapped: the next generation starts with new files and
+        the old ones are unlinked (their pages stay valid for existing mappings).
+        """
+        self.open()
+        with self.write_guard(), self._lock.write():
+            old_generation = self._generation
+            with self._db_lock:
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES ('generation', ?)", (str(old_generation + 1),)
+                )
+                self._conn.commit()
+            self._clear_state()
+            self._generation = old_generation + 1
+            for path, _ in self._vector_files(old_generation):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.keyword_index.clear()
+        self._bump_version()
+        logging.info(f"Reset quantized vector store {self.collection_name}")
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+"""
+Process-wide adaptive token-bucket rate limiting for Gemini embedding and generation calls.
+
+Each limiter enforces a requests-per-minute and a tokens-per-minute budget. When the provider
+answers with 429 / quota errors the effective budget is halved and all callers pause briefly
+(multiplicative decrease); every success restores a little of the budget (additive increase).
+This replaces the fixed sleeps and per-call tenacity retries that used to be spread across the code.
+"""
+
+MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", "5"))
+BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10"))
+# Gemini free-tier defaults; override per deployment
+DEFAULT_LIMITS = {
+    "embedding": {"rpm": 1500, "tpm": 1_000_000},
+    "generation": {"rpm": 15, "tpm": 1_000_000},
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return max(1, len(text) // 4)
+
+
+_RATE_LIMIT_CLASSES = ("ResourceExhausted", "TooManyRequests", "RateLimitError")
+# Message fallback for wrapped errors without a status: a standalone 429 next to a rate-limit phrase,
+# or a provider's own wording (a bare "429" inside token counts, ids or sizes does not match)
+_RATE_LIMIT_MESSAGE = re.compile(
+    r"\b429\b.{0,80}\b(too many requests|rate.?limit|resource.?exhausted|quota)"
+    r"|\b(too many requests|rate.?limit|resource.?exhausted|quota)\b.{0,80}\b429\b"
+    r"|\bresource.?exhausted\b|\brate limit exceeded\b|\bquota exceeded\b|\bexceeded your current quota\b",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _status_code(e: BaseException):
+    """HTTP status carried by the exception (status_code, google.api_core's code, or an HTTP response), if any."""
+    for value in (getattr(e, "status_code", None), getattr(e, "code", None), getattr(getattr(e, "response", None), "status_code", None)):
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """
+    Whether a provider error means "slow down": the exception type or HTTP status first, then (for wrapped
+    errors without either) the message. Follows the chain of causes of wrapper exceptions.
+    """
+    seen = set()
+    error = e
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if any(cls.__name__ in _RATE_LIMIT_CLASSES for cls in type(error).__mro__):
+            return True
+        status = _status_code(error)
+        if status is not None:
+            return status == 429
+        if _RATE_LIMIT_MESSAGE.search(str(error)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float, min_scale: float = 0.05):
+        """
+        :param name: Limiter name used in logs and metrics
+        :param requests_per_minute: Configured request budget
+        :param tokens_per_minute: Configured token budget
+        :param min_scale: Lower bound for the adaptive budget multiplier
+        """
+        self.name = name
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.min_scale = min_scale
+        self._scale = 1.0
+        self._cond = threading.Condition()
+        now = time.monotonic()
+        self._last_refill = now
+        self._request_tokens = self._request_capacity()
+        self._token_tokens = self._token_capacity()
+        self._blocked_until = 0.0
+        self._consecutive_throttles = 0
+        # Metrics
+        self._waiting = 0
+        self._max_queue_depth = 0
+        self._acquired = 0
+        self._throttled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _request_rate(self) -> float:
+        return self.requests_per_minute * self._scale / 60.0
+
+    def _token_rate(self) -> float:
+        return self.tokens_per_minute * self._scale / 60.0
+
+    def _request_capacity(self) -> float:
+        return max(1.0, self._request_rate() * BURST_SECONDS)
+
+    def _token_capacity(self) -> float:
+        return max(1.0, self._token_rate() * BURST_SECONDS)
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_tokens = min(self._request_capacity(), self._request_tokens + elapsed * self._request_rate())
+        self._token_tokens = min(self._token_capacity(), self._token_tokens + elapsed * self._token_rate())
+
+    def _try_take(self, tokens: int, requests: int) -> float:
+        """
+        Take budget if available and return 0, otherwise return the seconds to wait before retrying.
+        Oversized requests are clamped to the bucket capacity so they can always proceed eventually.
+        Caller must hold self._cond.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        need_requests = min(float(requests), self._request_capacity())
+        need_tokens = min(float(tokens), self._token_capacity())
+        if now >= self._blocked_until and self._request_tokens >= need_requests and self._token_tokens >= need_tokens:
+            self._request_tokens -= need_requests
+            self._token_tokens -= need_tokens
+            return 0.0
+        wait = max(
+            self._blocked_until - now,
+            (need_requests - self._request_tokens) / self._request_rate(),
+            (need_tokens - self._token_tokens) / self._token_rate(),
+        )
+        return max(wait, 0.001)
+
+    def _record_wait(self, waited: float):
+        self._acquired += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+
+    def acquire(self, tokens: int = 1, requests: int = 1) -> float:
+        """
+        Block until `requests` requests and `tokens` tokens fit in the budget. Returns seconds waited.
+        """
+        start = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._waiting)
+            try:
+                while True:
+                    wait = self._try_take(tokens, requests)
+                    if not wait:
+                        break
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - start
+            self._record_wait(waited)
+        return waited
+
+    async def aacquire(self, tokens: int = 1, requests: int = 1) -> float:
+        """
+        Async counterpart of acquire: waits on the event loop instead of blocking a thread.
+        """
+        start = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._waiting)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(tokens, requests)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            with self._cond:
+                self._waiting -= 1
+                waited = time.monotonic() - start
+                self._record_wait(waited)
+        return waited
+
+    def record_usage(self, tokens: int):
+        """Debit tokens only known after the call (e.g. generated output tokens)."""
+        if tokens <= 0:
+            return
+        with self._cond:
+            self._token_tokens -= tokens
+
+    def on_success(self):
+        with self._cond:
+            self._consecutive_throttles = 0
+            if self._scale < 1.0:
+                self._scale = min(1.0, self._scale + 0.05)
+
+    def on_throttle(self):
+        with self._cond:
+            self._throttled += 1
+            self._consecutive_throttles += 1
+            self._scale = max(self.min_scale, self._scale * 0.5)
+            backoff = min(60.0, 2.0 ** self._consecutive_throttles)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + backoff)
+            # Drop any banked burst so the reduced rate takes effect immediately
+            self._request_tokens = min(self._request_tokens, 0.0)
+            self._token_tokens = min(self._token_tokens, 0.0)
+            self._cond.notify_all()
+        logging.warning(f"[RateLimiter:{self.name}] Provider throttled; budget scaled to {self._scale:.2f}, pausing {backoff:.0f}s")
+
+    def call(self, fn: Callable[..., Any], *args, tokens: int = 1, requests: int = 1, max_attempts: int = MAX_ATTEMPTS, **kwargs) -> Any:
+        """
+        Run fn under the limiter. Only rate-limit / quota errors are retried (after the limiter
+        backs off); every other error propagates immediately.
+        """
+        for attempt in range(1, max_attempts + 1):
+            self.acquire(tokens=tokens, requests=requests)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < max_attempts:
+                    self.on_throttle()
+                    continue
+                if is_rate_limit_error(e):
+                    self.on_throttle()
+                raise
+            self.on_success()
+            return result
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, tokens: int = 1, requests: int = 1, max_attempts: int = MAX_ATTEMPTS, **kwargs) -> Any:
+        """
+        Async counterpart of call for coroutine functions (e.g. llm.ainvoke).
+        """
+        for attempt in range(1, max_attempts + 1):
+            await self.aacquire(tokens=tokens, requests=requests)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                if is_rate_limit_error(e) and attempt < max_attempts:
+                    self.on_throttle()
+                    continue
+                if is_rate_limit_error(e):
+                    self.on_throttle()
+                raise
+            self.on_success()
+            return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "effective_requests_per_minute": round(self.requests_per_minute * self._scale, 2),
+                "effective_tokens_per_minute": round(self.tokens_per_minute * self._scale, 2),
+                "scale": round(self._scale, 3),
+                "queue_depth": self._waiting,
+                "max_queue_depth": self._max_queue_depth,
+                "acquired": self._acquired,
+                "throttled": self._throttled,
+                "avg_wait_seconds": round(self._total_wait / self._acquired, 4) if self._acquired else 0.0,
+                "max_wait_seconds": round(self._max_wait, 4),
+                "total_wait_seconds": round(self._total_wait, 4),
+            }
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> AdaptiveRateLimiter:
+    """
+    Return the process-wide limiter for `name` ('embedding' or 'generation'), configured from
+    <NAME>_RPM / <NAME>_TPM environment variables.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            defaults = DEFAULT_LIMITS.get(name, {"rpm": 60, "tpm": 1_000_000})
+            limiter = AdaptiveRateLimiter(
+                name,
+                requests_per_minute=float(os.getenv(f"{name.upper()}_RPM", defaults["rpm"])),
+                tokens_per_minute=float(os.getenv(f"{name.upper()}_TPM", defaults["tpm"])),
+            )
+            _limiters[name] = limiter
+        return limiter
+
+
+def rate_limit_metrics() -> Dict[str, Dict[str, Any]]:
+    for name in DEFAULT_LIMITS:
+        get_rate_limiter(name)
+    with _limiters_lock:
+        return {name: limiter.metrics() for name, limiter in _limiters.items()}
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embeddings wrapper that routes every provider call through the shared 'embedding' limiter."""
+
+    def __init__(self, underlying: Embeddings, limiter: AdaptiveRateLimiter = None, texts_per_request: int = 100):
+        self.underlying = underlying
+        self.limiter = limiter or get_rate_limiter("embedding")
+        # The provider batches this many texts into one API request
+        self.texts_per_request = texts_per_request
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.limiter.call(
+            self.underlying.embed_documents,
+            texts,
+            tokens=sum(estimate_tokens(t) for t in texts),
+            requests=math.ceil(len(texts) / self.texts_per_request),
+        )
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.limiter.call(self.underlying.embed_query, text, tokens=estimate_tokens(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return await self.limiter.acall(
+            self.underlying.aembed_documents,
+            texts,
+            tokens=sum(estimate_tokens(t) for t in texts),
+            requests=math.ceil(len(texts) / self.texts_per_request),
+        )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.limiter.acall(self.underlying.aembed_query, text, tokens=estimate_tokens(text))
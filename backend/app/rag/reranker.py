@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.metrics import count_chunks, stage_timer
+
+"""
+Re-ranking of retrieval candidates.
+
+Retrieval over-fetches RERANK_CANDIDATES fused candidates; a reranker scores each (query, chunk) pair
+and only the best k reach the prompt. Fewer, more relevant chunks mean a shorter prompt and faster
+generation than raising k.
+
+- `local`: CPU-only ONNX cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2). All pairs are
+  tokenized together and scored in large NumPy batches on a multi-threaded onnxruntime session.
+- Any callable `(query, texts) -> scores` can be plugged in through `CallableReranker`.
+
+Scores are cached per (query, chunk text) in an in-process LRU, so a repeated question or a chunk
+that keeps coming back as a candidate is scored once.
+"""
+
+# 'none' disables re-ranking; 'local' uses the ONNX cross-encoder
+RERANKER = os.getenv("RERANKER", "none").lower()
+# Fused candidates scored by the reranker (at least k)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_CACHE_MAX_ENTRIES = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "50000"))
+
+LOCAL_RERANKER_MODEL = os.getenv("LOCAL_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Directory holding model.onnx and tokenizer.json; if unset they are fetched from the Hugging Face hub once
+LOCAL_RERANKER_MODEL_DIR = os.getenv("LOCAL_RERANKER_MODEL_DIR")
+LOCAL_RERANKER_BATCH_SIZE = int(os.getenv("LOCAL_RERANKER_BATCH_SIZE", "64"))
+LOCAL_RERANKER_MAX_LENGTH = int(os.getenv("LOCAL_RERANKER_MAX_LENGTH", "512"))
+LOCAL_RERANKER_THREADS = int(os.getenv("LOCAL_RERANKER_THREADS", str(os.cpu_count() or 1)))
+
+
+class Reranker:
+    """Base class for rerankers; subclasses set model_name and implement score()."""
+
+    model_name: str = "unknown"
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Relevance of each text to the query; higher is better."""
+        raise NotImplementedError
+
+
+class CallableReranker(Reranker):
+    """Adapts a plain `(query, texts) -> scores` function (e.g. an LLM-based scorer)."""
+
+    def __init__(self, fn: Callable[[str, List[str]], Sequence[float]], model_name: str = "custom"):
+        self.fn = fn
+        self.model_name = model_name
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        return [float(s) for s in self.fn(query, texts)]
+
+
+class LocalCrossEncoder(Reranker):
+    def __init__(
+        self,
+        model: str = LOCAL_RERANKER_MODEL,
+        model_dir: Optional[str] = LOCAL_RERANKER_MODEL_DIR,
+        batch_size: int = LOCAL_RERANKER_BATCH_SIZE,
+        max_length: int = LOCAL_RERANKER_MAX_LENGTH,
+        threads: int = LOCAL_RERANKER_THREADS,
+    ):
+        """
+        :param model: Hugging Face repo id of a cross-encoder with an ONNX export
+        :param model_dir: Local directory with model.onnx and tokenizer.json (skips the download)
+        :param batch_size: Pairs per onnxruntime call
+        :param max_length: Token limit per (query, text) pair; the text is truncated first
+        :param threads: onnxruntime intra-op threads
+        """
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        from app.rag.embedding_providers import LocalOnnxEmbeddings
+
+        model_path, tokenizer_path = LocalOnnxEmbeddings._resolve_files(model, model_dir)
+        self.model_name = f"local/{model}"
+        self.batch_size = max(1, batch_size)
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length, strategy="only_second")
+        self.tokenizer.no_padding()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, threads)
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        logging.info(f"Loaded local reranker {model} ({model_path}, threads={threads}, batch_size={self.batch_size})")
+
+    def _score_batch(self, query: str, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch([(query, text) for text in texts])
+        width = max(len(e.ids) for e in encodings)
+        input_ids = np.zeros((len(texts), width), dtype=np.int64)
+        attention_mask = np.zeros((len(texts), width), dtype=np.int64)
+        token_type_ids = np.zeros((len(texts), width), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.attention_mask)] = encoding.attention_mask
+            token_type_ids[row, :len(encoding.type_ids)] = encoding.type_ids
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+        logits = np.asarray(logits, dtype=np.float32).reshape(len(texts), -1)
+        # Relevance models have a single logit; for multi-class heads the last class is "relevant"
+        return logits[:, -1]
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score all pairs; texts are sorted by length so each batch pads to a similar width.
+        """
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        scores = np.empty(len(texts), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            scores[idx] = self._score_batch(query, [texts[i] for i in idx])
+        return scores.tolist()
+
+
+class CachedReranker(Reranker):
+    """
+    LRU cache of scores keyed on (model, query, chunk text hash); only uncached pairs reach the scorer,
+    in one call per query.
+    """
+
+    def __init__(self, reranker: Reranker, max_entries: int = RERANK_CACHE_MAX_ENTRIES):
+        self.reranker = reranker
+        self.model_name = reranker.model_name
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, query: str, text: str) -> Tuple[str, str]:
+        query_key = hashlib.sha256(f"{self.model_name}\0{query}".encode("utf-8")).hexdigest()
+        return query_key, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        keys = [self._key(query, text) for text in texts]
+        scores: List[Optional[float]] = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._scores.get(key)
+                if cached is not None:
+                    self._scores.move_to_end(key)
+                    scores[i] = cached
+        missing = [i for i, s in enumerate(scores) if s is None]
+        if missing:
+            fresh = self.reranker.score(query, [texts[i] for i in missing])
+            with self._lock:
+                for i, value in zip(missing, fresh):
+                    scores[i] = value
+                    self._scores[keys[i]] = value
+                    self._scores.move_to_end(keys[i])
+                while len(self._scores) > self.max_entries:
+                    self._scores.popitem(last=False)
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return scores
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._scores),
+                "max_entries": self.max_entries,
+            }
+
+
+def get_reranker(name: str = RERANKER) -> Optional[CachedReranker]:
+    """
+    The configured reranker ('local'), wrapped in the score cache; None for 'none'.
+    """
+    if name in ("", "none", "off"):
+        return None
+    if name == "local":
+        return CachedReranker(LocalCrossEncoder())
+    raise ValueError(f"Unknown RERANKER: {name} (expected 'none' or 'local')")
+
+
+def rerank(reranker: Reranker, query: str, docs: List[Any], k: int) -> List[Any]:
+    """
+    The k best docs by reranker score (stable for ties, so the retrieval order breaks them). Each kept doc
+    gets its score in metadata['rerank_score'].
+    """
+    if not docs:
+        return []
+    with stage_timer("retrieve", "rerank"):
+        scores = reranker.score(query, [doc.page_content for doc in docs])
+    count_chunks("retrieve", "reranked", len(docs))
+    order = sorted(range(len(docs)), key=lambda i: -scores[i])[:k]
+    results = []
+    for i in order:
+        doc = docs[i]
+        doc.metadata = {**doc.metadata, "rerank_score": float(scores[i])}
+        results.append(doc)
+    return results
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+"""
+In-process LRU cache of retrieval results.
+
+Entries are keyed on (query, k, keywords, metadata filter) and tagged with the vector store's
+corpus version at the time the search started. Every write to the store bumps the version, so an
+entry is only served while the corpus is exactly the one it was computed from; stale entries are
+dropped when looked up or evicted. A hit skips the query embedding, both searches and re-ranking.
+"""
+
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "1000"))
+
+
+def _copy(docs: List[Document]) -> List[Document]:
+    # Callers may annotate metadata; never hand out the cached objects themselves
+    return [Document(id=d.id, page_content=d.page_content, metadata=dict(d.metadata)) for d in docs]
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES):
+        """
+        :param max_entries: LRU bound; 0 disables the cache
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, List[Document]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @staticmethod
+    def key(query: str, k: int, keywords: Optional[list], metadata_filter: Optional[dict]) -> str:
+        return json.dumps(
+            {"query": query, "k": k, "keywords": keywords or [], "filter": metadata_filter or {}},
+            sort_keys=True,
+            default=str,
+        )
+
+    def get(self, key: str, version: int) -> Optional[List[Document]]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                del self._entries[key]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _copy(entry[1])
+
+    def put(self, key: str, version: int, docs: List[Document]):
+        """
+        :param version: corpus version read before the search started
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, _copy(docs))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+            }
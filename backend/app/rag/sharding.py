@@ -0,0 +1,96 @@
+import os
+import re
+from typing import Any, Dict, Iterable, Optional, Set
+
+"""
+Routing of chunks to vector store shards.
+
+With VECTOR_SHARD_BY=none (the default) every chunk lives in the single legacy collection. Otherwise
+each chunk is routed by its metadata to one shard, stored as its own Chroma collection:
+- `file_group`: `g<file_id % VECTOR_FILE_GROUPS>`, so one file's chunks always share a shard;
+- `tenant`: the chunk's `tenant` metadata value (the file's tenant, given at upload).
+Chunks without a routing key go to the `default` shard, which is the legacy collection itself.
+
+A query whose filter pins the routing key (a file_id or tenant, `$eq`/`$in`, also inside `$and`)
+only searches the shards it can match; anything else fans out to every shard.
+"""
+
+# 'none' (single collection), 'file_group' or 'tenant'
+VECTOR_SHARD_BY = os.getenv("VECTOR_SHARD_BY", "none").lower()
+# Number of file groups for VECTOR_SHARD_BY=file_group; changing it requires a re-ingest
+VECTOR_FILE_GROUPS = int(os.getenv("VECTOR_FILE_GROUPS", "16"))
+DEFAULT_SHARD = "default"
+
+_ROUTING_KEYS = {"file_group": "file_id", "tenant": "tenant"}
+
+
+def _slug(value: Any) -> str:
+    # Chroma collection names allow [A-Za-z0-9._-]
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", str(value)).strip("_")[:40] or DEFAULT_SHARD
+
+
+def _values(condition: Any) -> Optional[Set[Any]]:
+    """The values a single-key condition allows, or None if it does not pin them."""
+    if not isinstance(condition, dict):
+        return {condition}
+    if set(condition) == {"$eq"}:
+        return {condition["$eq"]}
+    if set(condition) == {"$in"}:
+        return set(condition["$in"])
+    return None
+
+
+class ShardRouter:
+    def __init__(self, shard_by: str = VECTOR_SHARD_BY, file_groups: int = VECTOR_FILE_GROUPS):
+        """
+        :param shard_by: 'none', 'file_group' or 'tenant'
+        :param file_groups: Shard count for file_group routing
+        """
+        if shard_by in ("", "off"):
+            shard_by = "none"
+        if shard_by != "none" and shard_by not in _ROUTING_KEYS:
+            raise ValueError(f"Unknown VECTOR_SHARD_BY: {shard_by} (expected 'none', 'file_group' or 'tenant')")
+        self.shard_by = shard_by
+        self.file_groups = max(1, file_groups)
+        self.key = _ROUTING_KEYS.get(shard_by)
+
+    @property
+    def enabled(self) -> bool:
+        return self.key is not None
+
+    def shard_for_value(self, value: Any) -> str:
+        if value is None or not self.enabled:
+            return DEFAULT_SHARD
+        if self.shard_by == "file_group":
+            try:
+                return f"g{int(value) % self.file_groups}"
+            except (TypeError, ValueError):
+                return DEFAULT_SHARD
+        return _slug(value)
+
+    def shard_for(self, metadata: Optional[Dict[str, Any]]) -> str:
+        """The shard a chunk with this metadata is stored in."""
+        return self.shard_for_value((metadata or {}).get(self.key)) if self.enabled else DEFAULT_SHARD
+
+    def shards_for_values(self, values: Iterable[Any]) -> Set[str]:
+        return {self.shard_for_value(value) for value in values}
+
+    def shards_for_filter(self, where: Optional[Dict[str, Any]]) -> Optional[Set[str]]:
+        """
+        Shards that can hold chunks matching a Chroma `where` filter; None when every shard must be searched.
+        """
+        if not self.enabled or not where:
+            return None
+        values = self._filter_values(where)
+        return None if values is None else self.shards_for_values(values)
+
+    def _filter_values(self, where: Dict[str, Any]) -> Optional[Set[Any]]:
+        if "$and" in where:
+            pinned = [v for v in (self._filter_values(part) for part in where["$and"]) if v is not None]
+            return set.intersection(*pinned) if pinned else None
+        if "$or" in where:
+            parts = [self._filter_values(part) for part in where["$or"]]
+            return None if any(v is None for v in parts) else set().union(*parts)
+        if self.key in where:
+            return _values(where[self.key])
+        return None
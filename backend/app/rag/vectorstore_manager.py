@@ -0,0 +1,439 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.concurrency import ReadWriteLock
+from app.rag.keyword_index import KeywordIndex
+from app.rag.sharding import DEFAULT_SHARD, ShardRouter
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+"""
+Lifecycle manager for the vector store.
+
+Owns the single long-lived Chroma client and collection for the process, together with the
+keyword index that mirrors it. Every read and write goes through here under a shared lock;
+a full reset swaps the collection under the exclusive lock, so concurrent readers see either
+the old corpus or the new empty one, never a half-reset store or a dropped collection handle.
+
+The Chroma client is opened on first use (or by `open()`): importing chromadb and loading the
+collection is a large part of cold start, and nothing needs it before the first request.
+
+Every completed write bumps `corpus_version`, a monotonically increasing counter that caches of
+search results are tagged with (see retrieval_cache.py).
+
+With VECTOR_SHARD_BY set (see sharding.py) the corpus is split over several collections, one per
+shard: writes are grouped by shard, a query filtered to one file or tenant only searches that
+shard, and any other query runs on every shard in parallel with the per-shard top-k merged by
+distance. `drop_shard()` removes a whole shard by deleting its collection.
+
+With CHROMA_HOST set the collections live on a Chroma server (HttpClient), which every worker
+process shares. An embedded client only sees other processes' writes after `refresh()`; writes
+are wrapped in `write_guard` so the app can serialize them across workers (see worker_sync.py).
+"""
+
+COLLECTION_NAME = "langchain"
+# Chroma's limit on collection name length
+MAX_COLLECTION_NAME = 63
+# Threads for querying shards in parallel
+VECTOR_SEARCH_WORKERS = int(os.getenv("VECTOR_SEARCH_WORKERS", "8"))
+# Chroma server (`chroma run`); when set, the store is opened through an HttpClient instead of on disk
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
+
+def _chroma_metadata(metadata: Optional[dict]) -> dict:
+    """Chroma only stores scalar metadata values; drop None and stringify anything else."""
+    clean = {}
+    for key, value in (metadata or {}).items():
+        if value is None:
+            continue
+        clean[key] = value if isinstance(value, (str, int, float, bool)) else str(value)
+    return clean
+
+
+def file_ids_filter(file_ids: List[Any]) -> Dict[str, Any]:
+    return {"file_id": file_ids[0]} if len(file_ids) == 1 else {"file_id": {"$in": file_ids}}
+
+
+class VectorStoreManager:
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function: Embeddings,
+        keyword_index: KeywordIndex,
+        collection_name: str = COLLECTION_NAME,
+        embedding_model: Optional[str] = None,
+        embedding_dimension: Optional[int] = None,
+        router: Optional[ShardRouter] = None,
+        host: Optional[str] = CHROMA_HOST,
+        port: int = CHROMA_PORT,
+    ):
+        """
+        :param persist_directory: ChromaDB persistence directory
+        :param embedding_function: Embeddings used by Chroma for text queries
+        :param keyword_index: BM25 index kept in sync with the collection
+        :param collection_name: Chroma collection holding the chunks (the default shard; other shards are named after it)
+        :param embedding_model: Embedding model of the vectors; recorded on the collection and checked on open
+        :param embedding_dimension: Vector dimension; recorded on the collection and checked on every upsert
+        :param router: Chunk-to-shard routing; defaults to VECTOR_SHARD_BY
+        :param host: Chroma server host; persist_directory is unused when set
+        :param port: Chroma server port
+        """
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.keyword_index = keyword_index
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.embedding_dimension = embedding_dimension
+        self.router = router or ShardRouter()
+        self.host = host
+        self.port = port
+        # Entered around every write, outside the store lock (replaced by the app in multi-worker mode)
+        self.write_guard: Callable[[], ContextManager] = nullcontext
+        self._lock = ReadWriteLock()
+        self._version = 0
+        self._version_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self.client = None
+        self._vectorstore = None
+        # shard -> open collection wrapper; the default shard is always present once opened
+        self._shards: Dict[str, "Chroma"] = {}
+        # Whether the default shard may hold routed chunks (ingested before sharding was enabled)
+        self._default_has_data = False
+        self._search_executor = (
+            ThreadPoolExecutor(max_workers=VECTOR_SEARCH_WORKERS, thread_name_prefix="shard-search") if self.router.enabled else None
+        )
+
+    def open(self) -> "Chroma":
+        """
+        Create the Chroma client and open the collections, once.
+        """
+        if self._vectorstore is None:
+            with self._open_lock:
+                if self._vectorstore is None:
+                    import chromadb
+
+                    if self.remote:
+                        self.client = chromadb.HttpClient(host=self.host, port=self.port)
+                    else:
+                        self.client = chromadb.PersistentClient(path=self.persist_directory)
+                    default = self._open_collection(self.collection_name)
+                    self._shards = {DEFAULT_SHARD: default}
+                    if self.router.enabled:
+                        self._shards.update(self._discover_shards())
+                        self._default_has_data = default._collection.count() > 0
+                    self._vectorstore = default
+                    logging.info(
+                        f"Opened Chroma collection {self.collection_name} at "
+                        f"{f'{self.host}:{self.port}' if self.remote else self.persist_directory}"
+                        + (f" ({len(self._shards)} shards by {self.router.shard_by})" if self.router.enabled else "")
+                    )
+        return self._vectorstore
+
+    @property
+    def remote(self) -> bool:
+        return bool(self.host)
+
+    def refresh(self):
+        """
+        Make writes by other processes visible. An embedded client is reopened (its HNSW index is loaded
+        from disk again); a server client already sees them. Cached results become stale either way.
+        """
+        if self._vectorstore is not None and not self.remote:
+            with self._lock.write():
+                system = getattr(self.client, "_system", None)
+                self.client.clear_system_cache()
+                if system is not None:
+                    system.stop()
+                self._vectorstore = None
+                self._shards = {}
+                self.open()
+        self._bump_version()
+
+    def _space_metadata(self) -> Dict[str, Any]:
+        return _chroma_metadata({"embedding_model": self.embedding_model, "embedding_dimension": self.embedding_dimension})
+
+    def _shard_collection_name(self, shard: str) -> str:
+        if shard == DEFAULT_SHARD:
+            return self.collection_name
+        name = f"{self.collection_name}__{shard}"
+        if len(name) <= MAX_COLLECTION_NAME:
+            return name
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+        return f"{self.collection_name[:MAX_COLLECTION_NAME - 18]}__{digest}"
+
+    def _discover_shards(self) -> Dict[str, "Chroma"]:
+        """
+        Open the existing shard collections of this collection (tagged with shard_of on creation).
+        """
+        prefix = self.collection_name[:MAX_COLLECTION_NAME - 18] + "__"
+        shards = {}
+        for name in self.client.list_collections():
+            # chromadb >= 0.6 lists names; older versions list Collection objects
+            name = name if isinstance(name, str) else name.name
+            if not name.startswith(prefix):
+                continue
+            metadata = self.client.get_collection(name).metadata or {}
+            if metadata.get("shard_of") == self.collection_name and metadata.get("shard"):
+                shards[metadata["shard"]] = self._open_collection(name, metadata["shard"])
+        return shards
+
+    def _open_collection(self, name: str, shard: str = DEFAULT_SHARD) -> "Chroma":
+        from langchain_chroma import Chroma
+
+        space = self._space_metadata()
+        tags = {} if shard == DEFAULT_SHARD else {"shard_of": self.collection_name, "shard": shard}
+        vectorstore = Chroma(
+            client=self.client,
+            collection_name=name,
+            embedding_function=self.embedding_function,
+            collection_metadata={**space, **tags} or None,
+        )
+        collection = vectorstore._collection
+        existing = collection.metadata or {}
+        for key, value in space.items():
+            if key in existing and existing[key] != value:
+                raise ValueError(
+                    f"Chroma collection {name} holds {existing.get('embedding_model')}/"
+                    f"{existing.get('embedding_dimension')} vectors, not {self.embedding_model}/{self.embedding_dimension}"
+                )
+        if space and any(key not in existing for key in space):
+            # Collection created before embedding spaces were recorded: tag it now
+            collection.modify(metadata={**{k: v for k, v in existing.items() if not k.startswith("hnsw:")}, **space})
+        return vectorstore
+
+    def _shard(self, shard: str) -> "Chroma":
+        """
+        The collection of a shard, created on first write.
+        """
+        self.open()
+        vectorstore = self._shards.get(shard)
+        if vectorstore is None:
+            with self._open_lock:
+                vectorstore = self._shards.get(shard)
+                if vectorstore is None:
+                    vectorstore = self._open_collection(self._shard_collection_name(shard), shard)
+                    self._shards = {**self._shards, shard: vectorstore}
+                    logging.info(f"Created vector store shard {shard} ({vectorstore._collection.name})")
+        return vectorstore
+
+    def _targets(self, shards: Optional[Set[str]] = None) -> List["Chroma"]:
+        """
+        Open collections of the given shards (all shards for None), in a stable order.
+        Routed lookups also include the default shard while it may hold pre-sharding chunks.
+        """
+        self.open()
+        current = self._shards
+        if shards is None:
+            names = current
+        else:
+            names = set(shards) | ({DEFAULT_SHARD} if self._default_has_data else set())
+        return [current[name] for name in sorted(names, key=lambda n: (n != DEFAULT_SHARD, n)) if name in current]
+
+    @property
+    def vectorstore(self) -> "Chroma":
+        """The default shard's collection (the only one unless sharding is enabled)."""
+        return self.open()
+
+    @property
+    def shards(self) -> List[str]:
+        self.open()
+        return sorted(self._shards)
+
+    @property
+    def corpus_version(self) -> int:
+        return self._version
+
+    def _bump_version(self):
+        # Called after a write completes: a search that read the old version may have missed the write
+        with self._version_lock:
+            self._version += 1
+
+    def _group_by_shard(self, ids: List[str], docs: List[Document], vectors: Optional[List[List[float]]] = None) -> Dict[str, Tuple[list, list, list]]:
+        groups: Dict[str, Tuple[list, list, list]] = {}
+        for i, (chunk_id, doc) in enumerate(zip(ids, docs)):
+            group = groups.setdefault(self.router.shard_for(doc.metadata), ([], [], []))
+            group[0].append(chunk_id)
+            group[1].append(doc)
+            if vectors is not None:
+                group[2].append(vectors[i])
+        return groups
+
+    def count(self) -> int:
+        with self._lock.read():
+            return sum(store._collection.count() for store in self._targets())
+
+    def get_page(self, limit: int, offset: int, include: Iterable[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        """
+        One page of the corpus; shards are read one after another in a stable order.
+        """
+        include = list(include)
+        with self._lock.read():
+            targets = self._targets()
+            if len(targets) == 1:
+                return targets[0]._collection.get(include=include, limit=limit, offset=offset)
+            page: Dict[str, list] = {"ids": [], **{key: [] for key in include}}
+            for store in targets:
+                size = store._collection.count()
+                if offset >= size:
+                    offset -= size
+                    continue
+                part = store._collection.get(include=include, limit=limit - len(page["ids"]), offset=offset)
+                offset = 0
+                for key in page:
+                    page[key].extend(part[key])
+                if len(page["ids"]) >= limit:
+                    break
+            return page
+
+    def similarity_search(self, query: str, k: int, filter: Optional[dict] = None) -> List[Document]:
+        if not self.router.enabled:
+            with self._lock.read():
+                return self.vectorstore.similarity_search(query, k=k, filter=filter)
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(self, vector: List[float], k: int, filter: Optional[dict] = None) -> List[Document]:
+        """
+        Nearest chunks across the shards the filter can match (per-shard top-k merged by distance).
+        """
+        with self._lock.read():
+            targets = self._targets(self.router.shards_for_filter(filter))
+            if len(targets) == 1:
+                return targets[0].similarity_search_by_vector(vector, k=k, filter=filter)
+            if not targets:
+                return []
+            futures = [
+                self._search_executor.submit(store.similarity_search_by_vector_with_relevance_scores, vector, k=k, filter=filter)
+                for store in targets
+            ]
+            scored = [pair for future in futures for pair in future.result()]
+        # Chroma returns distances: lower is closer
+        scored.sort(key=lambda pair: pair[1])
+        return [doc for doc, _ in scored[:k]]
+
+    def upsert(self, ids: List[str], docs: List[Document], vectors: List[List[float]]):
+        """
+        Bulk-upsert documents with precomputed embeddings into their shards and the keyword index.
+        """
+        if self.embedding_dimension and vectors and len(vectors[0]) != self.embedding_dimension:
+            raise ValueError(
+                f"Got {len(vectors[0])}-dimensional vectors for collection {self.collection_name} "
+                f"({self.embedding_model}, {self.embedding_dimension} dimensions)"
+            )
+        with self.write_guard(), self._lock.read():
+            for shard, (shard_ids, shard_docs, shard_vectors) in self._group_by_shard(ids, docs, vectors).items():
+                self._shard(shard)._collection.upsert(
+                    ids=shard_ids,
+                    embeddings=shard_vectors,
+                    documents=[d.page_content for d in shard_docs],
+                    metadatas=[_chroma_metadata(d.metadata) for d in shard_docs],
+                )
+                if shard == DEFAULT_SHARD:
+                    self._default_has_data = True
+            self.keyword_index.add(ids, docs)
+        self._bump_version()
+
+    def update_metadata(self, ids: List[str], docs: List[Document]):
+        with self.write_guard(), self._lock.read():
+            for shard, (shard_ids, shard_docs, _) in self._group_by_shard(ids, docs).items():
+                self._shard(shard)._collection.update(ids=shard_ids, metadatas=[_chroma_metadata(d.metadata) for d in shard_docs])
+            self.keyword_index.add(ids, docs)
+        self._bump_version()
+
+    def existing_ids(self, ids: Iterable[str]) -> List[str]:
+        """The subset of ids present in the store."""
+        ids = list(ids)
+        found: List[str] = []
+        with self._lock.read():
+            for store in self._targets():
+                for i in range(0, len(ids), 5000):
+                    found.extend(store._collection.get(ids=ids[i:i + 5000], include=[])["ids"])
+        return found
+
+    def ids_for_file(self, file_id: Any) -> List[str]:
+        """Ids of every chunk stored for a file."""
+        where = {"file_id": file_id}
+        found: List[str] = []
+        with self._lock.read():
+            for store in self._targets(self.router.shards_for_filter(where)):
+                found.extend(store._collection.get(where=where, include=[])["ids"])
+        return found
+
+    def delete_ids(self, ids: List[str]):
+        if not ids:
+            return
+        with self.write_guard(), self._lock.read():
+            for store in self._targets():
+                store._collection.delete(ids=ids)
+            self.keyword_index.delete_ids(ids)
+        self._bump_version()
+
+    def delete_where(self, where: dict):
+        with self.write_guard(), self._lock.read():
+            for store in self._targets(self.router.shards_for_filter(where)):
+                store._collection.delete(where=where)
+            self.keyword_index.delete_where(where)
+        self._bump_version()
+
+    def delete_file_ids(self, file_ids: Iterable[Any]):
+        """
+        Remove every chunk of the given files with one filtered delete per store (per shard when sharded).
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        if file_ids:
+            self.delete_where(file_ids_filter(file_ids))
+
+    def _drop_collection(self, vectorstore: "Chroma"):
+        name = vectorstore._collection.name
+        try:
+            self.client.delete_collection(name)
+        except Exception as e:
+            # Already missing (e.g. never written to); recreating is enough
+            logging.info(f"Chroma collection {name} not deleted: {e}")
+
+    def drop_shard(self, shard: str) -> bool:
+        """
+        Remove a whole shard by deleting its collection (no per-chunk deletes in Chroma); its chunks are
+        also removed from the keyword index by their shard column. The default shard is recreated empty.
+        :return: False if the shard does not exist
+        """
+        self.open()
+        with self.write_guard(), self._lock.write():
+            vectorstore = self._shards.get(shard)
+            if vectorstore is None:
+                return False
+            count = vectorstore._collection.count()
+            self._drop_collection(vectorstore)
+            shards = {name: store for name, store in self._shards.items() if name != shard}
+            if shard == DEFAULT_SHARD:
+                shards[DEFAULT_SHARD] = self._vectorstore = self._open_collection(self.collection_name)
+                self._default_has_data = False
+            self._shards = shards
+            self.keyword_index.delete_shard(shard)
+        self._bump_version()
+        logging.info(f"Dropped vector store shard {shard} ({count} chunks)")
+        return True
+
+    def reset(self):
+        """
+        Drop every shard collection, recreate the default one and empty the keyword index in one exclusive step.
+        """
+        self.open()
+        with self.write_guard(), self._lock.write():
+            for vectorstore in self._shards.values():
+                self._drop_collection(vectorstore)
+            self._vectorstore = self._open_collection(self.collection_name)
+            self._shards = {DEFAULT_SHARD: self._vectorstore}
+            self._default_has_data = False
+            self.keyword_index.clear()
+        self._bump_version()
+        logging.info(f"Reset vector store collection {self.collection_name}")
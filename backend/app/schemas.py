@@ -1,10 +1,22 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 from datetime import datetime
 
 class FileUploadResponse(BaseModel):
     id: int
     filename: str
+    job_id: Optional[int] = None
+    status: Optional[str] = None
+
+class IngestJobResponse(BaseModel):
+    id: int
+    file_id: Optional[int]
+    status: str
+    chunks_done: int
+    chunks_total: Optional[int]
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
 
 class FileListItem(BaseModel):
     id: int
@@ -15,6 +27,36 @@ class FileListItem(BaseModel):
 class FileListResponse(BaseModel):
     files: List[FileListItem]
 
+class FileBulkDeleteRequest(BaseModel):
+    file_ids: List[int]
+
+class ImportDirectoryRequest(BaseModel):
+    directory: str = Field(..., min_length=1)
+    recursive: bool = True
+    tenant: Optional[str] = Field(None, min_length=1, max_length=64)
+
+class ImportDirectoryResponse(BaseModel):
+    status: str
+    files: List[FileUploadResponse]
+    skipped: List[str]
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1)
+    size: int = Field(..., ge=0)
+    sha256: Optional[str] = Field(None, min_length=64, max_length=64)
+    tenant: Optional[str] = Field(None, min_length=1, max_length=64)
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+    status: str
+    file_id: Optional[int] = None
+
+class UploadCompleteRequest(BaseModel):
+    session_ids: List[str] = Field(..., min_length=1)
+
 class ChatRequest(BaseModel):
     """
     Chat request for hybrid RAG retrieval.
@@ -34,6 +76,8 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: List[Any]
+    # Prompt size and what the context builder kept, deduplicated, merged or cut; absent for cached answers
+    context: Optional[Dict[str, Any]] = None
 
 class AdminClearAllResponse(BaseModel):
     status: str
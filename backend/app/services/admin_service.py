@@ -1,9 +1,10 @@
 from sqlalchemy.orm import Session
-from app.db.models import File as DBFile, ChatHistory
+from app.db.models import File as DBFile, ChatHistory, Chunk
 from app.log_utils import safe_log_gotcha
 from fastapi import HTTPException
 from datetime import datetime
 from typing import Any, Dict
+from app.services.file_service import delete_file
 
 def clear_all_service(admin_token: str, db: Session, rag_pipeline, admin_env_token: str) -> Dict[str, Any]:
     """
@@ -13,19 +14,43 @@ def clear_all_service(admin_token: str, db: Session, rag_pipeline, admin_env_tok
         raise HTTPException(status_code=401, detail="Unauthorized")
     # Delete all chat history
     chat_count = db.query(ChatHistory).delete()
-    # Delete all files
+    # Delete all files and their chunk records
+    db.query(Chunk).delete()
     file_count = db.query(DBFile).delete()
     db.commit()
     # Delete all embeddings from vectorstore
     try:
-        vec_data = rag_pipeline.vectorstore.get()
-        all_ids = vec_data.get('ids', [])
-        if all_ids:
-            rag_pipeline.vectorstore.delete(ids=all_ids)
-        from app.rag.pipeline import RAGPipeline
-        rag_pipeline.vectorstore = RAGPipeline(vector_db_path=rag_pipeline.vector_db_path).vectorstore
+        rag_pipeline.clear()
         safe_log_gotcha(f"[AdminClearAll] All files and chats deleted at {datetime.now().isoformat()}")
     except Exception as e:
         safe_log_gotcha(f"[AdminClearAll] Vectorstore clear failed: {e}")
         raise HTTPException(status_code=500, detail=f"Vectorstore clear failed: {e}")
     return {"status": "cleared", "files_deleted": file_count, "chats_deleted": chat_count}
+
+def drop_shard_service(shard: str, admin_token: str, db: Session, rag_pipeline, admin_env_token: str) -> Dict[str, Any]:
+    """
+    Delete one vector store shard (a tenant or file group) with every file routed to it: the shard's collection
+    and keyword index rows at once, then the files' chunk records, rows and files on disk. Requires admin-token.
+    """
+    if admin_token != admin_env_token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if shard not in rag_pipeline.store.shards:
+        raise HTTPException(status_code=404, detail=f"Shard not found: {shard}")
+    file_ids = {
+        file_id
+        for file_id, tenant in db.query(DBFile.id, DBFile.tenant)
+        if rag_pipeline.shard_for({"file_id": file_id, "tenant": tenant}) == shard
+    }
+    file_ids.update(file_id for (file_id,) in db.query(Chunk.file_id).filter(Chunk.shard == shard).distinct())
+    db.query(Chunk).filter(Chunk.shard == shard).delete()
+    db.commit()
+    warnings = []
+    for file_id in sorted(file_ids):
+        warnings.extend(delete_file(file_id, db).get("warnings", []))
+    try:
+        rag_pipeline.drop_shard(shard)
+    except Exception as e:
+        safe_log_gotcha(f"[AdminDropShard] Vectorstore drop of shard {shard} failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Vectorstore drop failed: {e}")
+    safe_log_gotcha(f"[AdminDropShard] Shard {shard} dropped with {len(file_ids)} files at {datetime.now().isoformat()}")
+    return {"status": "dropped", "shard": shard, "file_ids": sorted(file_ids), "warnings": warnings}
@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().strip("?!. ").lower()
+
+
+def cache_scope(file_id: Optional[int], metadata_filter: Optional[dict], k: Optional[int], keywords: Optional[list] = None) -> str:
+    """Everything besides the question that changes the answer; semantic matches never cross scopes."""
+    return json.dumps(
+        {"file_id": file_id, "filter": metadata_filter or {}, "k": k, "keywords": sorted(keywords or [])},
+        sort_keys=True,
+        default=str,
+    )
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Any]
+    scope: str
+    file_ids: Set[str]
+    filenames: Set[str]
+    created_at: float
+    embedding: Optional[np.ndarray] = None
+    hits: int = field(default=0)
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of chat answers keyed on (normalized question, file_id, metadata_filter, k, keywords).
+    Optional semantic mode reuses an answer for a near-duplicate question in the same scope when the
+    cosine similarity of the question embeddings reaches the threshold. Entries expire after a TTL and
+    are dropped as soon as any file among their sources is deleted or re-uploaded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        semantic: bool = ANSWER_CACHE_SEMANTIC,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _expired(self, entry: CachedAnswer, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def get(self, question: str, scope: str, embed_fn: Optional[Callable[[str], List[float]]] = None) -> Tuple[Optional[CachedAnswer], str]:
+        """
+        Look up an answer. Returns (entry, status) with status 'HIT', 'SEMANTIC-HIT' or 'MISS'.
+        embed_fn is only called in semantic mode, after an exact miss.
+        """
+        key = (normalize_question(question), scope)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self.hits += 1
+                return entry, "HIT"
+        if self.semantic and embed_fn:
+            query = _unit(embed_fn(question))
+            with self._lock:
+                best, best_score = None, self.similarity_threshold
+                for candidate_key, candidate in list(self._entries.items()):
+                    if candidate.scope != scope or candidate.embedding is None:
+                        continue
+                    if self._expired(candidate, now):
+                        del self._entries[candidate_key]
+                        continue
+                    score = float(np.dot(query, candidate.embedding))
+                    if score >= best_score:
+                        best, best_score = candidate_key, score
+                if best:
+                    entry = self._entries[best]
+                    self._entries.move_to_end(best)
+                    entry.hits += 1
+                    self.semantic_hits += 1
+                    return entry, "SEMANTIC-HIT"
+        with self._lock:
+            self.misses += 1
+        return None, "MISS"
+
+    def put(
+        self,
+        question: str,
+        scope: str,
+        answer: str,
+        sources: List[Any],
+        file_ids: Iterable[Any],
+        filenames: Iterable[str],
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+    ) -> None:
+        embedding = _unit(embed_fn(question)) if self.semantic and embed_fn else None
+        entry = CachedAnswer(
+            answer=answer,
+            sources=list(sources),
+            scope=scope,
+            file_ids={str(f) for f in file_ids if f is not None},
+            filenames={f for f in filenames if f},
+            created_at=time.time(),
+            embedding=embedding,
+        )
+        key = (normalize_question(question), scope)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_files(self, file_ids: Iterable[Any] = (), filenames: Iterable[str] = ()) -> int:
+        """Drop every entry whose sources include any of the given files. Returns the number dropped."""
+        ids = {str(f) for f in file_ids}
+        names = set(filenames)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.file_ids & ids or entry.filenames & names]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "semantic": self.semantic,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
@@ -1,88 +1,250 @@
 from sqlalchemy.orm import Session
-from app.db.models import File as DBFile, ChatHistory
+from app.db.models import ChatHistory
 from app.log_utils import safe_log_gotcha
 from datetime import datetime
 from fastapi import HTTPException
-from typing import Optional, List, Dict, Any
-from tenacity import retry, stop_after_attempt, wait_exponential
+from typing import Optional, List, Dict, Any, AsyncIterator
+from app.rag.rate_limiter import get_rate_limiter, estimate_tokens, is_rate_limit_error
+from app.rag.context_builder import build_context
+from app.services.answer_cache import cache_scope
+from app.services.file_registry import live_files_filter
+from app.concurrency import run_blocking
+from app.metrics import count_chunks, count_tokens, observe_stage, stage_timer
+import json
+import os
+import re
 import time
 
-# The rag_pipeline and ollama_llm must be injected by the caller to avoid circular imports.
-def chat_service(
+NO_FILES_ANSWER = "No files are available for answering. Please upload a file first."
+SYSTEM_PROMPT = (
+    "You are a helpful AI assistant. Always answer in well-structured markdown. "
+    "Use headings, bullet points, spacing and tables where appropriate. "
+    "Format code and data for maximum readability."
+    "Keep it concise and to the point."
+    "If you don't know the answer, say so.\n"
+)
+
+# The rag_pipeline, llm and file_registry must be injected by the caller to avoid circular imports.
+async def achat_service(
     question: str,
     file_id: Optional[int],
     db: Session,
     rag_pipeline,
     llm,
+    file_registry,
     keywords: Optional[list] = None,
     metadata_filter: Optional[dict] = None,
-    k: Optional[int] = 4
+    k: Optional[int] = 4,
+    answer_cache=None,
+    cache_lookup: bool = True,
+    cache_store: bool = True
 ) -> Dict[str, Any]:
     """
     Handles chat logic: retrieves relevant docs (hybrid/vector/keyword/MMR), constructs prompt, calls LLM, logs history.
-    Includes rate limit handling and retries.
+    Retrieval and generation use the async LangChain interfaces (aembed_query, ainvoke); SQLite and Chroma calls
+    are offloaded to the bounded blocking-IO executor. The LLM call is paced by the shared generation rate limiter,
+    which retries only on 429/quota errors.
+    If an answer_cache is given, cached answers skip retrieval and the LLM; the returned "cache" dict reports
+    the cache status (HIT, SEMANTIC-HIT, MISS, BYPASS) and the entry age.
     """
-    db_files = db.query(DBFile).all()
-    if not db_files:
+    live_ids = file_registry.snapshot()
+    if not live_ids:
         safe_log_gotcha(f"[Chat] No files in DB at {datetime.now().isoformat()}")
-        return {"answer": "No files are available for answering. Please upload a file first.", "sources": []}
-    # Metadata filter by file_id if provided
-    if file_id:
-        if metadata_filter is None:
-            metadata_filter = {}
-        metadata_filter["file_id"] = file_id
-    docs = rag_pipeline.retrieve(
-        question,
-        k=k,
-        keywords=keywords,
-        metadata_filter=metadata_filter
-    )
-    # Filter docs so only those whose file_id is present in the current DB are used
-    current_file_ids = {str(f.id) for f in db_files}
-    docs = [d for d in docs if str(d.metadata.get("file_id")) in current_file_ids]
-    # Construct context
-    context = "\n\n".join([d.page_content for d in docs])
-    system_prompt = (
-        "You are a helpful AI assistant. Always answer in well-structured markdown. "
-        "Use headings, bullet points, spacing and tables where appropriate. "
-        "Format code and data for maximum readability."
-        "Keep it concise and to the point."
-        "If you don't know the answer, say so.\n"
-    )
-    prompt = f"{system_prompt}Context:\n{context}\n\nQuestion: {question}\nAnswer:"
-    
-    # Call LLM with retry for rate limits
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def get_llm_response():
-        try:
-            return llm.invoke(prompt)
-        except Exception as e:
-            if "quota" in str(e).lower() or "rate" in str(e).lower():
-                safe_log_gotcha(f"[Chat] Rate limit hit, retrying: {e}")
-                time.sleep(1)  # Rate limit protection
-                raise  # Retry
-            raise HTTPException(status_code=500, detail=f"LLM inference failed: {str(e)}")
-    
+        return {"answer": NO_FILES_ANSWER, "sources": [], "cache": {"status": "BYPASS"}}
+    scope = cache_scope(file_id, metadata_filter, k, keywords)
+    embed_fn = rag_pipeline.embeddings.embed_query
+    cache_status = "BYPASS"
+    if answer_cache is not None and cache_lookup:
+        with stage_timer("chat", "cache_lookup"):
+            cached, cache_status = await run_blocking(answer_cache.get, question, scope, embed_fn=embed_fn)
+        if cached:
+            with stage_timer("chat", "history_commit"):
+                await run_blocking(_log_chat, db, file_id, question, cached.answer)
+            return {
+                "answer": cached.answer,
+                "sources": cached.sources,
+                "cache": {"status": cache_status, "age": time.time() - cached.created_at},
+            }
+    docs, prompt, context = await _aretrieve_and_build_prompt("chat", question, file_id, live_ids, rag_pipeline, keywords, metadata_filter, k)
+    limiter = get_rate_limiter("generation")
     try:
-        answer = get_llm_response()
-        # Extract content from AIMessage
+        with stage_timer("chat", "llm"):
+            answer = await limiter.acall(llm.ainvoke, prompt, tokens=estimate_tokens(prompt))
         answer_content = answer.content if hasattr(answer, 'content') else str(answer)
     except Exception as e:
-        safe_log_gotcha(f"[Chat] LLM inference failed after retries: {str(e)} at {datetime.now().isoformat()}")
-        raise HTTPException(status_code=500, detail=f"LLM inference failed after retries: {str(e)}")
-    
-    # Log chat history
+        safe_log_gotcha(f"[Chat] LLM inference failed: {str(e)} at {datetime.now().isoformat()}")
+        if is_rate_limit_error(e):
+            raise HTTPException(status_code=429, detail=f"LLM rate limit exceeded: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"LLM inference failed: {str(e)}")
+    limiter.record_usage(estimate_tokens(answer_content))
+    count_tokens("chat", "completion", estimate_tokens(answer_content))
+    with stage_timer("chat", "history_commit"):
+        await run_blocking(_log_chat, db, file_id, question, answer_content)
+    sources = _summarize_sources(docs)
+    if answer_cache is not None and cache_store:
+        with stage_timer("chat", "cache_store"):
+            await run_blocking(_cache_answer, answer_cache, question, scope, answer_content, sources, docs, embed_fn)
+    return {"answer": answer_content, "sources": sources, "context": context, "cache": {"status": cache_status}}
+
+
+async def achat_stream_service(
+    question: str,
+    file_id: Optional[int],
+    session_factory,
+    rag_pipeline,
+    llm,
+    file_registry,
+    keywords: Optional[list] = None,
+    metadata_filter: Optional[dict] = None,
+    k: Optional[int] = 4,
+    answer_cache=None,
+    cache_lookup: bool = True,
+    cache_store: bool = True
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of achat_service, built on aretrieve and llm.astream. Yields NDJSON lines: one `sources`
+    event as soon as retrieval finishes, then `token` events as the model produces them, then `done` (or `error`).
+    ChatHistory is written once the stream completes. Uses its own DB session because the request-scoped one
+    may be closed while streaming.
+    """
+    db = await run_blocking(session_factory)
+    try:
+        live_ids = file_registry.snapshot()
+        if not live_ids:
+            safe_log_gotcha(f"[Chat] No files in DB at {datetime.now().isoformat()}")
+            yield _event("sources", sources=[], cache="BYPASS")
+            yield _event("token", content=NO_FILES_ANSWER)
+            yield _event("done")
+            return
+        scope = cache_scope(file_id, metadata_filter, k, keywords)
+        embed_fn = rag_pipeline.embeddings.embed_query
+        cache_status = "BYPASS"
+        if answer_cache is not None and cache_lookup:
+            with stage_timer("chat_stream", "cache_lookup"):
+                cached, cache_status = await run_blocking(answer_cache.get, question, scope, embed_fn=embed_fn)
+            if cached:
+                yield _event("sources", sources=cached.sources, cache=cache_status, age=int(time.time() - cached.created_at))
+                yield _event("token", content=cached.answer)
+                await run_blocking(_log_chat, db, file_id, question, cached.answer)
+                yield _event("done")
+                return
+        docs, prompt, context = await _aretrieve_and_build_prompt("chat_stream", question, file_id, live_ids, rag_pipeline, keywords, metadata_filter, k)
+        sources = _summarize_sources(docs)
+        yield _event("sources", sources=sources, cache=cache_status, context=context)
+
+        async def open_stream():
+            # Pull the first chunk inside the limiter so 429s before any output are still retried
+            stream = llm.astream(prompt).__aiter__()
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return first, stream
+
+        limiter = get_rate_limiter("generation")
+        parts: List[str] = []
+        try:
+            started = time.perf_counter()
+            with stage_timer("chat_stream", "llm_first_token"):
+                chunk, stream = await limiter.acall(open_stream, tokens=estimate_tokens(prompt))
+            while chunk is not None:
+                text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if text:
+                    parts.append(text)
+                    yield _event("token", content=text)
+                try:
+                    chunk = await stream.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+            observe_stage("chat_stream", "llm", time.perf_counter() - started)
+        except Exception as e:
+            safe_log_gotcha(f"[Chat] LLM streaming failed: {str(e)} at {datetime.now().isoformat()}")
+            status = 429 if is_rate_limit_error(e) else 500
+            yield _event("error", status=status, detail=f"LLM inference failed: {str(e)}")
+            return
+        answer_content = "".join(parts)
+        limiter.record_usage(estimate_tokens(answer_content))
+        count_tokens("chat_stream", "completion", estimate_tokens(answer_content))
+        with stage_timer("chat_stream", "history_commit"):
+            await run_blocking(_log_chat, db, file_id, question, answer_content)
+        if answer_cache is not None and cache_store:
+            with stage_timer("chat_stream", "cache_store"):
+                await run_blocking(_cache_answer, answer_cache, question, scope, answer_content, sources, docs, embed_fn)
+        yield _event("done")
+    finally:
+        await run_blocking(db.close)
+
+
+def _event(event_type: str, **fields) -> str:
+    return json.dumps({"type": event_type, **fields}) + "\n"
+
+
+def _build_prompt(question: str, docs, live_ids):
+    # Retrieval is already restricted to live files; this drops chunks of a file deleted while the query ran
+    docs = [d for d in docs if d.metadata.get("file_id") in live_ids]
+    # Deduplicated, merged and cut to the token budget; docs are the chunks that made it into the context
+    context, docs, report = build_context(docs)
+    prompt = f"{SYSTEM_PROMPT}Context:\n{context}\n\nQuestion: {question}\nAnswer:"
+    report.prompt_tokens = estimate_tokens(prompt)
+    return docs, prompt, report
+
+
+async def _aretrieve_and_build_prompt(operation, question, file_id, live_ids, rag_pipeline, keywords, metadata_filter, k):
+    docs = []
+    # A file that is not live has no chunks worth searching for
+    if not file_id or file_id in live_ids:
+        with stage_timer(operation, "retrieve"):
+            docs = await rag_pipeline.aretrieve(
+                question,
+                k=k,
+                keywords=keywords,
+                metadata_filter=live_files_filter(live_ids, file_id, metadata_filter)
+            )
+    return _timed_build_prompt(operation, question, docs, live_ids)
+
+
+def _timed_build_prompt(operation, question, docs, live_ids):
+    with stage_timer(operation, "build_prompt"):
+        docs, prompt, report = _build_prompt(question, docs, live_ids)
+    count_chunks(operation, "context", len(docs))
+    count_chunks(operation, "deduplicated", report.duplicates_removed)
+    count_chunks(operation, "merged", report.chunks_merged)
+    count_chunks(operation, "over_budget", report.chunks_dropped)
+    count_tokens(operation, "prompt", report.prompt_tokens)
+    return docs, prompt, report.to_dict()
+
+
+def _cache_answer(answer_cache, question, scope, answer, sources, docs, embed_fn):
+    # Only cache grounded answers: without sources there is nothing to invalidate them on
+    if not docs:
+        return
+    answer_cache.put(
+        question,
+        scope,
+        answer,
+        sources,
+        file_ids=[d.metadata.get("file_id") for d in docs],
+        filenames=[d.metadata.get("filename") for d in docs],
+        embed_fn=embed_fn,
+    )
+
+
+def _log_chat(db: Session, file_id: Optional[int], question: str, answer: str):
     chat = ChatHistory(
         user_id=None,
         file_id=file_id,
         question=question,
-        answer=answer_content,
+        answer=answer,
         timestamp=datetime.utcnow()
     )
     db.add(chat)
     db.commit()
-    # Only show unique document names in sources
-    import os, re
+
+
+def _summarize_sources(docs) -> List[str]:
+    """
+    Only show unique document names in sources: the file contributing the most retrieved chunks.
+    """
     # Count occurrences of each file among retrieved docs
     file_counts = {}
     for d in docs:
@@ -98,4 +260,4 @@ def chat_service(
         most_relevant_file = max(file_counts, key=file_counts.get)
     else:
         most_relevant_file = 'Unknown File'
-    return {"answer": answer_content, "sources": [most_relevant_file]}
+    return [most_relevant_file]
@@ -0,0 +1,68 @@
+from sqlalchemy.orm import Session
+from app.db.models import File as DBFile
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional
+import threading
+
+
+class LiveFileRegistry:
+    """
+    In-memory set of the file ids present in the `files` table, so the chat path never queries the DB for them.
+    Loaded once at startup and updated by upload, delete and clear_all. Writers swap in a new frozenset under
+    a lock; readers take `snapshot()` without locking.
+    """
+
+    def __init__(self, on_change: Optional[Callable[[], None]] = None):
+        """
+        :param on_change: called after add, discard or clear (not load), e.g. to notify other worker processes
+        """
+        self._ids: FrozenSet[int] = frozenset()
+        self._lock = threading.Lock()
+        self.on_change = on_change
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def load(self, db: Session) -> int:
+        ids = frozenset(file_id for (file_id,) in db.query(DBFile.id))
+        with self._lock:
+            self._ids = ids
+        return len(ids)
+
+    def add(self, file_id: int):
+        with self._lock:
+            self._ids = self._ids | {file_id}
+        self._changed()
+
+    def discard(self, file_ids: Iterable[int]):
+        with self._lock:
+            self._ids = self._ids - set(file_ids)
+        self._changed()
+
+    def clear(self):
+        with self._lock:
+            self._ids = frozenset()
+        self._changed()
+
+    def snapshot(self) -> FrozenSet[int]:
+        return self._ids
+
+    def __contains__(self, file_id: Any) -> bool:
+        return file_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+def live_files_filter(live_ids: FrozenSet[int], file_id: Optional[int] = None, metadata_filter: Optional[dict] = None) -> Dict[str, Any]:
+    """
+    Chroma/keyword-index `where` restricting retrieval to live files (or the single requested file),
+    combined with the caller's metadata filter.
+    """
+    if file_id:
+        conditions = [{"file_id": file_id}]
+    else:
+        conditions = [{"file_id": {"$in": sorted(live_ids)}}]
+    for key, value in (metadata_filter or {}).items():
+        conditions.append({key: value})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
@@ -1,34 +1,138 @@
 from fastapi import UploadFile, HTTPException, File, Depends
 from sqlalchemy.orm import Session
-from app.db.models import File as DBFile
+from app.db.models import File as DBFile, Chunk
 from app.rag.pipeline import SUPPORTED_EXTENSIONS
 from app.log_utils import safe_log_gotcha
 from datetime import datetime
+import hashlib
 import os
-import shutil
 import uuid
+from typing import BinaryIO, List, Optional, Tuple
 
 UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../data/files"))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Server-side directory that /api/admin/import may read from (unset: directory imports are disabled)
+IMPORT_ROOT = os.getenv("IMPORT_ROOT")
 
-def upload_file(file: UploadFile = File(...), db: Session = Depends()):
+def _save_and_hash(stream: BinaryIO, save_path: str) -> str:
+    """
+    Copy the upload to disk, hashing the bytes on the way through.
+    """
+    digest = hashlib.sha256()
+    with open(save_path, "wb") as buffer:
+        while True:
+            block = stream.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+            buffer.write(block)
+    return digest.hexdigest()
+
+def upload_file(file: UploadFile = File(...), db: Session = Depends(), tenant: Optional[str] = None) -> Tuple[DBFile, str]:
+    """
+    Save an upload and record it, for `tenant` if given (duplicates and same-name files are matched within
+    the tenant). Returns (db_file, status):
+    - "duplicate": identical content already exists; the new copy is discarded and the existing row returned
+    - "updated": a file with the same name but different content exists; the new version is pending on its row
+      and replaces the current one once its ingest job completes
+    - "created": a new file row
+    """
     ext = os.path.splitext(file.filename)[-1].lower()
     if ext not in SUPPORTED_EXTENSIONS:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
-    file_id = str(uuid.uuid4())
-    save_path = os.path.join(UPLOAD_DIR, f"{file_id}_{file.filename}")
-    with open(save_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    return _store_file(file.filename, file.file, db, tenant)
+
+def _store_file(filename: str, stream: BinaryIO, db: Session, tenant: Optional[str] = None) -> Tuple[DBFile, str]:
+    save_path = upload_path(filename)
+    content_hash = _save_and_hash(stream, save_path)
+    return record_file(filename, save_path, content_hash, db, tenant)
+
+def upload_path(filename: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{filename}")
+
+def record_file(filename: str, save_path: str, content_hash: str, db: Session, tenant: Optional[str] = None) -> Tuple[DBFile, str]:
+    """
+    Record a file already written to save_path (see upload_file for the returned status).
+    """
+    same_tenant = DBFile.tenant.is_(None) if tenant is None else DBFile.tenant == tenant
+    duplicate = db.query(DBFile).filter(DBFile.content_hash == content_hash, same_tenant).first()
+    if duplicate:
+        os.remove(save_path)
+        safe_log_gotcha(f"[UploadFile] {filename} is identical to file {duplicate.id}; skipped re-ingestion")
+        return duplicate, "duplicate"
+    previous = (
+        db.query(DBFile)
+        .filter(DBFile.filename == filename, same_tenant)
+        .order_by(DBFile.upload_time.desc())
+        .first()
+    )
+    if previous:
+        # The current version stays live (path, hash, chunks) until the new one is ingested
+        stale_pending = previous.pending_filepath
+        previous.pending_filepath = save_path
+        previous.pending_content_hash = content_hash
+        db.commit()
+        db.refresh(previous)
+        if stale_pending:
+            # Superseded before a job took it over
+            _remove_quietly(stale_pending)
+        return previous, "updated"
     db_file = DBFile(
-        filename=file.filename,
+        filename=filename,
         filepath=save_path,
         upload_time=datetime.utcnow(),
-        file_metadata="{}"
+        file_metadata="{}",
+        content_hash=content_hash,
+        tenant=tenant,
     )
     db.add(db_file)
     db.commit()
     db.refresh(db_file)
-    return db_file
+    return db_file, "created"
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        safe_log_gotcha(f"[UploadFile] Could not remove {path}: {e}")
+
+def _is_within(path: str, root: str) -> bool:
+    return os.path.commonpath([path, root]) == root
+
+def import_directory(directory: str, db: Session, recursive: bool = True, tenant: Optional[str] = None) -> Tuple[List[Tuple[DBFile, str]], List[str]]:
+    """
+    Copy every supported file under a server-side directory into the upload directory and record it, with the
+    same duplicate/update handling as uploads. Returns ([(db_file, status)], skipped paths).
+    The directory and every imported file must resolve (symlinks followed) to a path under IMPORT_ROOT;
+    files whose real path is outside it are skipped.
+    """
+    if not IMPORT_ROOT:
+        raise HTTPException(status_code=403, detail="Directory import is disabled; set IMPORT_ROOT to enable it")
+    root = os.path.realpath(IMPORT_ROOT)
+    directory = os.path.realpath(os.path.join(root, directory))
+    if not _is_within(directory, root):
+        raise HTTPException(status_code=403, detail="Directory is outside IMPORT_ROOT")
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=400, detail=f"Not a directory: {directory}")
+    if recursive:
+        paths = sorted(os.path.join(base, name) for base, _, names in os.walk(directory) for name in names)
+    else:
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    stored, skipped = [], []
+    for path in paths:
+        if (
+            not _is_within(os.path.realpath(path), root)
+            or not os.path.isfile(path)
+            or os.path.splitext(path)[-1].lower() not in SUPPORTED_EXTENSIONS
+        ):
+            skipped.append(path)
+            continue
+        with open(path, "rb") as stream:
+            stored.append(_store_file(os.path.basename(path), stream, db, tenant))
+    safe_log_gotcha(f"[ImportDirectory] {len(stored)} files from {directory} recorded, {len(skipped)} skipped at {datetime.now().isoformat()}")
+    return stored, skipped
 
 def list_files(db: Session = Depends()):
     files = db.query(DBFile).all()
@@ -39,12 +143,14 @@ def delete_file(file_id: int, db: Session = Depends()):
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
     errors = []
-    try:
-        os.remove(db_file.filepath)
-    except FileNotFoundError:
-        pass
-    except Exception as e:
-        errors.append(f"File delete error: {e}")
+    for path in filter(None, (db_file.filepath, db_file.pending_filepath)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            errors.append(f"File delete error: {e}")
+    db.query(Chunk).filter(Chunk.file_id == file_id).delete()
     db.delete(db_file)
     db.commit()
     if errors:
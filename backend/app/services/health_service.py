@@ -0,0 +1,132 @@
+from sqlalchemy import text
+from app.db.session import SessionLocal
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+import logging
+import os
+import threading
+import time
+
+# Seconds between DB / vector store checks, and between model pings (a network call to the provider)
+HEALTH_REFRESH_SECONDS = float(os.getenv("HEALTH_REFRESH_SECONDS", "15"))
+HEALTH_MODEL_PING_SECONDS = float(os.getenv("HEALTH_MODEL_PING_SECONDS", "300"))
+# Readiness fails when the snapshot is older than this (the refresher thread is stuck or dead)
+HEALTH_MAX_AGE_SECONDS = float(os.getenv("HEALTH_MAX_AGE_SECONDS", str(HEALTH_REFRESH_SECONDS * 4)))
+
+
+def _check(probe: Callable[[], Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        detail = probe()
+        result = {"ok": True, "msg": "OK"}
+        if detail is not None:
+            result["detail"] = detail
+    except Exception as e:
+        result = {"ok": False, "msg": str(e)}
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+class HealthMonitor:
+    """
+    Keeps a health snapshot of the DB, vector store and LLM, refreshed by a background thread.
+    Probes only read the snapshot, so they never touch the dependencies or spend model quota.
+    """
+
+    def __init__(
+        self,
+        rag_pipeline,
+        model_name: str,
+        model_ping: Callable[[], Any],
+        session_factory=SessionLocal,
+        refresh_seconds: float = HEALTH_REFRESH_SECONDS,
+        model_ping_seconds: float = HEALTH_MODEL_PING_SECONDS,
+        max_age_seconds: float = HEALTH_MAX_AGE_SECONDS,
+    ):
+        """
+        :param model_name: LLM model reported in the snapshot
+        :param model_ping: cheap call that raises if the model is unreachable (e.g. a model metadata lookup)
+        """
+        self.rag_pipeline = rag_pipeline
+        self.model_name = model_name
+        self.model_ping = model_ping
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self.model_ping_seconds = model_ping_seconds
+        self.max_age_seconds = max_age_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._llm: Optional[Dict[str, Any]] = None
+        self._llm_checked_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _check_db(self):
+        session = self.session_factory()
+        try:
+            session.execute(text("SELECT 1"))
+        finally:
+            session.close()
+
+    def _check_vectorstore(self) -> Dict[str, Any]:
+        if not getattr(self.rag_pipeline, "warmed_up", True):
+            raise RuntimeError("warming up")
+        store = self.rag_pipeline.store
+        return {"chunks": store.count(), "collection": store.collection_name, "shards": len(store.shards)}
+
+    def _check_llm(self):
+        self.model_ping()
+
+    def refresh(self, force_model_ping: bool = False, skip_model_ping: bool = False) -> Dict[str, Any]:
+        """
+        Run the checks now and publish a new snapshot. The model is pinged at most every model_ping_seconds.
+        :param skip_model_ping: publish without pinging (the LLM is reported unchecked until the first ping)
+        """
+        now = time.monotonic()
+        snapshot = {"db": _check(self._check_db), "vectorstore": _check(self._check_vectorstore)}
+        due = force_model_ping or self._llm is None or now - self._llm_checked_at >= self.model_ping_seconds
+        if due and not skip_model_ping:
+            self._llm = _check(self._check_llm)
+            self._llm["model"] = self.model_name
+            self._llm["checked_at"] = datetime.utcnow().isoformat()
+            self._llm_checked_at = now
+        snapshot["llm"] = self._llm or {"ok": False, "msg": "not checked yet", "model": self.model_name}
+        snapshot["status"] = "ok" if all(snapshot[name]["ok"] for name in ("db", "vectorstore", "llm")) else "degraded"
+        snapshot["checked_at"] = datetime.utcnow().isoformat()
+        self._snapshot, self._checked_at = snapshot, time.monotonic()
+        return snapshot
+
+    def _run(self):
+        # The model ping is a network call (and the first one imports the SDK); readiness does not depend on
+        # the LLM, so publish the local checks first
+        skip_model_ping = True
+        while not self._stop.is_set():
+            try:
+                self.refresh(skip_model_ping=skip_model_ping)
+            except Exception as e:
+                logging.error(f"Health refresh failed: {e}")
+            if skip_model_ping:
+                skip_model_ping = False
+                continue
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The latest snapshot with its age in seconds; status "starting" until the first refresh completes.
+        """
+        snapshot, checked_at = self._snapshot, self._checked_at
+        if snapshot is None:
+            return {"status": "starting", "ready": False, "age_seconds": None}
+        age = time.monotonic() - checked_at
+        # The LLM is reported but not required: retrieval, uploads and file management work without it
+        ready = snapshot["db"]["ok"] and snapshot["vectorstore"]["ok"] and age <= self.max_age_seconds
+        return {**snapshot, "ready": ready, "age_seconds": round(age, 1)}
@@ -0,0 +1,486 @@
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session, aliased
+from app.db.models import File as DBFile, IngestJob, Chunk
+from app.db.session import SessionLocal
+from app.log_utils import safe_log_gotcha
+from app.metrics import stage_timer
+from app.rag.pipeline import IngestCancelled
+from app.services.worker_sync import MULTI_WORKER, WORKER_ID, worker_alive
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from fastapi import HTTPException
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+import logging
+import os
+import threading
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Files ingested at once during a directory import; each one's parsing runs on the shared parse pool
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def job_to_dict(job: IngestJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "file_id": job.file_id,
+        "status": job.status,
+        "chunks_done": job.chunks_done,
+        "chunks_total": job.chunks_total,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+class IngestJobQueue:
+    """
+    Runs RAG ingestion in a bounded background worker pool.
+    Job state and progress live in the `ingest_jobs` table, so queued or interrupted jobs
+    are picked up again by `resume_pending()` after a restart. A job is claimed atomically by the
+    worker process that runs it, so several uvicorn workers never run the same job twice. Jobs of one
+    file run one at a time, oldest first: a job stays queued while an earlier one for its file is
+    active, and is started when that one finishes.
+    """
+
+    def __init__(
+        self,
+        rag_pipeline,
+        max_workers: int = INGEST_WORKERS,
+        import_workers: int = IMPORT_WORKERS,
+        session_factory=SessionLocal,
+        on_file_ingested: Optional[Callable[[DBFile], None]] = None,
+        on_file_removed: Optional[Callable[[int], None]] = None,
+        write_batch: Callable[[], ContextManager] = nullcontext,
+    ):
+        """
+        :param on_file_ingested: called with the File row after its ingestion completes, or after a failed
+            new version was rolled back
+        :param on_file_removed: called with the file id after a failed or cancelled upload is removed
+        :param write_batch: entered around each job; vector writes inside it are announced to other workers
+            once, when it exits (WorkerSync.deferred)
+        """
+        self.rag_pipeline = rag_pipeline
+        self.on_file_ingested = on_file_ingested
+        self.on_file_removed = on_file_removed
+        self.write_batch = write_batch
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        # Directory imports get their own wider pool so hundreds of files keep every parse worker busy
+        # without queueing interactive uploads behind them
+        self._import_executor = ThreadPoolExecutor(max_workers=max(1, import_workers), thread_name_prefix="import")
+        self._cancel_events: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, db_file: DBFile, db: Session, bulk: bool = False) -> IngestJob:
+        """
+        :param bulk: run on the import pool (directory imports) instead of the upload pool
+        """
+        job = self._new_job(db_file)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._schedule(job.id, bulk=bulk)
+        return job
+
+    def submit_batch(self, db_files: List[DBFile], db: Session) -> List[IngestJob]:
+        """
+        Queue one job per file and ingest them together in a single worker (see _run_batch).
+        """
+        jobs = [self._new_job(db_file) for db_file in db_files]
+        db.add_all(jobs)
+        db.commit()
+        for job in jobs:
+            db.refresh(job)
+        job_ids = [job.id for job in jobs]
+        with self._lock:
+            for job_id in job_ids:
+                self._cancel_events.setdefault(job_id, threading.Event())
+        if job_ids:
+            self._executor.submit(self._run_batch, job_ids)
+        return jobs
+
+    def _new_job(self, db_file: DBFile) -> IngestJob:
+        """
+        A queued job for the file; a pending new version (same-name upload) moves from the file row to the job.
+        """
+        job = IngestJob(
+            file_id=db_file.id,
+            status="queued",
+            filepath=db_file.pending_filepath,
+            content_hash=db_file.pending_content_hash,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow(),
+        )
+        db_file.pending_filepath = None
+        db_file.pending_content_hash = None
+        return job
+
+    def _schedule(self, job_id: int, bulk: bool = False):
+        with self._lock:
+            self._cancel_events.setdefault(job_id, threading.Event())
+        (self._import_executor if bulk else self._executor).submit(self._run, job_id)
+
+    def get(self, job_id: int, db: Session) -> IngestJob:
+        job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    def list_jobs(self, db: Session, status: Optional[str] = None) -> List[IngestJob]:
+        query = db.query(IngestJob)
+        if status:
+            query = query.filter(IngestJob.status == status)
+        return query.order_by(IngestJob.id.desc()).all()
+
+    def cancel(self, job_id: int, db: Session) -> IngestJob:
+        job = self.get(job_id, db)
+        if job.status not in ACTIVE_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        # Same conditional update as the claim in _start: a queued job is cancelled only if no worker took it since
+        withdrawn = db.query(IngestJob).filter(IngestJob.id == job_id, IngestJob.status == "queued").update(
+            {IngestJob.status: "cancelled", IngestJob.updated_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.commit()
+        db.refresh(job)
+        if withdrawn:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+            if job.filepath:
+                # A new version of an existing file: the current version stays
+                self._remove_path(job.filepath)
+            else:
+                self._cleanup_file(job.file_id, db)
+            db.refresh(job)
+            self._start_next(job.file_id, db)
+        elif job.status == "running":
+            # The running ingest stops after its current batch and cleans up itself
+            if event:
+                event.set()
+            if job.worker != WORKER_ID:
+                # Running in another worker process; it checks the flag after each batch
+                job.cancel_requested = True
+                db.commit()
+        else:
+            raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+        return job
+
+    def resume_pending(self) -> int:
+        """
+        Re-queue jobs left queued or running by a previous process. Running jobs restart from
+        scratch; their partial vectors are removed first and the embedding cache makes the redo cheap.
+        With several workers, jobs still running in a live worker process are left alone.
+        """
+        db = self.session_factory()
+        try:
+            jobs = db.query(IngestJob).filter(IngestJob.status.in_(ACTIVE_STATUSES)).all()
+            job_ids = []
+            for job in jobs:
+                if job.status == "running":
+                    if MULTI_WORKER and worker_alive(job.worker):
+                        continue
+                    # Take the job over first, so a worker starting at the same time does not redo the cleanup
+                    owner = IngestJob.worker.is_(None) if job.worker is None else IngestJob.worker == job.worker
+                    taken = db.query(IngestJob).filter(
+                        IngestJob.id == job.id, IngestJob.status == "running", owner
+                    ).update({IngestJob.worker: WORKER_ID}, synchronize_session=False)
+                    db.commit()
+                    if not taken:
+                        continue
+                    if job.filepath:
+                        # New version of an existing file: drop its partial chunks, keep the current version's
+                        chunk_ids = [chunk_id for (chunk_id,) in db.query(Chunk.id).filter(Chunk.file_id == job.file_id)]
+                        self._revert_vectors(job.file_id, chunk_ids)
+                    else:
+                        # Chunk records may no longer match the vectors; the rerun re-ingests the file from scratch
+                        self._delete_vectors(job.file_id)
+                        db.query(Chunk).filter(Chunk.file_id == job.file_id).delete()
+                job.status = "queued"
+                job.worker = None
+                job.chunks_done = 0
+                job.updated_at = datetime.utcnow()
+                job_ids.append(job.id)
+            db.commit()
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self._schedule(job_id)
+        if job_ids:
+            safe_log_gotcha(f"[IngestJobs] Resumed {len(job_ids)} pending ingestion jobs at {datetime.now().isoformat()}")
+        return len(job_ids)
+
+    def shutdown(self):
+        with self._lock:
+            for event in self._cancel_events.values():
+                event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._import_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self, job_id: int, db: Session):
+        """
+        Mark a queued job running. Returns (job, db_file, previous_chunk_ids), or None if it should not run.
+        """
+        # Claim: only one worker process moves the job from queued to running, and only while no earlier job
+        # for the same file is queued or running (it starts this one when it finishes, see _start_next)
+        other = aliased(IngestJob)
+        blocked = exists().where(
+            other.file_id == IngestJob.file_id,
+            other.id != IngestJob.id,
+            or_(other.status == "running", and_(other.status == "queued", other.id < IngestJob.id)),
+        )
+        claimed = db.query(IngestJob).filter(IngestJob.id == job_id, IngestJob.status == "queued", ~blocked).update(
+            {IngestJob.status: "running", IngestJob.worker: WORKER_ID, IngestJob.updated_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+        db.commit()
+        if not claimed:
+            return None
+        job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+        db_file = db.query(DBFile).filter(DBFile.id == job.file_id).first()
+        if not db_file:
+            if job.filepath:
+                self._remove_path(job.filepath)
+            self._finish(job, db, "failed", "File no longer exists")
+            return None
+        if job.filepath and not os.path.exists(job.filepath):
+            self._finish(job, db, "failed", "Uploaded version no longer exists")
+            return None
+        previous_chunk_ids = [chunk_id for (chunk_id,) in db.query(Chunk.id).filter(Chunk.file_id == db_file.id)]
+        if not previous_chunk_ids:
+            # No chunk records (new file, or vectors written before chunks were tracked): start clean
+            self._delete_vectors(db_file.id)
+        return job, db_file, previous_chunk_ids
+
+    def _progress_callback(self, job: IngestJob, db: Session, event: Optional[threading.Event] = None) -> Callable[[int, int], None]:
+        """
+        :param event: set when a cancel was requested through another worker process
+        """
+        def on_progress(done: int, total: int):
+            job.chunks_done = done
+            job.chunks_total = total
+            job.updated_at = datetime.utcnow()
+            db.commit()
+            if event is not None and MULTI_WORKER:
+                db.refresh(job, ["cancel_requested"])
+                if job.cancel_requested:
+                    event.set()
+        return on_progress
+
+    def _complete(self, job: IngestJob, db_file: DBFile, db: Session, result, previous_chunk_ids: List[str]):
+        """
+        Record the outcome of a job: chunk records on success. On failure or cancellation a new upload is removed
+        entirely, while a new version of an existing file is rolled back to the current version.
+        """
+        if isinstance(result, Exception):
+            if isinstance(result, IngestCancelled):
+                logging.info(str(result))
+            else:
+                safe_log_gotcha(f"[IngestJobs] Job {job.id} for file {db_file.id} failed: {result}")
+            if job.filepath:
+                self._rollback_version(job, db_file, db, previous_chunk_ids)
+            else:
+                self._cleanup_file(db_file.id, db)
+            if isinstance(result, IngestCancelled):
+                self._finish(job, db, "cancelled")
+            else:
+                self._finish(job, db, "failed", f"RAG ingestion failed: {result}")
+            return
+        if job.filepath:
+            self._activate_version(job, db_file, db)
+        self._record_chunks(db_file.id, result.chunks, db, self.rag_pipeline.shard_for(self._metadata(db_file)))
+        self._finish(job, db, "completed")
+        if self.on_file_ingested:
+            self.on_file_ingested(db_file)
+
+    def _run(self, job_id: int):
+        db = self.session_factory()
+        try:
+            with self.write_batch():
+                started = self._start(job_id, db)
+                if not started:
+                    return
+                job, db_file, previous_chunk_ids = started
+                event = self._cancel_events.get(job_id) or threading.Event()
+                try:
+                    with stage_timer("ingest", "total"):
+                        result = self.rag_pipeline.ingest(
+                            job.filepath or db_file.filepath,
+                            metadata=self._metadata(db_file),
+                            progress_callback=self._progress_callback(job, db, event),
+                            should_cancel=event.is_set,
+                            previous_chunk_ids=previous_chunk_ids,
+                        )
+                except Exception as e:
+                    result = e
+                self._complete(job, db_file, db, result, previous_chunk_ids)
+        except Exception as e:
+            logging.error(f"Ingest job {job_id} crashed: {e}")
+        finally:
+            try:
+                self._release_events([job_id], db)
+            finally:
+                db.close()
+
+    def _run_batch(self, job_ids: List[int]):
+        """
+        Ingest the files of several jobs through one embedding stage, so chunks of different files share
+        embedding requests. Each job completes as soon as its own file is done, and the writes so far are
+        announced to other workers then.
+        """
+        db = self.session_factory()
+        try:
+            with self.write_batch():
+                started = [s for s in (self._start(job_id, db) for job_id in job_ids) if s]
+                if not started:
+                    return
+                events = [self._cancel_events.get(job.id) or threading.Event() for job, _, _ in started]
+
+                def on_done(i: int, result):
+                    job, db_file, previous_chunk_ids = started[i]
+                    with self.write_batch():
+                        self._complete(job, db_file, db, result, previous_chunk_ids)
+
+                try:
+                    with stage_timer("ingest", "total"):
+                        self.rag_pipeline.ingest_files(
+                            [
+                                (job.filepath or db_file.filepath, self._metadata(db_file), previous_chunk_ids)
+                                for job, db_file, previous_chunk_ids in started
+                            ],
+                            progress_callbacks=[self._progress_callback(job, db, event) for (job, _, _), event in zip(started, events)],
+                            should_cancel=[event.is_set for event in events],
+                            on_done=on_done,
+                        )
+                except Exception as e:
+                    # Jobs not completed by on_done fail together
+                    for job, db_file, previous_chunk_ids in started:
+                        db.refresh(job)
+                        if job.status == "running":
+                            self._complete(job, db_file, db, e, previous_chunk_ids)
+        except Exception as e:
+            logging.error(f"Ingest batch {job_ids} crashed: {e}")
+        finally:
+            try:
+                self._release_events(job_ids, db)
+            finally:
+                db.close()
+
+    def _finish(self, job: IngestJob, db: Session, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.updated_at = datetime.utcnow()
+        db.commit()
+        self._start_next(job.file_id, db)
+
+    def _start_next(self, file_id: int, db: Session):
+        """
+        Schedule the oldest queued job of a file whose previous job just ended (it may have found the file busy).
+        """
+        waiting = (
+            db.query(IngestJob.id)
+            .filter(IngestJob.file_id == file_id, IngestJob.status == "queued")
+            .order_by(IngestJob.id)
+            .first()
+        )
+        if waiting:
+            self._schedule(waiting[0])
+
+    def _release_events(self, job_ids: List[int], db: Session):
+        """
+        Forget the cancel events of jobs that ended. A job left queued because its file was busy keeps its event
+        for the run _start_next schedules.
+        """
+        db.rollback()
+        ended = [
+            job_id
+            for (job_id,) in db.query(IngestJob.id).filter(IngestJob.id.in_(job_ids), IngestJob.status.notin_(ACTIVE_STATUSES))
+        ]
+        with self._lock:
+            for job_id in ended:
+                self._cancel_events.pop(job_id, None)
+
+    @staticmethod
+    def _metadata(db_file: DBFile) -> Dict[str, Any]:
+        """File-level metadata attached to every chunk of the file."""
+        metadata = {"file_id": db_file.id, "filename": db_file.filename}
+        if db_file.tenant:
+            metadata["tenant"] = db_file.tenant
+        return metadata
+
+    def _record_chunks(self, file_id: int, chunks, db: Session, shard: Optional[str] = None):
+        """
+        Replace the file's chunk records with the (chunk_id, chunk_hash, ordinal) list of the ingested version.
+        :param shard: vector store shard the chunks were written to
+        """
+        db.query(Chunk).filter(Chunk.file_id == file_id).delete()
+        db.add_all(
+            Chunk(id=chunk_id, file_id=file_id, chunk_hash=chunk_hash, ordinal=ordinal, shard=shard)
+            for chunk_id, chunk_hash, ordinal in chunks
+        )
+        db.commit()
+
+    def _delete_vectors(self, file_id: int):
+        try:
+            self.rag_pipeline.delete_files([file_id])
+        except Exception as e:
+            safe_log_gotcha(f"[IngestJobs] Vectorstore cleanup for file {file_id} failed: {e}")
+
+    def _revert_vectors(self, file_id: int, chunk_ids: List[str]):
+        try:
+            self.rag_pipeline.revert_file(file_id, chunk_ids)
+        except Exception as e:
+            safe_log_gotcha(f"[IngestJobs] Vectorstore rollback for file {file_id} failed: {e}")
+
+    def _remove_path(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            safe_log_gotcha(f"[IngestJobs] File cleanup for {path} failed: {e}")
+
+    def _activate_version(self, job: IngestJob, db_file: DBFile, db: Session):
+        """
+        The job's new version is ingested: the file row now points at it and the previous version is removed.
+        """
+        old_path = db_file.filepath
+        db_file.filepath = job.filepath
+        db_file.content_hash = job.content_hash
+        db_file.upload_time = datetime.utcnow()
+        db.commit()
+        if old_path != job.filepath:
+            self._remove_path(old_path)
+
+    def _rollback_version(self, job: IngestJob, db_file: DBFile, db: Session, previous_chunk_ids: List[str]):
+        """
+        A new version of an existing file failed or was cancelled: its partial chunks are deleted and the current
+        version (file row, file on disk, chunk records, vectors) stays. A file without chunk records had its vectors
+        cleared when the job started, so its current version is queued for ingestion again.
+        """
+        self._revert_vectors(db_file.id, previous_chunk_ids)
+        self._remove_path(job.filepath)
+        if not previous_chunk_ids:
+            self.submit(db_file, db)
+        # Answers cached while the partial version was searchable are dropped
+        if self.on_file_ingested:
+            self.on_file_ingested(db_file)
+
+    def _cleanup_file(self, file_id: int, db: Session):
+        """
+        A failed or cancelled upload is removed entirely: partial vectors, chunk records, DB row, and file on disk.
+        """
+        self._delete_vectors(file_id)
+        db.query(Chunk).filter(Chunk.file_id == file_id).delete()
+        db_file = db.query(DBFile).filter(DBFile.id == file_id).first()
+        if not db_file:
+            return
+        for path in filter(None, (db_file.filepath, db_file.pending_filepath)):
+            self._remove_path(path)
+        db.delete(db_file)
+        db.commit()
+        if self.on_file_removed:
+            self.on_file_removed(file_id)
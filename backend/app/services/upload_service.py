@@ -0,0 +1,247 @@
+from sqlalchemy.orm import Session
+from app.db.models import File as DBFile, UploadSession
+from app.log_utils import safe_log_gotcha
+from app.rag.pipeline import SUPPORTED_EXTENSIONS
+from app.services.file_service import UPLOAD_DIR, record_file, upload_path
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from typing import Dict, Iterator, List, Optional, Tuple
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+# Unfinished resumable uploads (and their partial files) are dropped after this long without a chunk
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+# Largest body accepted by one chunk PUT
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(64 * 1024 * 1024)))
+# Abandoned sessions are swept on session creation, at most this often
+UPLOAD_SESSION_SWEEP_SECONDS = float(os.getenv("UPLOAD_SESSION_SWEEP_SECONDS", "600"))
+PARTIAL_DIR = os.path.join(UPLOAD_DIR, ".partial")
+os.makedirs(PARTIAL_DIR, exist_ok=True)
+
+# Serialises chunk writes per session within this process (two PUTs racing for the same offset); see _session_guard
+_session_locks: Dict[str, threading.Lock] = {}
+_session_locks_guard = threading.Lock()
+_last_sweep = 0.0
+
+
+def _session_lock(session_id: str) -> threading.Lock:
+    with _session_locks_guard:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+
+@contextmanager
+def _session_guard(session_id: str) -> Iterator[None]:
+    """
+    Exclusive section for one session across threads and worker processes: the thread lock, plus a flock on the
+    session's partial file while it exists (a completed session's file has moved; its status stops writes).
+    """
+    with _session_lock(session_id):
+        try:
+            fd = os.open(os.path.join(PARTIAL_DIR, session_id), os.O_RDONLY)
+        except FileNotFoundError:
+            yield
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+def session_to_dict(session: UploadSession) -> dict:
+    return {
+        "id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.offset,
+        "status": session.status,
+        "file_id": session.file_id,
+    }
+
+
+def create_session(filename: str, size: int, sha256: Optional[str], db: Session, tenant: Optional[str] = None) -> UploadSession:
+    ext = os.path.splitext(filename)[-1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise HTTPException(status_code=422, detail=f"Unsupported file type: {ext}")
+    _sweep(db)
+    session_id = str(uuid.uuid4())
+    temp_path = os.path.join(PARTIAL_DIR, session_id)
+    open(temp_path, "wb").close()
+    session = UploadSession(
+        id=session_id,
+        filename=os.path.basename(filename),
+        size=size,
+        offset=0,
+        sha256=sha256.lower() if sha256 else None,
+        tenant=tenant,
+        temp_path=temp_path,
+        status="open",
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow(),
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def get_session(session_id: str, db: Session) -> UploadSession:
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def write_chunk(session_id: str, offset: int, data: bytes, checksum: Optional[str], db: Session) -> UploadSession:
+    """
+    Write one chunk at `offset`, which must equal the bytes received so far (409 with the current offset otherwise,
+    so a client that lost a response can resume from the right place). A chunk whose sha256 does not match
+    `checksum` is rejected without advancing the offset. The offset only advances through a conditional update
+    (offset and status unchanged), so a write racing in another worker gets a 409 as well.
+    """
+    with _session_guard(session_id):
+        session = get_session(session_id, db)
+        db.refresh(session)
+        if session.status != "open":
+            raise HTTPException(status_code=409, detail=f"Upload session is {session.status}")
+        if offset != session.offset:
+            raise HTTPException(status_code=409, detail={"msg": "Offset mismatch", "offset": session.offset})
+        if offset + len(data) > session.size:
+            raise HTTPException(status_code=400, detail=f"Chunk ends at {offset + len(data)}, past the declared size {session.size}")
+        if checksum and hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+        with open(session.temp_path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+            # Drop bytes of an earlier attempt beyond this chunk
+            f.truncate()
+        advanced = db.query(UploadSession).filter(
+            UploadSession.id == session_id, UploadSession.offset == offset, UploadSession.status == "open"
+        ).update({UploadSession.offset: offset + len(data), UploadSession.updated_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        db.refresh(session)
+        if not advanced:
+            raise HTTPException(status_code=409, detail={"msg": "Offset mismatch", "offset": session.offset})
+        return session
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_sessions(session_ids: List[str], db: Session) -> List[Tuple[DBFile, str]]:
+    """
+    Turn fully received uploads into files, with the same duplicate/update handling as direct uploads.
+    Every session is validated (complete, whole-file checksum) before any file is recorded. Sessions are
+    claimed (open -> completing) first, so a concurrent complete of the same session gets a 409.
+    """
+    session_ids = list(dict.fromkeys(session_ids))
+    claimed = []
+    try:
+        for session_id in session_ids:
+            # The guard keeps a chunk write from landing between its checks and the claim
+            with _session_guard(session_id):
+                taken = db.query(UploadSession).filter(UploadSession.id == session_id, UploadSession.status == "open").update(
+                    {UploadSession.status: "completing", UploadSession.updated_at: datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+            if not taken:
+                session = get_session(session_id, db)
+                raise HTTPException(status_code=409, detail=f"Upload session {session.id} is {session.status}")
+            claimed.append(session_id)
+        sessions = [get_session(session_id, db) for session_id in session_ids]
+        hashes = []
+        for session in sessions:
+            if session.offset != session.size:
+                raise HTTPException(status_code=409, detail={"msg": f"Upload session {session.id} is incomplete", "offset": session.offset})
+            content_hash = _file_sha256(session.temp_path)
+            if session.sha256 and content_hash != session.sha256:
+                raise HTTPException(status_code=400, detail=f"Checksum mismatch for {session.filename}")
+            hashes.append(content_hash)
+    except Exception:
+        # Nothing was recorded; the sessions can be resumed or completed again
+        if claimed:
+            db.query(UploadSession).filter(UploadSession.id.in_(claimed), UploadSession.status == "completing").update(
+                {UploadSession.status: "open"}, synchronize_session=False
+            )
+            db.commit()
+        raise
+    stored = []
+    for i, (session, content_hash) in enumerate(zip(sessions, hashes)):
+        save_path = upload_path(session.filename)
+        try:
+            os.replace(session.temp_path, save_path)
+            db_file, status = record_file(session.filename, save_path, content_hash, db, session.tenant)
+        except Exception:
+            # This and the remaining sessions go back to open (their data back in place); earlier ones stay completed
+            db.rollback()
+            if os.path.exists(save_path):
+                os.replace(save_path, session.temp_path)
+            remaining = [s.id for s in sessions[i:]]
+            db.query(UploadSession).filter(UploadSession.id.in_(remaining), UploadSession.status == "completing").update(
+                {UploadSession.status: "open"}, synchronize_session=False
+            )
+            db.commit()
+            raise
+        session.status = "completed"
+        session.file_id = db_file.id
+        session.updated_at = datetime.utcnow()
+        db.commit()
+        stored.append((db_file, status))
+    return stored
+
+
+def abort_session(session_id: str, db: Session):
+    with _session_guard(session_id):
+        session = get_session(session_id, db)
+        if session.status == "completing":
+            raise HTTPException(status_code=409, detail=f"Upload session {session.id} is completing")
+        _remove_session(session, db)
+
+
+def _remove_session(session: UploadSession, db: Session):
+    try:
+        os.remove(session.temp_path)
+    except FileNotFoundError:
+        pass
+    db.delete(session)
+    db.commit()
+    with _session_locks_guard:
+        _session_locks.pop(session.id, None)
+
+
+def expire_sessions(db: Session) -> int:
+    """
+    Remove sessions idle for longer than UPLOAD_SESSION_TTL_HOURS, and completed session records.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    stale = db.query(UploadSession).filter((UploadSession.status == "completed") | (UploadSession.updated_at < cutoff)).all()
+    for session in stale:
+        with _session_guard(session.id):
+            _remove_session(session, db)
+    if stale:
+        safe_log_gotcha(f"[UploadSessions] Removed {len(stale)} expired or completed upload sessions at {datetime.now().isoformat()}")
+    return len(stale)
+
+
+def _sweep(db: Session):
+    """
+    Expire abandoned sessions every UPLOAD_SESSION_SWEEP_SECONDS, so a long-running server does not
+    accumulate partial files.
+    """
+    global _last_sweep
+    now = time.monotonic()
+    with _session_locks_guard:
+        if now - _last_sweep < UPLOAD_SESSION_SWEEP_SECONDS:
+            return
+        _last_sweep = now
+    expire_sessions(db)
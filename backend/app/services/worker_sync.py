@@ -0,0 +1,330 @@
+from sqlalchemy.exc import IntegrityError
+from app.db.models import CorpusState
+from app.db.session import SessionLocal
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+import fcntl
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+
+"""
+Coordination between uvicorn worker processes (`--workers N`, or WEB_CONCURRENCY=N).
+
+Each worker keeps process-local state derived from the shared DB and vector store: the live file
+registry, the answer and retrieval caches, and (embedded Chroma / quantized backend) open vector
+handles. Whoever changes files or vectors bumps the one-row `corpus_state` table; every worker polls
+it and, when it moved, reloads that state (`on_change`).
+
+Embedded vector stores are not safe to write from several processes at once, so their writes go
+through `writing()`: an exclusive file lock, a catch-up reload if another worker wrote since (a
+write counter kept in the lock file), the write, then the version bump. Inside `deferred()` (an
+ingest job) the bump waits until the block ends, so other workers reload once per job instead of
+once per upserted batch. With a Chroma server (CHROMA_HOST) writes need no lock and only publish.
+
+Every worker also holds a lock on `workers.lock` for its lifetime: shared with the sync on,
+exclusive with it off. A single-worker process therefore refuses to start next to another process
+serving the same data directory, instead of silently serving stale state.
+"""
+
+# uvicorn's default for --workers; more than one worker enables the sync
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+def _uvicorn_workers() -> int:
+    """
+    Worker count of the uvicorn supervisor that spawned this process: `--workers N` (or UVICORN_WORKERS) on the
+    parent's command line, read from /proc. 1 when not spawned by multiprocessing (plain `uvicorn`), under
+    `--reload` (one app process), or when the parent's command line cannot be read.
+    """
+    if multiprocessing.parent_process() is None:
+        return 1
+    try:
+        with open(f"/proc/{os.getppid()}/cmdline", "rb") as f:
+            args = [a.decode(errors="replace") for a in f.read().split(b"\0") if a]
+    except OSError:
+        return 1
+    if not any(os.path.basename(a).startswith("uvicorn") for a in args[:3]) or "--reload" in args:
+        return 1
+    workers = os.getenv("UVICORN_WORKERS", "1")
+    for i, arg in enumerate(args):
+        if arg == "--workers" and i + 1 < len(args):
+            workers = args[i + 1]
+        elif arg.startswith("--workers="):
+            workers = arg.split("=", 1)[1]
+    return int(workers) if workers.isdigit() else 1
+
+
+# Explicit on/off; by default on with WEB_CONCURRENCY > 1 or under `uvicorn --workers N` with N > 1
+# (which does not set WEB_CONCURRENCY). Other process managers (gunicorn) need MULTI_WORKER=true.
+MULTI_WORKER = os.getenv("MULTI_WORKER", str(WEB_CONCURRENCY > 1 or _uvicorn_workers() > 1)).lower() in ("1", "true", "yes")
+# Seconds between polls of the corpus version (the longest another worker can serve stale state)
+WORKER_SYNC_INTERVAL_SECONDS = float(os.getenv("WORKER_SYNC_INTERVAL_SECONDS", "1"))
+# This process, as recorded on the ingest jobs it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def worker_alive(worker: Optional[str]) -> bool:
+    """
+    Whether the worker process that claimed a job may still be running it. Workers on other hosts are
+    assumed alive; jobs without a worker were claimed before jobs recorded one.
+    """
+    if not worker:
+        return False
+    if worker == WORKER_ID:
+        return True
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+class WorkerSync:
+    def __init__(
+        self,
+        on_change: Callable[[], None],
+        lock_path: str,
+        session_factory=SessionLocal,
+        interval_seconds: float = WORKER_SYNC_INTERVAL_SECONDS,
+        enabled: bool = MULTI_WORKER,
+        exclusive_writes: bool = True,
+    ):
+        """
+        :param on_change: reloads this worker's derived state after another worker changed the corpus
+        :param lock_path: file locked around embedded vector store writes
+        :param enabled: False (single worker) makes publish/poll no-ops and writing() a plain section
+        :param exclusive_writes: serialize writes across workers (embedded stores); False for a shared server
+        """
+        self.on_change = on_change
+        self.lock_path = lock_path
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.enabled = enabled
+        self.exclusive_writes = exclusive_writes
+        self._seen: Optional[int] = None
+        self._state_lock = threading.Lock()
+        # Held from reading a new version until on_change is done, so a writer never skips the reload
+        self._poll_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        # Writes counted in the lock file as of this worker's last write or catch-up
+        self._write_count: Optional[int] = None
+        # Per thread: depth of deferred() blocks and whether writes inside them are unpublished
+        self._local = threading.local()
+        self._workers_handle = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.published = 0
+        self.reloads = 0
+        self.last_reload_at: Optional[str] = None
+
+    def _version(self) -> int:
+        db = self.session_factory()
+        try:
+            state = db.get(CorpusState, 1)
+            if state is None:
+                try:
+                    db.add(CorpusState(id=1, version=0, updated_at=datetime.utcnow()))
+                    db.commit()
+                    return 0
+                except IntegrityError:
+                    # Created by another worker at the same time
+                    db.rollback()
+                    state = db.get(CorpusState, 1)
+            return state.version
+        finally:
+            db.close()
+
+    def publish(self):
+        """
+        Tell the other workers the corpus changed. Call after the change is committed.
+        """
+        if not self.enabled:
+            return
+        db = self.session_factory()
+        try:
+            bumped = db.query(CorpusState).filter(CorpusState.id == 1).update(
+                {CorpusState.version: CorpusState.version + 1, CorpusState.updated_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+            if not bumped:
+                db.add(CorpusState(id=1, version=1, updated_at=datetime.utcnow()))
+            db.commit()
+            version = db.get(CorpusState, 1).version
+        finally:
+            db.close()
+        with self._state_lock:
+            self.published += 1
+            # Only our own bump: skipping over another worker's change would miss its reload
+            if self._seen is not None and version == self._seen + 1:
+                self._seen = version
+
+    def poll(self) -> bool:
+        """
+        Reload this worker's state if another worker changed the corpus since the last poll.
+        """
+        if not self.enabled:
+            return False
+        with self._poll_lock:
+            version = self._version()
+            with self._state_lock:
+                changed = self._seen is not None and version != self._seen
+                self._seen = version
+            if changed:
+                self.on_change()
+                self.reloads += 1
+                self.last_reload_at = datetime.utcnow().isoformat()
+                logging.info(f"Reloaded shared state at corpus version {version}")
+        return changed
+
+    def _written(self):
+        """Publish a finished write, or leave it to the enclosing deferred() block."""
+        if getattr(self._local, "deferred", 0):
+            self._local.pending = True
+        else:
+            self.publish()
+
+    @contextmanager
+    def deferred(self):
+        """
+        Publish the writes made by this thread inside the block once, when the block exits (nested blocks
+        publish at their own exit). Used around an ingest job, whose upserts are not searched by other
+        workers until the job has committed.
+        """
+        self._local.deferred = getattr(self._local, "deferred", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.deferred -= 1
+            if getattr(self._local, "pending", False):
+                self._local.pending = False
+                self.publish()
+
+    def _read_write_count(self, fd: int) -> int:
+        value = os.pread(fd, 32, 0).strip()
+        return int(value) if value else 0
+
+    def _catch_up(self, fd: int):
+        """
+        Reload if another worker wrote since this worker's last write. The write counter covers writes whose
+        publish is still deferred, which the corpus version does not show yet.
+        """
+        count = self._read_write_count(fd)
+        if self._write_count is not None and count != self._write_count:
+            with self._poll_lock:
+                self.on_change()
+                self.reloads += 1
+                self.last_reload_at = datetime.utcnow().isoformat()
+            logging.info(f"Reloaded shared state before a write (write count {count})")
+        self._write_count = count
+
+    @contextmanager
+    def writing(self):
+        """
+        Exclusive section across worker processes for a vector store write: catch up with other workers'
+        writes, write, count the write and publish (or defer it) before the lock is released.
+        Re-entrant within a thread. Without exclusive_writes only the publish remains.
+        """
+        if not self.enabled:
+            yield
+            return
+        if not self.exclusive_writes:
+            try:
+                yield
+            finally:
+                self._written()
+            return
+        with self._write_lock:
+            self._write_depth += 1
+            try:
+                if self._write_depth > 1:
+                    yield
+                    return
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    try:
+                        self._catch_up(fd)
+                        yield
+                    finally:
+                        try:
+                            self._write_count += 1
+                            os.pwrite(fd, str(self._write_count).encode().ljust(20), 0)
+                            self._written()
+                        finally:
+                            fcntl.flock(fd, fcntl.LOCK_UN)
+                finally:
+                    os.close(fd)
+            finally:
+                self._write_depth -= 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Worker sync poll failed: {e}")
+
+    def _claim_data_dir(self):
+        """
+        Lock `workers.lock` for the life of the process: shared when the sync is on, exclusive when it is off.
+        Raises RuntimeError if that conflicts with another running process.
+        """
+        if self._workers_handle is not None:
+            return
+        handle = open(os.path.join(os.path.dirname(self.lock_path) or ".", "workers.lock"), "a")
+        try:
+            fcntl.flock(handle, (fcntl.LOCK_SH if self.enabled else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            if self.enabled:
+                raise RuntimeError("A process started with MULTI_WORKER=false is serving this data directory; stop it first")
+            raise RuntimeError(
+                "Another worker process is serving this data directory; start every worker with MULTI_WORKER=true "
+                "(set automatically for `uvicorn --workers N` and WEB_CONCURRENCY > 1)"
+            )
+        self._workers_handle = handle
+
+    def start(self):
+        self._claim_data_dir()
+        if not self.enabled:
+            return
+        with self._state_lock:
+            if self._seen is None:
+                self._seen = self._version()
+        if self.exclusive_writes and self._write_count is None:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                self._write_count = self._read_write_count(fd)
+            finally:
+                os.close(fd)
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="worker-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._workers_handle is not None:
+            self._workers_handle.close()
+            self._workers_handle = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "exclusive_writes": self.exclusive_writes,
+            "worker": WORKER_ID,
+            "corpus_version": self._seen,
+            "published": self.published,
+            "reloads": self.reloads,
+            "last_reload_at": self.last_reload_at,
+        }
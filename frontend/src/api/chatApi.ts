@@ -38,3 +38,47 @@ export const sendChat = async (
     throw error?.response?.data?.detail || 'Chat request failed';
   }
 };
+
+export interface ChatStreamHandlers {
+  onSources?: (sources: string[]) => void;
+  onToken: (token: string) => void;
+}
+
+/**
+ * Stream a chat answer from /api/chat/stream (NDJSON: sources, token..., done | error).
+ * Resolves once the stream is done; rejects with the server's error detail.
+ */
+export const streamChat = async (opts: ChatOptions, handlers: ChatStreamHandlers) => {
+  const response = await fetch('/api/chat/stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      question: opts.question,
+      file_id: opts.fileId,
+      keywords: opts.keywords,
+      metadata_filter: opts.metadataFilter,
+      k: opts.k,
+    }),
+  });
+  if (!response.ok || !response.body) {
+    const body = await response.json().catch(() => null);
+    throw body?.detail || 'Chat request failed';
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop() ?? '';
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const event = JSON.parse(line);
+      if (event.type === 'sources') handlers.onSources?.(event.sources);
+      else if (event.type === 'token') handlers.onToken(event.content);
+      else if (event.type === 'error') throw event.detail || 'Chat request failed';
+    }
+  }
+};
@@ -13,6 +13,19 @@ export const uploadFile = async (file: File) => {
   }
 };
 
+export const uploadFiles = async (files: File[]) => {
+  try {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+    const response = await axios.post('/api/upload/batch', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+    return response.data;
+  } catch (error: any) {
+    throw error?.response?.data?.detail || 'File upload failed';
+  }
+};
+
 export const fetchFiles = async () => {
   try {
     const response = await axios.get('/api/files');
@@ -30,3 +43,12 @@ export const deleteFile = async (fileId: number) => {
     throw error?.response?.data?.detail || 'File deletion failed';
   }
 };
+
+export const fetchJob = async (jobId: number) => {
+  try {
+    const response = await axios.get(`/api/jobs/${jobId}`);
+    return response.data;
+  } catch (error: any) {
+    throw error?.response?.data?.detail || 'Fetching ingestion job failed';
+  }
+};
@@ -1,13 +1,27 @@
 import { useCallback, useRef } from 'react';
 import { useFilesStore } from 'state/filesStore';
-import { uploadFile } from 'api/filesApi';
+import { uploadFiles, fetchJob } from 'api/filesApi';
 import { useToast } from '@chakra-ui/react';
 
 const SUPPORTED_EXTENSIONS = ['pdf', 'docx', 'txt', 'csv', 'xlsx'];
 const MAX_SIZE_MB = 20;
+const JOB_POLL_INTERVAL_MS = 1500;
+
+// Ingestion runs in the background; poll the job until it reaches a terminal state.
+async function waitForIngestion(jobId: number) {
+  for (;;) {
+    const job = await fetchJob(jobId);
+    if (job.status === 'completed') return job;
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw job.error || `Ingestion ${job.status}`;
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+}
 
 export function useFileUpload() {
   const addFile = useFilesStore((state) => state.addFile);
+  const removeFile = useFilesStore((state) => state.removeFile);
   const setLoading = useFilesStore((state) => state.setLoading);
   const setError = useFilesStore((state) => state.setError);
   const loading = useFilesStore((state) => state.loading);
@@ -15,6 +29,7 @@ export function useFileUpload() {
   const uploading = useRef(false);
 
   const onDrop = useCallback(async (acceptedFiles: File[]) => {
+    const valid: File[] = [];
     for (const file of acceptedFiles) {
       if (!file.name) {
         setError('File name is missing.');
@@ -29,21 +44,40 @@ export function useFileUpload() {
         toast({ title: 'File too large', status: 'error', duration: 4000 });
         continue;
       }
-      setLoading(true);
-      uploading.current = true;
-      try {
-        const uploaded = await uploadFile(file);
-        addFile(uploaded);
-        toast({ title: 'File uploaded', status: 'success', duration: 2000 });
-      } catch (error: any) {
-        setError(error?.toString() || 'Upload failed');
-        toast({ title: 'Upload failed', description: error?.toString(), status: 'error', duration: 4000 });
-      } finally {
-        setLoading(false);
-        uploading.current = false;
-      }
+      valid.push(file);
+    }
+    if (valid.length === 0) return;
+    setLoading(true);
+    uploading.current = true;
+    try {
+      // One request for the whole drop: the backend ingests the files together
+      const uploadedFiles = await uploadFiles(valid);
+      uploadedFiles.forEach(addFile);
+      await Promise.all(uploadedFiles.map(async (uploaded: any) => {
+        try {
+          if (uploaded.job_id) {
+            try {
+              await waitForIngestion(uploaded.job_id);
+            } catch (error) {
+              removeFile(uploaded.id);
+              throw error;
+            }
+          }
+          const title = uploaded.status === 'duplicate' ? 'File already uploaded' : 'File uploaded';
+          toast({ title, description: uploaded.filename, status: 'success', duration: 2000 });
+        } catch (error: any) {
+          setError(error?.toString() || 'Upload failed');
+          toast({ title: 'Upload failed', description: error?.toString(), status: 'error', duration: 4000 });
+        }
+      }));
+    } catch (error: any) {
+      setError(error?.toString() || 'Upload failed');
+      toast({ title: 'Upload failed', description: error?.toString(), status: 'error', duration: 4000 });
+    } finally {
+      setLoading(false);
+      uploading.current = false;
     }
-  }, [addFile, setLoading, setError, toast]);
+  }, [addFile, removeFile, setLoading, setError, toast]);
 
   return { onDrop, loading, uploading };
 }
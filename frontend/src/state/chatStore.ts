@@ -24,7 +24,7 @@ interface ChatState {
   ) => Promise<void>;
 }
 
-import { sendChat as sendChatApi } from '../api/chatApi';
+import { streamChat } from '../api/chatApi';
 
 export const useChatStore = create<ChatState>((set) => ({
   messages: [],
@@ -49,16 +49,26 @@ export const useChatStore = create<ChatState>((set) => ({
     set({ loading: true, error: null });
     try {
       set((state) => ({ messages: [...state.messages, { sender: 'user', text: question }] }));
-      // Use options-object-based API only
-      const response = await sendChatApi({
-        question,
-        ...options,
-      });
-      set((state) => ({
-        messages: [...state.messages, { sender: 'ai', text: response.answer, sources: response.sources }],
-        loading: false,
-        error: null,
-      }));
+      // Stream the answer into a placeholder AI message as tokens arrive
+      let aiIndex = -1;
+      const updateAi = (update: (msg: ChatMessage) => ChatMessage) =>
+        set((state) => {
+          const messages = [...state.messages];
+          if (aiIndex === -1) {
+            aiIndex = messages.length;
+            messages.push({ sender: 'ai', text: '' });
+          }
+          messages[aiIndex] = update(messages[aiIndex]);
+          return { messages, loading: false };
+        });
+      await streamChat(
+        { question, ...options },
+        {
+          onSources: (sources) => updateAi((msg) => ({ ...msg, sources })),
+          onToken: (token) => updateAi((msg) => ({ ...msg, text: msg.text + token })),
+        }
+      );
+      set({ loading: false, error: null });
     } catch (err: any) {
       set({ loading: false, error: typeof err === 'string' ? err : 'Chat failed' });
     }
@@ -24,7 +24,8 @@ export const useFilesStore = create<FilesState>((set) => ({
   loading: false,
   error: null,
   setFiles: (files) => set({ files }),
-  addFile: (file) => set((state) => ({ files: [...state.files, file] })),
+  // A re-upload returns the existing file id; replace that entry instead of listing it twice
+  addFile: (file) => set((state) => ({ files: [...state.files.filter((f) => f.id !== file.id), file] })),
   // Only remove from local state after backend confirms deletion
 removeFile: (id) => set((state) => ({ files: state.files.filter((f) => f.id !== id) })),
   setLoading: (loading) => set({ loading }),